@@ -0,0 +1,183 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from cart.cart import CartServices
+from cart.models import Cart, ProductInCart
+from cart.views import UpdateCartView
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from products.models import Category, Product
+from settings.models import Discount, DiscountOnCart, DiscountOnSet, ProductInDiscountOnSet
+from settings.services import DiscountIndex
+from shops.models import Offer, Shop
+from users.models import User
+
+# количество позиций в синтетических корзинах
+CART_SIZES = (1, 10, 50, 200)
+# количество действующих скидок каждого вида
+DISCOUNT_COUNTS = (0, 10, 100, 500)
+# количество магазинов, предлагающих каждый товар
+SHOPS_COUNT = 3
+
+
+class CartBenchmark:
+    """
+    Замер времени выполнения и количества SQL-запросов основных методов корзины
+    на синтетических корзинах разного размера при разном количестве действующих скидок.
+    Создает данные в текущей базе данных, поэтому запускается на тестовой базе (см. команду cart_benchmark)
+    """
+
+    def __init__(self, cart_sizes: Iterable[int] = CART_SIZES, discount_counts: Iterable[int] = DISCOUNT_COUNTS,
+                 repeat: int = 5):
+        """
+        :param cart_sizes: количество позиций в корзинах
+        :param discount_counts: количество действующих скидок каждого вида
+        :param repeat: количество повторов каждого замера
+        """
+        self.cart_sizes = sorted(cart_sizes)
+        self.discount_counts = sorted(discount_counts)
+        self.repeat = repeat
+        self.factory = RequestFactory()
+        self.user = None
+        self.products = []
+        self.offers = []
+
+    def setup_catalog(self) -> None:
+        """ Создание пользователя, магазинов, товаров и предложений для самой большой корзины """
+
+        self.user = User.objects.create(username='benchmark', email='benchmark@benchmark.ru')
+        category = Category.objects.create(name='benchmark', description='benchmark')
+        shops = Shop.objects.bulk_create(Shop(name=f'benchmark {number}') for number in range(SHOPS_COUNT))
+        self.products = Product.objects.bulk_create(
+            Product(name=f'benchmark {number}', category=category) for number in range(max(self.cart_sizes)))
+        offers = Offer.objects.bulk_create(
+            Offer(shop=shop, product=product, price=Decimal(100 + number), in_stock=1000)
+            for number, product in enumerate(self.products) for shop in shops
+        )
+        # в корзину попадает первое предложение каждого товара
+        self.offers = offers[::SHOPS_COUNT]
+
+    def setup_discounts(self, count: int) -> None:
+        """
+        Замена всех скидок синтетическими: count скидок каждого вида
+        :param count: количество скидок каждого вида
+        """
+        ProductInDiscountOnSet.objects.all().delete()
+        DiscountOnSet.objects.all().delete()
+        DiscountOnCart.objects.all().delete()
+        Discount.objects.all().delete()
+
+        date_now = datetime.now(tz=timezone.utc)
+        dates = {'start_date': date_now - timedelta(days=1), 'end_date': date_now + timedelta(days=30)}
+        discounts = Discount.objects.bulk_create(
+            Discount(name=f'benchmark {number}', value=number % 90 + 1, value_type='percentage', **dates)
+            for number in range(count))
+        Discount.products.through.objects.bulk_create(
+            Discount.products.through(discount=discount, product=self.products[number % len(self.products)])
+            for number, discount in enumerate(discounts))
+        DiscountOnCart.objects.bulk_create(
+            DiscountOnCart(name=f'benchmark {number}', value=number % 90 + 1, value_type='percentage',
+                           quantity_at=1, quantity_to=1000, cart_total_price_at=number * 100, **dates)
+            for number in range(count))
+        discounts_on_set = DiscountOnSet.objects.bulk_create(
+            DiscountOnSet(name=f'benchmark {number}', value=number % 90 + 1, value_type='percentage', **dates)
+            for number in range(count))
+        ProductInDiscountOnSet.objects.bulk_create(
+            ProductInDiscountOnSet(discount=discount, product=self.products[(number + shift) % len(self.products)])
+            for number, discount in enumerate(discounts_on_set) for shift in range(2))
+        DiscountIndex.invalidate()
+        # индекс скидок строится один раз после изменения скидок и в замеры не входит
+        DiscountIndex.get()
+
+    def setup_cart(self, size: int) -> None:
+        """
+        Заполнение корзины пользователя первыми size предложениями
+        :param size: количество позиций в корзине
+        """
+        Cart.objects.filter(user=self.user).delete()
+        cart = Cart.objects.create(user=self.user)
+        ProductInCart.objects.bulk_create(
+            ProductInCart(cart=cart, offer=offer, quantity=1) for offer in self.offers[:size])
+
+    def get_request(self, method: str = 'get', data: Dict = None):
+        """
+        Создание запроса авторизованного пользователя
+        :param method: метод запроса
+        :param data: данные запроса
+        :return: HttpRequest
+        """
+        request = getattr(self.factory, method)('/cart/', data or {})
+        request.user = self.user
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        return request
+
+    def get_cart(self) -> CartServices:
+        """
+        Создание корзины со сброшенными кэшами, чтобы замерялся полный расчет
+        :return: CartServices
+        """
+        cart = CartServices(self.get_request())
+        cart.invalidate()
+        return cart
+
+    def measure(self, prepare: Callable, action: Callable) -> Dict:
+        """
+        Замер времени выполнения и количества запросов действия
+        :param prepare: функция подготовки, результат которой передается в действие; в замер не входит
+        :param action: замеряемое действие
+        :return: словарь с медианным и минимальным временем в миллисекундах и количеством запросов
+        """
+        timings = []
+        queries = 0
+        for _ in range(self.repeat):
+            argument = prepare()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                action(argument)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(context.captured_queries)
+        return {
+            'wall_time_ms': round(statistics.median(timings), 3),
+            'min_wall_time_ms': round(min(timings), 3),
+            'queries': queries,
+        }
+
+    def get_cases(self) -> Dict[str, Tuple[Callable, Callable]]:
+        """ Замеряемые действия: название -> (функция подготовки, замеряемая функция) """
+
+        update_data = {'product_id': self.offers[0].id, 'quantity': 1, 'action': 'update'}
+        return {
+            'get_final_price_with_discount': (self.get_cart, lambda cart: cart.get_final_price_with_discount()),
+            'get_total_price': (self.get_cart, lambda cart: cart.get_total_price()),
+            '__len__': (self.get_cart, len),
+            'get_shops_with_products': (self.get_cart, lambda cart: cart.get_shops_with_products()),
+            'UpdateCartView.post': (lambda: self.get_request('post', update_data), UpdateCartView.as_view()),
+        }
+
+    def run(self) -> List[Dict]:
+        """
+        Запуск всех замеров
+        :return: список результатов
+        """
+        self.setup_catalog()
+        cases = self.get_cases()
+        results = []
+        for discount_count in self.discount_counts:
+            self.setup_discounts(discount_count)
+            for size in self.cart_sizes:
+                self.setup_cart(size)
+                for name, (prepare, action) in cases.items():
+                    results.append({
+                        'case': name,
+                        'cart_size': size,
+                        'discounts': discount_count,
+                        **self.measure(prepare, action),
+                    })
+        return results
@@ -1,111 +1,145 @@
-from collections import defaultdict
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict
+from functools import wraps
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 from cart.models import Cart, ProductInCart
+from cart.pricing import (CartPricing, CartPricingEngine, CartSnapshot, get_min_price_with_discounts,
+                          get_total_price_with_discount_on_cart, get_total_price_with_discount_on_set)
+from cart.storage import get_cart_storage
 from django.conf import settings
-from django.contrib import messages
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import transaction
-from django.db.models import Sum, F, QuerySet
+from django.db import connection, transaction
+from django.db.models import F, QuerySet
 from django.utils import timezone
-from products.models import Product
-from settings.models import Discount, DiscountOnCart, DiscountOnSet
+from settings.models import DiscountOnCart, DiscountOnSet
 from settings.models import SiteSettings
-from shops.models import Offer, Shop
+from settings.services import DiscountIndex
+from shops.models import Offer
+from shops.services import ShopOffer, get_offers_by_products
 from users.models import User
 
 
+def memoize_until_change(method):
+    """
+    Декоратор кэширует результат метода корзины до её следующего изменения
+    """
+
+    @wraps(method)
+    def wrapper(self):
+        if method.__name__ not in self._memo:
+            self._memo[method.__name__] = method(self)
+        return self._memo[method.__name__]
+
+    return wrapper
+
+
+def get_cart_version_counter_key(cart_id: int) -> str:
+    """
+    Формирование ключа кэша счетчика версий корзины. В ключ входит имя базы данных, чтобы тестовая
+    и рабочая базы, использующие общий файловый кэш, не получали версии друг друга
+    :param cart_id: id корзины
+    :return: ключ кэша
+    """
+    return f'cart_version:{cart_id}:{connection.settings_dict["NAME"]}'
+
+
+class CartAvailabilityWarning(NamedTuple):
+    """ Позиция корзины, удаленная из-за отсутствия товара на складе магазина """
+
+    offer_id: int
+    product_name: str
+    shop_name: str
+
+    def __str__(self):
+        return f'{self.product_name} закончился на складе магазина {self.shop_name}'
+
+
 class CartServices:
     """
     Класс корзины пользователя
     """
 
     def __init__(self, request):
+        self._memo = {}
         self.use_db = False
         self.cart = None
         self.user = request.user
         self.session = request.session
         self.qs = None
         self.date_now = datetime.now(tz=timezone.utc)
-        cart = self.session.get(settings.CART_SESSION_ID)
+        # хранилище корзины анонимного пользователя, при входе пользователя корзина переносится в БД
+        self.storage = get_cart_storage(self.session)
+        cart = self.storage.load()
         if self.user.is_authenticated:
             self.use_db = True
             if cart:
-                self.save_in_db(cart, request.user)
+                self.cart = self.save_in_db(cart, request.user)
                 self.clear(True)
-            try:
-                cart = Cart.objects.get(user=self.user, is_active=True)
-            except ObjectDoesNotExist:
-                cart = Cart.objects.create(user=self.user)
+                cart = self.cart
+            else:
+                try:
+                    cart = Cart.objects.get(user=self.user, is_active=True)
+                except ObjectDoesNotExist:
+                    cart = Cart.objects.create(user=self.user)
             self.qs = ProductInCart.objects.filter(cart=cart)
-        else:
-            # сохранить пустую корзину в сеансе
-            if not cart:
-                cart = self.session[settings.CART_SESSION_ID] = {}
         self.cart = cart
 
-    def save_in_db(self, cart: dict, user: User) -> None:
+    def save_in_db(self, cart: dict, user: User) -> Cart:
         """
-        Перенос корзины из сессии в БД
-        :param cart: корзина из сессии
+        Перенос корзины анонимного пользователя в БД. Позиции корзины и предложения загружаются одним запросом каждые,
+        количество товара ограничивается остатком на складе, изменения сохраняются в одной транзакции
+        :param cart: корзина анонимного пользователя
         :param user: пользователь
-        :return: None
-        """
-        try:
-            cart_ = Cart.objects.get(user=user, is_active=True)
-            cart_exists = True
-        except ObjectDoesNotExist:
-            cart_exists = False
-        for key, value in cart.items():
-            if cart_exists:
-                try:
-                    product = ProductInCart.objects.filter(cart=cart_).get(offer=key)
-                    product.quantity += cart[key]['quantity']
-                    product.save()
-                except ObjectDoesNotExist:
-                    ProductInCart.objects.create(
-                        offer=Offer.objects.get(pk=key),
-                        cart=Cart.objects.filter(user=user, is_active=True).first(),
-                        quantity=cart[key]['quantity']
-                    )
-            else:
-                offer = Offer.objects.get(id=key)
-                with transaction.atomic():
-                    cart_ = Cart.objects.create(user=user)
-                    ProductInCart.objects.create(
-                        offer=offer,
-                        cart=cart_,
-                        quantity=value['quantity'],
-                    )
-
-        self.session.pop(settings.CART_SESSION_ID, None)
-
-    def get_shops_with_products(self) -> Dict:
-        """
-        Получения словаря магазинов, которые предлагают необходимый товар.
+        :return: корзина пользователя
+        """
+        offers = Offer.objects.in_bulk([int(offer_id) for offer_id in cart])
+        with transaction.atomic():
+            cart_ = Cart.objects.filter(user=user, is_active=True).first() or Cart.objects.create(user=user)
+            products_in_cart = {
+                product_in_cart.offer_id: product_in_cart
+                for product_in_cart in ProductInCart.objects.select_for_update().filter(cart=cart_)
+            }
+            products_to_update = []
+            products_to_create = []
+            for offer_id, value in cart.items():
+                offer = offers.get(int(offer_id))
+                if offer is None:
+                    continue
+                product_in_cart = products_in_cart.get(offer.id)
+                if product_in_cart:
+                    # количество уже лежащего в корзине товара не уменьшается, даже если остаток меньше
+                    quantity = min(product_in_cart.quantity + value['quantity'],
+                                   max(offer.available, product_in_cart.quantity))
+                    if quantity != product_in_cart.quantity:
+                        product_in_cart.quantity = quantity
+                        products_to_update.append(product_in_cart)
+                else:
+                    quantity = min(value['quantity'], offer.available)
+                    if quantity > 0:
+                        products_to_create.append(ProductInCart(offer=offer, cart=cart_, quantity=quantity))
+            if products_to_update:
+                ProductInCart.objects.bulk_update(products_to_update, ['quantity'])
+            if products_to_create:
+                ProductInCart.objects.bulk_create(products_to_create)
+        return cart_
+
+    @memoize_until_change
+    def get_shops_with_products(self) -> Dict[int, List[ShopOffer]]:
+        """
+        Получения словаря магазинов, которые предлагают необходимый товар, с ценой и остатком.
+        В словарь попадают магазины с товаром в наличии и магазин, предложение которого уже в корзине
         :return: Dict
         """
-        product_ids = self.get_products_id()
-        if self.use_db:
-            shops_by_product = defaultdict(set)
-            qs = Offer.objects.filter(product_id__in=product_ids, in_stock__gte=1).select_related('shop')
-            for product_id in product_ids:
-                for offer in qs.filter(product_id=product_id):
-                    shops_by_product[product_id].add(offer.shop)
-        else:
-            qs = Offer.objects.filter(product_id__in=product_ids, in_stock__gte=1).select_related('shop')
-            shops_by_product = defaultdict(set)
-            for product_id in product_ids:
-                for offer in qs.filter(product_id=product_id):
-                    if str(offer.id) in self.cart:
-                        shops_by_product[product_id].add(offer.shop)
-
-                for shop in Shop.objects.filter(offers__product_id=product_id):
-                    if shop not in shops_by_product[product_id]:
-                        shops_by_product[product_id].add(shop)
-        return shops_by_product
+        lines = self.get_pricing().lines
+        cart_offer_ids = {line.offer_id for line in lines}
+        offers_by_product = get_offers_by_products(line.product_id for line in lines)
+        return {
+            product_id: [shop_offer for shop_offer in shop_offers
+                         if shop_offer.available >= 1 or shop_offer.offer_id in cart_offer_ids]
+            for product_id, shop_offers in offers_by_product.items()
+        }
 
     def update_shops_with_products(self, offer_id, shop_id) -> None:
         """
@@ -156,6 +190,7 @@ class CartServices:
         self.session['payment_data'] = form.cleaned_data
         self.save()
 
+    @memoize_until_change
     def get_products_id(self) -> QuerySet:
         """
         Получает id всех продуктов в корзине
@@ -194,51 +229,25 @@ class CartServices:
         :param product_id: id продукта
         :return: Dict
         """
-        if self.use_db:
-            product = ProductInCart.objects.filter(cart=self.cart, offer=product_id).first()
-            if product:
-                quantity = product.quantity
-                price = product.offer.price
-                total_price = quantity * price
-                discounts = Discount.objects.filter(end_date__gte=self.date_now, products__id=product.offer.product.id)
-                if discounts:
-                    disc_price = self.get_min_price_on_product_with_discount(price=product.offer.price,
-                                                                             discounts=discounts)
-                else:
-                    disc_price = price
-            else:
-                quantity = 0
-                price = 0
-                disc_price = 0
-                total_price = 0
-        else:
-            if product_id in self.cart:
-                quantity = self.cart[product_id]['quantity']
-                price = Decimal(self.cart[product_id]['price'])
-                disc_price = Decimal(self.cart[str(product_id)]['disc_price'])
-                total_price = quantity * price
-            else:
-                quantity = 0
-                price = 0
-                disc_price = 0
-                total_price = 0
-
+        line = self.get_pricing().get_line(product_id)
+        if not line:
+            return {'quantity': 0, 'price': 0, 'disc_price': 0, 'total_price': 0}
         return {
-            'quantity': quantity,
-            'price': price,
-            'disc_price': disc_price.quantize(Decimal('1.00')) if disc_price > 0 else 1,
-            'total_price': total_price
+            'quantity': line.quantity,
+            'price': line.price,
+            'disc_price': line.disc_price,
+            'total_price': line.total_price
         }
 
-    def update(self, offer: Offer, quantity: int = 1, update_quantity: bool = False) -> None:
+    def update(self, offer: Offer, quantity: int = 1, update_quantity: bool = False) -> int:
         """
         Добавляет товар в корзину и обновляет его количество
         :param offer: товар
         :param quantity: количество
         :param update_quantity: флаг, указывающий, нужно ли обновить товар (False) либо добавить его (True)
-        :return: None
+        :return: количество товара в корзине после изменения
         """
-        if offer.in_stock >= quantity:
+        if offer.available >= quantity:
             if self.use_db:
                 if self.qs.filter(offer=offer).exists():
                     with transaction.atomic():
@@ -255,35 +264,58 @@ class CartServices:
                 else:
                     product_in_cart.quantity += quantity
                 product_in_cart.save()
+                self.invalidate()
+                return product_in_cart.quantity
             else:
                 product_id = str(offer.pk)
-                discounts = Discount.objects.filter(end_date__gte=self.date_now, products__id=offer.product.id)
-                if discounts:
-                    disc_price = self.get_min_price_on_product_with_discount(price=offer.price, discounts=discounts)
+                if update_quantity or product_id not in self.cart:
+                    self.storage.set_quantity(product_id, quantity, offer.price)
                 else:
-                    disc_price = offer.price
-                if product_id not in self.cart:
-                    self.cart[product_id] = {'quantity': quantity,
-                                             'price': str(offer.price)}
-                elif update_quantity:
-                    self.cart[product_id]['quantity'] = quantity
-                else:
-                    self.cart[product_id]['quantity'] += quantity
-                self.cart[product_id]['disc_price'] = str(Decimal(disc_price).quantize(Decimal('1.00')))
-                self.save()
+                    self.storage.add_quantity(product_id, quantity, offer.price)
+                self.invalidate()
+                return self.cart[product_id]['quantity']
         else:
             raise ValueError("Товар закончился на складе. Вы можете поискать его в другом магазине.")
 
     def save(self) -> None:
         """
-        Сохранение корзины в сессии
+        Сохранение данных оформления заказа в сессии. Позиции корзины при этом не меняются, поэтому версия
+        корзины не увеличивается: способ доставки входит в ключ расчета корзины (см. get_snapshot_cache_key)
+        :return: None
+        """
+        self.session.modified = True
+        self._memo.clear()
+
+    def invalidate(self) -> None:
+        """
+        Сброс закэшированных расчетов корзины после ее изменения и увеличение версии корзины
         :return: None
         """
-        if not self.use_db:
-            # обновить корзину сеансов
-            self.session[settings.CART_SESSION_ID] = self.cart
-            # пометить сеанс как «измененный», чтобы убедиться, что он сохранен
-            self.session.modified = True
+        self._memo.clear()
+        # версию анонимной корзины увеличивает хранилище при каждом изменении
+        if self.use_db and isinstance(self.cart, Cart):
+            # счетчик версий хранится в кэше: откат транзакции или пересоздание базы не возвращают его назад,
+            # поэтому одна и та же версия не может достаться разному содержимому корзины
+            counter_key = get_cart_version_counter_key(self.cart.pk)
+            cache.add(counter_key, self.cart.version, None)
+            try:
+                version = max(cache.incr(counter_key), self.cart.version + 1)
+            except ValueError:
+                version = self.cart.version + 1
+            Cart.objects.filter(pk=self.cart.pk).update(version=version)
+            self.cart.version = version
+
+    def get_version_key(self) -> Optional[str]:
+        """
+        Получает ключ текущей версии корзины. Корзина в БД, которая еще не изменялась, версии не имеет:
+        id корзин в пересозданной базе повторяются, и по нулевой версии мог бы найтись чужой расчет
+        :return: ключ версии или None, если корзина в БД еще не изменялась или у анонимной корзины нет ключа сессии
+        """
+        if self.use_db:
+            return f'db:{self.cart.pk}:{self.cart.version}' if self.cart.version else None
+        if self.session.session_key:
+            return f'session:{self.session.session_key}:{self.storage.get_version()}'
+        return None
 
     def remove(self, offer: Offer) -> None:
         """
@@ -295,11 +327,12 @@ class CartServices:
             product_ = self.qs.filter(offer=offer)
             if product_.exists():
                 product_.delete()
+                self.invalidate()
         else:
             product_id = str(offer.id)
             if product_id in self.cart:
-                del self.cart[product_id]
-                self.save()
+                self.storage.remove(product_id)
+                self.invalidate()
 
     def __iter__(self):
         """
@@ -319,28 +352,106 @@ class CartServices:
                 item['total_price'] = item['price'] * item['quantity']
             yield item
 
+    def get_items(self) -> List[Tuple[Offer, int]]:
+        """
+        Получает позиции корзины одним запросом
+        :return: список пар (предложение, количество)
+        """
+        if self.use_db:
+            return [(item.offer, item.quantity) for item in self.qs.select_related('offer')]
+        offers = Offer.objects.in_bulk([int(offer_id) for offer_id in self.cart.keys()])
+        return [(offers[int(offer_id)], item['quantity']) for offer_id, item in self.cart.items()
+                if int(offer_id) in offers]
+
+    def get_snapshot_cache_key(self, discount_index: DiscountIndex) -> Optional[str]:
+        """
+        Получает ключ кэша расчета корзины по версии корзины, версии индекса скидок и способу доставки.
+        Изменение цен предложений в ключ не входит и учитывается по истечении CART_SNAPSHOT_CACHE_TIME
+        :param discount_index: индекс скидок
+        :return: ключ кэша или None, если расчет корзины не кэшируется
+        """
+        version_key = self.get_version_key()
+        if version_key is None:
+            return None
+        delivery_option = str((self.get_shipping_data() or {}).get('delivery_option')).replace(' ', '_')
+        database = connection.settings_dict['NAME']
+        return f'cart_snapshot:{database}:{version_key}:{discount_index.version}:{delivery_option}'
+
+    @memoize_until_change
+    def get_snapshot(self) -> CartSnapshot:
+        """
+        Получает расчет корзины из кэша, либо рассчитывает стоимость корзины со всеми скидками
+        за один проход и кэширует результат
+        :return: CartSnapshot
+        """
+        discount_index = DiscountIndex.get()
+        cache_key = self.get_snapshot_cache_key(discount_index)
+        snapshot = cache.get(cache_key) if cache_key else None
+        if snapshot is None:
+            snapshot = self.refresh_snapshot(discount_index)
+        return snapshot
+
+    def refresh_snapshot(self, discount_index: DiscountIndex = None) -> CartSnapshot:
+        """
+        Рассчитывает стоимость корзины по текущим ценам предложений, не читая кэш, и обновляет закэшированный
+        расчет. Используется там, где устаревший расчет недопустим, например при сохранении стоимости заказа
+        :param discount_index: индекс скидок, по умолчанию текущий
+        :return: CartSnapshot
+        """
+        discount_index = discount_index or DiscountIndex.get()
+        return self.store_snapshot(CartPricingEngine(discount_index).calculate(self.get_items()), discount_index)
+
+    def store_snapshot(self, pricing: CartPricing, discount_index: DiscountIndex) -> CartSnapshot:
+        """
+        Сохраняет расчет стоимости корзины в кэш и в корзину до ее следующего изменения
+        :param pricing: расчет стоимости корзины
+        :param discount_index: индекс скидок, по которому выполнен расчет
+        :return: CartSnapshot
+        """
+        snapshot = CartSnapshot(pricing=pricing, delivery_cost=self.calculate_delivery_cost(pricing.total_price))
+        cache_key = self.get_snapshot_cache_key(discount_index)
+        if cache_key:
+            cache.set(cache_key, snapshot, settings.CART_SNAPSHOT_CACHE_TIME)
+        self._memo['get_snapshot'] = snapshot
+        return snapshot
+
+    def update_with_delta(self, offer: Offer, quantity: int = 1,
+                          update_quantity: bool = False) -> Tuple[CartPricing, CartPricing]:
+        """
+        Изменяет количество товара в корзине и пересчитывает стоимость корзины по предыдущему расчету,
+        не загружая позиции корзины заново
+        :param offer: товар
+        :param quantity: количество
+        :param update_quantity: флаг, указывающий, нужно ли обновить товар (False) либо добавить его (True)
+        :return: расчеты стоимости корзины до и после изменения
+        """
+        discount_index = DiscountIndex.get()
+        previous_pricing = self.get_pricing()
+        new_quantity = self.update(offer=offer, quantity=quantity, update_quantity=update_quantity)
+        pricing = CartPricingEngine(discount_index).update_line(previous_pricing, offer, new_quantity)
+        self.store_snapshot(pricing, discount_index)
+        return previous_pricing, pricing
+
+    def get_pricing(self) -> CartPricing:
+        """
+        Получает стоимость корзины со всеми скидками
+        :return: CartPricing
+        """
+        return self.get_snapshot().pricing
+
     def __len__(self) -> int:
         """
         Считает количество товаров в корзине
         :return: количество товаров в корзине
         """
-        if self.use_db:
-            result = ProductInCart.objects.filter(cart=self.cart).aggregate(Sum('quantity'))['quantity__sum']
-            return result if result else 0
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.get_pricing().quantity
 
     def get_total_price(self) -> Decimal:
         """
         Считает итоговую цену товаров корзины
         :return: цена товаров в корзине
         """
-        if self.use_db:
-            total = self.qs.only('quantity', 'offer__price').aggregate(total=Sum(F('quantity') * F('offer__price')))[
-                'total']
-            if not total:
-                total = Decimal('0')
-            return total.quantize(Decimal('1.00'))
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return self.get_pricing().total_price
 
     def get_total_price_with_discounts_on_products(self) -> Decimal:
         """
@@ -348,23 +459,7 @@ class CartServices:
 
         :return: общая цена товаров в корзине с учетом скидок на эти товары
         """
-        ids = [item[0] for item in
-               Product.objects.select_related('category').prefetch_related('property', 'tags', 'discounts').
-               filter(discounts__end_date__gte=self.date_now).values_list('id')]
-
-        total = 0
-        if self.use_db:
-            for item in self.qs.all():
-                if item.offer.product.id in ids:
-                    discounts = Discount.objects.filter(end_date__gte=self.date_now,
-                                                        products__id=item.offer.product.id)
-                    disc_price = self.get_min_price_on_product_with_discount(price=item.offer.price,
-                                                                             discounts=discounts)
-                    total += item.quantity * disc_price
-                else:
-                    total += item.quantity * item.offer.price
-            return Decimal(total).quantize(Decimal('1.00'))
-        return sum(Decimal(item['disc_price']) * item['quantity'] for item in self.cart.values())
+        return self.get_pricing().total_price_with_discounts_on_products
 
     def get_min_price_on_product_with_discount(self, price: Decimal, discounts: QuerySet) -> Decimal:
         """
@@ -372,22 +467,7 @@ class CartServices:
 
         :return: минимальная цена товара в корзине с учетом действующих на этот товар скидок
         """
-
-        disc_prices_lst = []
-        for discount in discounts:
-            disc_price = 0
-            if discount.value_type == 'percentage':
-                disc_price = price * Decimal((1 - discount.value / 100))
-            elif discount.value_type == 'fixed_amount':
-                disc_price = price - discount.value
-            elif discount.value_type == 'fixed_price':
-                disc_price = discount.value
-            if disc_price > 0:
-                disc_prices_lst.append(disc_price)
-            else:
-                disc_prices_lst.append(1)
-        disc_price = min(disc_prices_lst)
-        return disc_price
+        return get_min_price_with_discounts(price=price, discounts=discounts)
 
     def get_min_total_price_with_discount_on_cart(self) -> Decimal:
         """
@@ -395,86 +475,23 @@ class CartServices:
 
         :return: общая минимальная стоимость товаров в корзине с учетом действующих скидок на корзину
         """
-        discounts = DiscountOnCart.objects.filter(end_date__gte=self.date_now)
-        total_price = self.get_total_price()
-        total_quantity = self.__len__()
-        disc_total_prices_on_cart_lst = []
-        if discounts:
-            for discount in discounts:
-                if discount.quantity_at <= total_quantity <= discount.quantity_to \
-                        and total_price >= discount.cart_total_price_at:
-                    disc_total_price = self.get_total_price_with_discount_on_cart(discount=discount,
-                                                                                  total_price=total_price)
-                    disc_total_prices_on_cart_lst.append(disc_total_price)
-                else:
-                    disc_total_prices_on_cart_lst.append(total_price)
-        else:
-            disc_total_prices_on_cart_lst.append(total_price)
-        disc_total_price_on_cart = min(disc_total_prices_on_cart_lst)
-        return Decimal(disc_total_price_on_cart).quantize(Decimal('1.00'))
+        return self.get_pricing().total_price_with_discount_on_cart
 
-    def get_total_price_with_discount_on_cart(self, discount: Discount, total_price: Decimal) -> Decimal:
+    def get_total_price_with_discount_on_cart(self, discount: DiscountOnCart, total_price: Decimal) -> Decimal:
         """
         Считает общую стоимость товаров в корзине с учетом действующей скидки на корзину
 
         :return: общая стоимость товаров в корзине с учетом действующей скидки на корзину
         """
+        return get_total_price_with_discount_on_cart(discount=discount, total_price=total_price)
 
-        disc_total_price = 0
-        if discount.value_type == 'percentage':
-            disc_total_price = total_price * Decimal((1 - discount.value / 100))
-        elif discount.value_type == 'fixed_amount':
-            disc_total_price = total_price - discount.value
-        elif discount.value_type == 'fixed_price':
-            disc_total_price = discount.value
-        return disc_total_price
-
-    def get_min_total_price_with_discount_on_set(self):
+    def get_min_total_price_with_discount_on_set(self) -> Decimal:
         """
         Считает общую минимальную стоимость товаров в корзине с учетом действующих скидок на наборы товаров
 
         :return: общая минимальная стоимость товаров в корзине с учетом действующих скидок на наборы товаров
         """
-        discounts = DiscountOnSet.objects.filter(end_date__gte=self.date_now)
-        total_price = self.get_total_price()
-        disc_total_prices_on_cart_lst = [total_price]
-        if self.use_db:
-            for discount in discounts:
-                # получаем id товаров из скидочного набора
-                products_in_set_ids = [item[0] for item in
-                                       discount.products_in_set.all().values_list('product__id')]
-                # получаем товары из корзины, которые есть в скидочном наборе
-                find_products_in_cart = self.qs.filter(offer__product__id__in=products_in_set_ids)
-                # проверяем, есть ли среди товаров корзины товары из скидочного набора, а также проверяем количество
-                # таких товаров (в случае, если товар участвует в нескольких скидочных наборах, может быть применена
-                # не та скидка, т.к. найдется например один товар из двух и скидка сработает все равно)
-                if find_products_in_cart.exists() and len(products_in_set_ids) == find_products_in_cart.count():
-                    total_price_on_set = 0
-                    for item in self.qs.filter(offer__product__id__in=products_in_set_ids):
-                        total_price_on_set += item.offer.price
-                    disc_total_price = self.get_total_price_with_discount_on_set(discount=discount,
-                                                                                 total_price=total_price,
-                                                                                 total_price_on_set=total_price_on_set)
-                    disc_total_prices_on_cart_lst.append(disc_total_price)
-            # обработать случай, когда после скидки получим отрицательное
-        else:
-            # получаем id товаров в корзине
-            product_in_cart_ids = list(self.get_products_id())
-            for discount in discounts:
-                # получаем id товаров в скидочном наборе
-                products_in_set_ids = [item[0] for item in
-                                       discount.products_in_set.all().values_list('product__id')]
-                # проверяем, что все товары из данного скидочного набора есть в корзине
-                if set(products_in_set_ids).issubset(product_in_cart_ids):
-                    # получаем суммарную стоимость товаров в скидочном наборе
-                    total_price_on_set = Offer.objects.filter(id__in=self.cart.keys(),
-                                                              product__id__in=products_in_set_ids).aggregate(
-                        Sum('price'))['price__sum']
-                    disc_total_price = self.get_total_price_with_discount_on_set(discount=discount,
-                                                                                 total_price=total_price,
-                                                                                 total_price_on_set=total_price_on_set)
-                    disc_total_prices_on_cart_lst.append(disc_total_price)
-        return min(disc_total_prices_on_cart_lst)
+        return self.get_pricing().total_price_with_discount_on_set
 
     def get_total_price_with_discount_on_set(self, discount: DiscountOnSet, total_price: Decimal,
                                              total_price_on_set) -> Decimal:
@@ -483,15 +500,8 @@ class CartServices:
 
         :return: общая стоимость товаров в корзине с учетом действующей скидки на набор товаров
         """
-        disc = 0
-        if discount.value_type == 'percentage':
-            disc = total_price_on_set * Decimal(discount.value / 100)
-        elif discount.value_type == 'fixed_amount':
-            disc = discount.value
-        elif discount.value_type == 'fixed_price':
-            disc = total_price_on_set - discount.value
-        disc_total_price = Decimal(total_price - disc).quantize(Decimal('1.00'))
-        return disc_total_price
+        return get_total_price_with_discount_on_set(discount=discount, total_price=total_price,
+                                                    total_price_on_set=total_price_on_set)
 
     def get_final_price_with_discount(self) -> Decimal:
         """
@@ -499,24 +509,24 @@ class CartServices:
 
         :return: финальная стоимость корзины товаров после применения приоритетной скидки
         """
+        return self.get_pricing().final_price
 
-        total_price = self.get_total_price()
-        total_price_with_discount_on_cart_or_set = min(total_price() for total_price in (
-            self.get_min_total_price_with_discount_on_cart, self.get_min_total_price_with_discount_on_set))
-
-        if total_price_with_discount_on_cart_or_set < total_price:
-            return total_price_with_discount_on_cart_or_set
-        return self.get_total_price_with_discounts_on_products()
-
-    def get_delivery_cost(self) -> Decimal:
+    def get_delivery_cost(self) -> Union[Decimal, str]:
         """
         Получает стоимость доставки
         :return: Decimal
         """
+        return self.get_snapshot().delivery_cost
+
+    def calculate_delivery_cost(self, total_cost: Decimal) -> Union[Decimal, str]:
+        """
+        Рассчитывает стоимость доставки
+        :param total_cost: общая стоимость товаров в корзине
+        :return: Decimal
+        """
         try:
             delivery_option = self.get_shipping_data()["delivery_option"]
             delivery_cost = Decimal(0)
-            total_cost = self.get_total_price()
             min_order_price_for_free_shipping = SiteSettings.load().min_order_price_for_free_shipping
 
             if delivery_option == 'Delivery':
@@ -536,6 +546,7 @@ class CartServices:
         except TypeError:
             return 'Не был выбран способ доставки!'
 
+    @memoize_until_change
     def has_single_seller(self) -> bool:
         """
         В корзине все товары от одного продавца
@@ -551,25 +562,46 @@ class CartServices:
         Удалить корзину из сеанса или из базы данных, если пользователь авторизован
         :return:
         """
-        if only_session:
-            if settings.CART_SESSION_ID in self.session:
-                del self.session[settings.CART_SESSION_ID]
-                self.session.modified = True
-        else:
-            if self.qs:
-                self.qs.delete()
-            if settings.CART_SESSION_ID in self.session:
-                del self.session[settings.CART_SESSION_ID]
-                self.session.modified = True
+        if not only_session and self.qs:
+            self.qs.delete()
+        self.storage.clear()
+        self.invalidate()
 
-    def check_cart_products_availability(self, request) -> None:
+    def check_cart_products_availability(self) -> List[CartAvailabilityWarning]:
         """
-        Проверяет наличие товаров в корзине на складе и удаляет товары, которых нет на складе
+        Проверяет наличие на складе предложений, лежащих в корзине, и удаляет закончившиеся.
+        Закончившиеся предложения вместе с названиями товаров и магазинов выбираются одним запросом,
+        позиции корзины удаляются одним запросом
+        :return: список предупреждений об удаленных позициях
         """
-        product_ids = self.get_products_id()
-        qs = Offer.objects.filter(product_id__in=product_ids, in_stock=0)
-        if qs:
-            for item in qs:
-                messages.warning(request, f'{item.product.name} закончился на складе магазина {item.shop.name}')
-                self.remove(item)
-                self.save()
+        if self.use_db:
+            rows = self.qs.filter(offer__in_stock__lte=F('offer__held')).values_list(
+                'offer_id', 'offer__product__name', 'offer__shop__name')
+        else:
+            if not self.cart:
+                return []
+            rows = Offer.objects.filter(id__in=[int(offer_id) for offer_id in self.cart],
+                                        in_stock__lte=F('held')).values_list('id', 'product__name', 'shop__name')
+        warnings = [CartAvailabilityWarning(*row) for row in rows]
+        if warnings:
+            offer_ids = [warning.offer_id for warning in warnings]
+            if self.use_db:
+                self.qs.filter(offer_id__in=offer_ids).delete()
+            else:
+                self.storage.remove_many(str(offer_id) for offer_id in offer_ids)
+            self.invalidate()
+        return warnings
+
+
+def get_cart(request) -> CartServices:
+    """
+    Получение корзины текущего запроса. Корзина создается один раз за запрос и переиспользуется
+    контекстными процессорами и представлениями
+    :param request: запрос
+    :return: CartServices
+    """
+    cart = getattr(request, '_cached_cart', None)
+    # после входа или выхода пользователя в рамках запроса корзина должна быть создана заново
+    if cart is None or cart.user.pk != request.user.pk:
+        cart = request._cached_cart = CartServices(request)
+    return cart
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+from django.utils.translation import gettext_lazy as _
+
+from cart.benchmarks import CART_SIZES, DISCOUNT_COUNTS, CartBenchmark
+
+
+class Command(BaseCommand):
+    """Кастомная команда Джанго, для замера производительности расчета корзины на тестовой базе данных."""
+
+    def add_arguments(self, parser):
+        """Добавление аргументов в команду."""
+        parser.add_argument('--output', type=str, default='cart_benchmark.json', help=_('Файл результатов'))
+        parser.add_argument('--sizes', type=int, nargs='+', default=CART_SIZES, help=_('Размеры корзин'))
+        parser.add_argument('--discounts', type=int, nargs='+', default=DISCOUNT_COUNTS,
+                            help=_('Количество скидок каждого вида'))
+        parser.add_argument('--repeat', type=int, default=5, help=_('Количество повторов замера'))
+
+    def handle(self, *args, **kwargs):
+        """Логика выполнения команды."""
+        self.stdout.write(_('Создание тестовой базы данных...'))
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            benchmark = CartBenchmark(cart_sizes=kwargs['sizes'], discount_counts=kwargs['discounts'],
+                                      repeat=kwargs['repeat'])
+            results = benchmark.run()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        for result in results:
+            self.stdout.write('{case:<32} {cart_size:>5} {discounts:>5} {wall_time_ms:>10} ms {queries:>4} q'.format(
+                **result))
+        with open(kwargs['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(_('Результаты сохранены в ') + kwargs['output'])
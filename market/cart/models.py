@@ -12,6 +12,8 @@ class Cart(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts')
     is_active = models.BooleanField(default=True)
+    # увеличивается при каждом изменении корзины, входит в ключ кэша расчета стоимости корзины
+    version = models.PositiveIntegerField(default=0, verbose_name=_('версия'))
 
     class Meta:
         db_table = 'cart'
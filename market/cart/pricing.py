@@ -0,0 +1,269 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from settings.models import Discount, DiscountOnCart, DiscountOnSet
+from settings.services import DiscountIndex
+from shops.models import Offer
+
+PRICE_PRECISION = Decimal('1.00')
+
+
+def get_price_with_discount(price: Decimal, discount: Discount) -> Decimal:
+    """
+    Считает цену товара с учетом скидки на товар
+    :param price: цена товара
+    :param discount: скидка на товар
+    :return: цена товара со скидкой (не меньше 1)
+    """
+    disc_price = 0
+    if discount.value_type == 'percentage':
+        disc_price = price * Decimal((1 - discount.value / 100))
+    elif discount.value_type == 'fixed_amount':
+        disc_price = price - discount.value
+    elif discount.value_type == 'fixed_price':
+        disc_price = discount.value
+    return disc_price if disc_price > 0 else 1
+
+
+def get_min_price_with_discounts(price: Decimal, discounts: Iterable[Discount]) -> Decimal:
+    """
+    Считает минимальную цену товара с учетом действующих на этот товар скидок
+    :param price: цена товара
+    :param discounts: скидки на товар
+    :return: минимальная цена товара со скидкой
+    """
+    return min(get_price_with_discount(price, discount) for discount in discounts)
+
+
+def get_total_price_with_discount_on_cart(discount: DiscountOnCart, total_price: Decimal) -> Decimal:
+    """
+    Считает общую стоимость товаров в корзине с учетом скидки на корзину
+    :param discount: скидка на корзину
+    :param total_price: общая стоимость товаров в корзине
+    :return: общая стоимость товаров в корзине со скидкой
+    """
+    disc_total_price = 0
+    if discount.value_type == 'percentage':
+        disc_total_price = total_price * Decimal((1 - discount.value / 100))
+    elif discount.value_type == 'fixed_amount':
+        disc_total_price = total_price - discount.value
+    elif discount.value_type == 'fixed_price':
+        disc_total_price = discount.value
+    return disc_total_price
+
+
+def get_total_price_with_discount_on_set(discount: DiscountOnSet, total_price: Decimal,
+                                         total_price_on_set: Decimal) -> Decimal:
+    """
+    Считает общую стоимость товаров в корзине с учетом скидки на набор товаров
+    :param discount: скидка на набор товаров
+    :param total_price: общая стоимость товаров в корзине
+    :param total_price_on_set: стоимость товаров набора
+    :return: общая стоимость товаров в корзине со скидкой
+    """
+    disc = 0
+    if discount.value_type == 'percentage':
+        disc = total_price_on_set * Decimal(discount.value / 100)
+    elif discount.value_type == 'fixed_amount':
+        disc = discount.value
+    elif discount.value_type == 'fixed_price':
+        disc = total_price_on_set - discount.value
+    return Decimal(total_price - disc).quantize(PRICE_PRECISION)
+
+
+@dataclass(frozen=True)
+class LinePricing:
+    """ Расчет стоимости одной позиции корзины """
+
+    offer_id: int
+    product_id: int
+    quantity: int
+    price: Decimal
+    disc_price: Decimal
+
+    @property
+    def total_price(self) -> Decimal:
+        """ Стоимость позиции без учета скидок """
+        return self.price * self.quantity
+
+    @property
+    def disc_total_price(self) -> Decimal:
+        """ Стоимость позиции с учетом скидок на товар """
+        return self.disc_price * self.quantity
+
+
+@dataclass(frozen=True)
+class CartPricing:
+    """ Неизменяемый результат расчета стоимости корзины """
+
+    lines: Tuple[LinePricing, ...]
+    quantity: int
+    total_price: Decimal
+    total_price_with_discounts_on_products: Decimal
+    total_price_with_discount_on_cart: Decimal
+    total_price_with_discount_on_set: Decimal
+    final_price: Decimal
+
+    def get_line(self, offer_id: int) -> Optional[LinePricing]:
+        """
+        Получение расчета позиции корзины по id предложения
+        :param offer_id: id предложения
+        :return: LinePricing или None, если предложения нет в корзине
+        """
+        for line in self.lines:
+            if line.offer_id == int(offer_id):
+                return line
+        return None
+
+
+def get_pricing_values(pricing: CartPricing, offer_id: int) -> Dict[str, str]:
+    """
+    Получает значения расчета корзины, отображаемые на странице корзины после изменения позиции
+    :param pricing: расчет стоимости корзины
+    :param offer_id: id измененного предложения
+    :return: словарь значений
+    """
+    line = pricing.get_line(offer_id)
+    return {
+        'product_id': str(offer_id),
+        'product_quantity': str(line.quantity if line else 0),
+        'disc_price': str(line.disc_price if line else 0),
+        'product_total_price': str(line.total_price if line else 0),
+        'cart_total_price': str(pricing.total_price),
+        'cart_final_price_with_discount': str(pricing.final_price),
+        'cart_len': str(pricing.quantity),
+    }
+
+
+def get_pricing_delta(previous_pricing: CartPricing, pricing: CartPricing, offer_id: int) -> Dict[str, str]:
+    """
+    Получает значения расчета корзины, изменившиеся после изменения позиции
+    :param previous_pricing: расчет стоимости корзины до изменения
+    :param pricing: расчет стоимости корзины после изменения
+    :param offer_id: id измененного предложения
+    :return: словарь изменившихся значений и id предложения
+    """
+    previous_values = get_pricing_values(previous_pricing, offer_id)
+    return {key: value for key, value in get_pricing_values(pricing, offer_id).items()
+            if key == 'product_id' or previous_values[key] != value}
+
+
+@dataclass(frozen=True)
+class CartSnapshot:
+    """ Снимок расчета корзины, кэшируемый до следующего изменения корзины или скидок """
+
+    pricing: CartPricing
+    # стоимость доставки или сообщение о том, что способ доставки не выбран
+    delivery_cost: Union[Decimal, str]
+
+
+class CartPricingEngine:
+    """
+    Расчет стоимости корзины за один проход. Действующие скидки берутся из индекса скидок,
+    поэтому стоимость расчета не зависит от количества скидок
+    """
+
+    def __init__(self, discount_index: DiscountIndex = None):
+        self.discount_index = discount_index or DiscountIndex.get()
+
+    def calculate(self, items: Iterable[Tuple[Offer, int]]) -> CartPricing:
+        """
+        Расчет стоимости корзины
+        :param items: пары (предложение, количество)
+        :return: CartPricing
+        """
+        return self.summarize([self.get_line(offer, quantity) for offer, quantity in items])
+
+    def update_line(self, pricing: CartPricing, offer: Offer, quantity: int) -> CartPricing:
+        """
+        Пересчет стоимости корзины после изменения одной позиции по предыдущему расчету, без обращения к БД:
+        позиции корзины не загружаются заново, а скидки берутся из индекса скидок
+        :param pricing: предыдущий расчет стоимости корзины
+        :param offer: измененное предложение
+        :param quantity: новое количество товара (0 - позиция удалена)
+        :return: CartPricing
+        """
+        lines = [line for line in pricing.lines if line.offer_id != offer.id]
+        if quantity > 0:
+            position = next((index for index, line in enumerate(pricing.lines) if line.offer_id == offer.id),
+                            len(lines))
+            lines.insert(position, self.get_line(offer, quantity))
+        return self.summarize(lines)
+
+    def get_line(self, offer: Offer, quantity: int) -> LinePricing:
+        """
+        Расчет стоимости позиции корзины с учетом скидок на товар
+        :param offer: предложение
+        :param quantity: количество
+        :return: LinePricing
+        """
+        discounts = self.discount_index.get_product_discounts(offer.product_id)
+        disc_price = get_min_price_with_discounts(offer.price, discounts) if discounts else offer.price
+        return LinePricing(offer_id=offer.id, product_id=offer.product_id, quantity=quantity,
+                           price=offer.price, disc_price=Decimal(disc_price).quantize(PRICE_PRECISION))
+
+    def summarize(self, lines: List[LinePricing]) -> CartPricing:
+        """
+        Расчет итоговой стоимости корзины по рассчитанным позициям
+        :param lines: позиции корзины
+        :return: CartPricing
+        """
+        quantity = 0
+        total_price = Decimal(0)
+        total_disc_price = Decimal(0)
+        # суммарная стоимость единиц товаров корзины по id продукта (для скидок на наборы)
+        prices_by_product = defaultdict(Decimal)
+        for line in lines:
+            quantity += line.quantity
+            total_price += line.total_price
+            total_disc_price += line.disc_total_price
+            prices_by_product[line.product_id] += line.price
+
+        total_price = total_price.quantize(PRICE_PRECISION)
+        total_on_cart = self.get_min_total_price_with_discount_on_cart(total_price, quantity)
+        total_on_set = self.get_min_total_price_with_discount_on_set(total_price, prices_by_product)
+        total_disc_price = Decimal(total_disc_price).quantize(PRICE_PRECISION)
+
+        final_price = min(total_on_cart, total_on_set)
+        if final_price >= total_price:
+            final_price = total_disc_price
+
+        return CartPricing(
+            lines=tuple(lines),
+            quantity=quantity,
+            total_price=total_price,
+            total_price_with_discounts_on_products=total_disc_price,
+            total_price_with_discount_on_cart=total_on_cart,
+            total_price_with_discount_on_set=total_on_set,
+            final_price=final_price,
+        )
+
+    def get_min_total_price_with_discount_on_cart(self, total_price: Decimal, quantity: int) -> Decimal:
+        """
+        Считает минимальную стоимость корзины с учетом действующих скидок на корзину
+        :param total_price: общая стоимость товаров в корзине
+        :param quantity: количество товаров в корзине
+        :return: минимальная стоимость корзины со скидкой на корзину
+        """
+        disc_total_prices = [total_price]
+        for discount in self.discount_index.get_cart_discounts(total_price):
+            if discount.quantity_at <= quantity <= discount.quantity_to:
+                disc_total_prices.append(get_total_price_with_discount_on_cart(discount, total_price))
+        return Decimal(min(disc_total_prices)).quantize(PRICE_PRECISION)
+
+    def get_min_total_price_with_discount_on_set(self, total_price: Decimal,
+                                                 prices_by_product: Dict[int, Decimal]) -> Decimal:
+        """
+        Считает минимальную стоимость корзины с учетом действующих скидок на наборы товаров
+        :param total_price: общая стоимость товаров в корзине
+        :param prices_by_product: стоимость единиц товаров корзины по id продукта
+        :return: минимальная стоимость корзины со скидкой на набор
+        """
+        disc_total_prices = [total_price]
+        for discount, products_in_set_ids in self.discount_index.get_set_discounts(prices_by_product).items():
+            total_price_on_set = sum(prices_by_product[product_id] for product_id in products_in_set_ids)
+            disc_total_prices.append(get_total_price_with_discount_on_set(
+                discount=discount, total_price=total_price, total_price_on_set=total_price_on_set))
+        return min(disc_total_prices)
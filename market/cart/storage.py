@@ -0,0 +1,239 @@
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional
+from uuid import uuid4
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_redis_client = None
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    Получение клиента Redis для хранения корзин, общего для процесса
+    :return: redis.Redis
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.CART_REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+class BaseCartStorage(ABC):
+    """
+    Хранилище корзины анонимного пользователя. Корзина представлена словарем
+    {id предложения: {'quantity': количество, 'price': цена}}, который хранилище поддерживает в актуальном состоянии
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.cart: Dict[str, Dict] = {}
+
+    @abstractmethod
+    def load(self) -> Dict[str, Dict]:
+        """
+        Загрузка корзины из хранилища
+        :return: словарь позиций корзины
+        """
+
+    @abstractmethod
+    def get_version(self) -> Optional[str]:
+        """
+        Получение версии корзины, которая меняется при каждом изменении корзины
+        :return: версия или None, если корзина еще не изменялась
+        """
+
+    @abstractmethod
+    def set_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        """
+        Установка количества товара в корзине
+        :param offer_id: id предложения
+        :param quantity: количество
+        :param price: цена
+        :return: None
+        """
+
+    @abstractmethod
+    def add_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        """
+        Увеличение количества товара в корзине
+        :param offer_id: id предложения
+        :param quantity: количество
+        :param price: цена
+        :return: None
+        """
+
+    @abstractmethod
+    def remove(self, offer_id: str) -> None:
+        """
+        Удаление товара из корзины
+        :param offer_id: id предложения
+        :return: None
+        """
+
+    @abstractmethod
+    def remove_many(self, offer_ids: Iterable[str]) -> None:
+        """
+        Удаление нескольких товаров из корзины за одно изменение корзины
+        :param offer_ids: id предложений
+        :return: None
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Удаление всех товаров из корзины
+        :return: None
+        """
+
+
+class SessionCartStorage(BaseCartStorage):
+    """ Хранилище корзины в сессии пользователя """
+
+    def load(self) -> Dict[str, Dict]:
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
+        return self.cart
+
+    def get_version(self) -> Optional[str]:
+        return self.session.get(settings.CART_VERSION_SESSION_ID)
+
+    def save(self) -> None:
+        """
+        Сохранение корзины в сессии с новой версией. Версия случайна,
+        чтобы параллельные запросы не получили одинаковую версию
+        :return: None
+        """
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self.session[settings.CART_VERSION_SESSION_ID] = uuid4().hex
+        # пометить сеанс как «измененный», чтобы убедиться, что он сохранен
+        self.session.modified = True
+
+    def set_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        self.cart[offer_id] = {'quantity': quantity, 'price': str(price)}
+        self.save()
+
+    def add_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        self.cart.setdefault(offer_id, {'quantity': 0, 'price': str(price)})['quantity'] += quantity
+        self.save()
+
+    def remove(self, offer_id: str) -> None:
+        self.cart.pop(offer_id, None)
+        self.save()
+
+    def remove_many(self, offer_ids: Iterable[str]) -> None:
+        for offer_id in offer_ids:
+            self.cart.pop(offer_id, None)
+        self.save()
+
+    def clear(self) -> None:
+        self.cart.clear()
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+            self.session[settings.CART_VERSION_SESSION_ID] = uuid4().hex
+
+
+class RedisCartStorage(BaseCartStorage):
+    """
+    Хранилище корзины в Redis. Количества и цены товаров хранятся в хэшах с ключом по токену корзины,
+    количество изменяется атомарной командой HINCRBY, ключи удаляются по истечении CART_REDIS_TTL.
+    Токен хранится в сессии и, в отличие от ключа сессии, не меняется при входе пользователя, поэтому
+    корзина переносится в БД после входа. Сессия пользователя перезаписывается только при создании токена
+    """
+
+    def __init__(self, session, client: redis.Redis = None):
+        """
+        :param session: сессия пользователя
+        :param client: клиент Redis с decode_responses=True, по умолчанию подключение к CART_REDIS_URL
+        """
+        super().__init__(session)
+        self.client = client or get_redis_client()
+        self.version: Optional[str] = None
+
+    def get_token(self) -> Optional[str]:
+        """
+        Получение токена корзины текущей сессии
+        :return: токен или None, если корзина еще не изменялась
+        """
+        return self.session.get(settings.CART_TOKEN_SESSION_ID)
+
+    def get_key(self, name: str) -> str:
+        """
+        Получение ключа Redis корзины текущей сессии
+        :param name: название ключа: quantities, prices или version
+        :return: ключ
+        """
+        return f'{settings.CART_REDIS_PREFIX}:{self.get_token()}:{name}'
+
+    def load(self) -> Dict[str, Dict]:
+        self.cart = {}
+        if self.get_token():
+            with self.client.pipeline() as pipe:
+                quantities, prices, self.version = pipe.hgetall(self.get_key('quantities')).hgetall(
+                    self.get_key('prices')).get(self.get_key('version')).execute()
+            self.cart.update({offer_id: {'quantity': int(quantity), 'price': prices.get(offer_id, '0')}
+                              for offer_id, quantity in quantities.items()})
+        return self.cart
+
+    def get_version(self) -> Optional[str]:
+        return self.version
+
+    def execute(self, commands: Callable) -> List:
+        """
+        Выполнение команд изменения корзины в одной транзакции Redis вместе с увеличением версии
+        и продлением срока хранения ключей
+        :param commands: функция, добавляющая команды в pipeline
+        :return: результаты команд
+        """
+        if self.get_token() is None:
+            self.session[settings.CART_TOKEN_SESSION_ID] = uuid4().hex
+        keys = [self.get_key('quantities'), self.get_key('prices'), self.get_key('version')]
+        with self.client.pipeline() as pipe:
+            commands(pipe)
+            pipe.incr(self.get_key('version'))
+            for key in keys:
+                pipe.expire(key, settings.CART_REDIS_TTL)
+            results = pipe.execute()
+        self.version = str(results[-len(keys) - 1])
+        return results
+
+    def set_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        self.execute(lambda pipe: pipe.hset(self.get_key('quantities'), offer_id, quantity).hset(
+            self.get_key('prices'), offer_id, str(price)))
+        self.cart[offer_id] = {'quantity': quantity, 'price': str(price)}
+
+    def add_quantity(self, offer_id: str, quantity: int, price: Decimal) -> None:
+        results = self.execute(lambda pipe: pipe.hincrby(self.get_key('quantities'), offer_id, quantity).hsetnx(
+            self.get_key('prices'), offer_id, str(price)))
+        item = self.cart.setdefault(offer_id, {'price': str(price)})
+        # количество, возвращенное Redis, учитывает изменения корзины из параллельных запросов
+        item['quantity'] = int(results[0])
+
+    def remove(self, offer_id: str) -> None:
+        self.execute(lambda pipe: pipe.hdel(self.get_key('quantities'), offer_id).hdel(
+            self.get_key('prices'), offer_id))
+        self.cart.pop(offer_id, None)
+
+    def remove_many(self, offer_ids: Iterable[str]) -> None:
+        offer_ids = list(offer_ids)
+        if not offer_ids:
+            return
+        self.execute(lambda pipe: pipe.hdel(self.get_key('quantities'), *offer_ids).hdel(
+            self.get_key('prices'), *offer_ids))
+        for offer_id in offer_ids:
+            self.cart.pop(offer_id, None)
+
+    def clear(self) -> None:
+        if self.get_token():
+            self.execute(lambda pipe: pipe.delete(self.get_key('quantities'), self.get_key('prices')))
+        self.cart.clear()
+
+
+def get_cart_storage(session) -> BaseCartStorage:
+    """
+    Получение хранилища корзины анонимного пользователя, заданного настройкой CART_STORAGE
+    :param session: сессия пользователя
+    :return: BaseCartStorage
+    """
+    return import_string(settings.CART_STORAGE)(session)
@@ -0,0 +1,21 @@
+from cart.benchmarks import CartBenchmark
+from django.test import TestCase
+from settings.services import DiscountIndex
+
+
+class CartBenchmarkTestCase(TestCase):
+    """Класс теста замера производительности корзины"""
+
+    def setUp(self):
+        DiscountIndex.invalidate()
+        self.addCleanup(DiscountIndex.invalidate)
+
+    def test_run(self):
+        """Тестирование получения результатов замеров для всех действий, корзин и скидок"""
+        results = CartBenchmark(cart_sizes=(1, 3), discount_counts=(0, 2), repeat=1).run()
+        self.assertEqual(len(results), 2 * 2 * 5)
+        for result in results:
+            self.assertGreaterEqual(result['wall_time_ms'], 0)
+            self.assertGreaterEqual(result['queries'], 1)
+        pricing_results = [result for result in results if result['case'] == 'get_final_price_with_discount']
+        self.assertEqual({result['queries'] for result in pricing_results}, {1})
@@ -1,13 +1,21 @@
+from dataclasses import FrozenInstanceError
 from datetime import datetime
 from decimal import Decimal
 
-from cart.cart import CartServices
-from django.db.models import QuerySet, Sum
+from cart.cart import CartServices, get_cart
+from cart.models import Cart, ProductInCart
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F, QuerySet, Sum
 from django.test import TestCase, Client
 from django.utils import timezone
+from orders.models import Order, OrderItem
+from orders.services import reserve_order_items
 
 from settings.models import Discount, DiscountOnCart, DiscountOnSet, SiteSettings
+from settings.services import DiscountIndex
 from shops.models import Offer, Shop
+from shops.services import get_offers_by_products
 from users.models import User
 
 
@@ -94,9 +102,43 @@ class CartTestCase(TestCase):
         product_ids = self.cart.get_products_id()
 
         for product_id in product_ids:
-            for shop in shops_by_product[product_id]:
-                offers = shop.offer_set.filter(product_id=product_id, in_stock__gte=1)
-                self.assertGreaterEqual(offers.count(), 1)
+            for shop_offer in shops_by_product[product_id]:
+                offer = Offer.objects.get(id=shop_offer.offer_id, shop_id=shop_offer.shop_id, product_id=product_id)
+                self.assertEqual((shop_offer.price, shop_offer.available), (offer.price, offer.available))
+
+    def test_get_shops_with_products_uses_single_query(self):
+        """ Тестирование получения магазинов для всех товаров корзины одним запросом """
+
+        self.cart.update(self.offer1)
+        self.cart.update(self.offer_in_discount_on_set)
+        self.cart.get_pricing()
+        cache.clear()
+        with self.assertNumQueries(1):
+            shops_by_product = self.cart.get_shops_with_products()
+        self.assertEqual(set(shops_by_product), {self.offer1.product_id, self.offer_in_discount_on_set.product_id})
+        shop_offers = shops_by_product[self.offer_in_discount_on_set.product_id]
+        self.assertIn(self.offer_in_discount_on_set.shop_id, [shop_offer.shop_id for shop_offer in shop_offers])
+
+    def test_shops_with_products_cache_is_reset_after_offer_change(self):
+        """ Тестирование сброса закэшированных магазинов товара после изменения цены и резерва предложения """
+
+        product_id = self.offer1.product_id
+        get_offers_by_products([product_id])
+        with self.assertNumQueries(0):
+            get_offers_by_products([product_id])
+        offer = Offer.objects.get(id=self.offer1.id)
+        offer.price += 1
+        offer.save()
+        shop_offer = next(shop_offer for shop_offer in get_offers_by_products([product_id])[product_id]
+                          if shop_offer.offer_id == offer.id)
+        self.assertEqual(shop_offer.price, offer.price)
+
+        order = Order.objects.create(user=self.user, delivery_option='Delivery', delivery_address='Mira, 2',
+                                     delivery_city='Minsk', payment_option='Online Card', comment='')
+        reserve_order_items(order, [OrderItem.objects.create(order=order, offer=offer, quantity=1)])
+        shop_offer = next(shop_offer for shop_offer in get_offers_by_products([product_id])[product_id]
+                          if shop_offer.offer_id == offer.id)
+        self.assertEqual(shop_offer.available, offer.in_stock - offer.held - 1)
 
     def test_update_shops_with_products(self):
         """Тестирование метода обновления предложения при изменении магазина."""
@@ -364,3 +406,145 @@ class CartTestCase(TestCase):
         self.assertEqual(product_data['price'], 350)
         self.assertEqual(product_data['disc_price'], 350)
         self.assertEqual(product_data['total_price'], 700)
+
+    def test_get_cart_returns_same_instance_within_request(self):
+        """ Тестирование получения одной и той же корзины в рамках запроса """
+
+        request = self.client.request().wsgi_request
+        self.assertIs(get_cart(request), get_cart(request))
+
+    def test_totals_are_recalculated_after_cart_change(self):
+        """ Тестирование сброса закэшированных расчетов корзины после ее изменения """
+
+        self.cart.update(self.offer1)
+        self.assertEqual(self.cart.get_total_price(), self.offer1.price)
+        self.cart.update(self.offer1)
+        self.assertEqual(self.cart.get_total_price(), self.offer1.price * 2)
+        self.assertEqual(len(self.cart), 2)
+
+    def test_get_pricing_uses_fixed_number_of_queries(self):
+        """ Тестирование расчета стоимости корзины фиксированным числом запросов """
+
+        added_offer = Offer.objects.get(id=10)
+        self.cart.update(added_offer, 3)
+        self.cart.update(self.offer_with_discounts, 1)
+        self.cart.update(self.offer_in_discount_on_set, 1)
+        DiscountIndex.get()
+        with self.assertNumQueries(1):
+            pricing = self.cart.get_pricing()
+        self.assertEqual(pricing.quantity, len(self.cart))
+        self.assertEqual(pricing.total_price, self.cart.get_total_price())
+        self.assertEqual(pricing.final_price, self.cart.get_final_price_with_discount())
+        with self.assertRaises(FrozenInstanceError):
+            pricing.final_price = Decimal('0')
+
+    def test_save_in_db_merges_session_cart(self):
+        """ Тестирование переноса корзины из сессии в БД с ограничением количества остатком на складе """
+
+        cart = Cart.objects.create(user=self.user)
+        ProductInCart.objects.create(cart=cart, offer=self.offer1, quantity=1)
+        session_cart = {
+            str(self.offer1.id): {'quantity': 2, 'price': str(self.offer1.price)},
+            str(self.offer2.id): {'quantity': self.offer2.in_stock + 5, 'price': str(self.offer2.price)},
+        }
+        # предложения, корзина, позиции корзины, обновление, вставка и точка сохранения транзакции
+        with self.assertNumQueries(7):
+            self.assertEqual(self.cart.save_in_db(session_cart, self.user), cart)
+        quantities = dict(ProductInCart.objects.filter(cart=cart).values_list('offer_id', 'quantity'))
+        self.assertEqual(quantities, {self.offer1.id: min(3, max(self.offer1.in_stock, 1)),
+                                      self.offer2.id: self.offer2.in_stock})
+
+    def test_snapshot_is_cached_until_cart_change(self):
+        """ Тестирование кэширования расчета корзины до следующего изменения корзины """
+
+        request = self.client.request().wsgi_request
+        request.user = self.user
+        cart = CartServices(request)
+        version = cart.cart.version
+        cart.update(self.offer1)
+        self.assertGreater(cart.cart.version, version)
+        snapshot = cart.get_snapshot()
+
+        cart = CartServices(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.get_snapshot(), snapshot)
+        cart.update(self.offer1)
+        self.assertEqual(cart.get_pricing().quantity, snapshot.pricing.quantity + 1)
+
+    def test_checkout_data_does_not_change_cart_version(self):
+        """ Тестирование сохранения данных оформления заказа без увеличения версии корзины """
+
+        request = self.client.request().wsgi_request
+        request.user = self.user
+        cart = CartServices(request)
+        cart.update(self.offer1)
+        version = cart.cart.version
+        with self.assertNumQueries(1):
+            cart.invalidate()
+        self.assertGreater(cart.cart.version, version)
+        version = cart.cart.version
+        self.assertEqual(Cart.objects.get(pk=cart.cart.pk).version, version)
+
+        snapshot = cart.get_snapshot()
+        snapshot_cache_key = cart.get_snapshot_cache_key(DiscountIndex.get())
+        form = type('Form', (), {'cleaned_data': {'name': 'Ivan'}})
+        with self.assertNumQueries(0):
+            cart.add_user_data(form)
+            cart.add_payment_data(form)
+            self.assertEqual(cart.get_snapshot(), snapshot)
+        self.assertEqual(Cart.objects.get(pk=cart.cart.pk).version, version)
+
+        form.cleaned_data = {'delivery_option': 'Express Delivery'}
+        cart.add_shipping_data(form)
+        self.assertEqual(cart.cart.version, version)
+        self.assertNotEqual(cart.get_snapshot_cache_key(DiscountIndex.get()), snapshot_cache_key)
+
+    def test_cart_version_is_not_reused_after_rollback(self):
+        """ Тестирование того, что версия корзины не повторяется после отката транзакции """
+
+        request = self.client.request().wsgi_request
+        request.user = self.user
+        cart = CartServices(request)
+        version = cart.cart.version
+        try:
+            with transaction.atomic():
+                cart.update(self.offer1)
+                rolled_back_snapshot = cart.get_snapshot()
+                raise DatabaseError
+        except DatabaseError:
+            pass
+
+        cart = CartServices(request)
+        self.assertEqual(cart.cart.version, version)
+        cart.update(self.offer2)
+        self.assertNotEqual(cart.get_snapshot(), rolled_back_snapshot)
+
+    def test_check_cart_products_availability_removes_only_cart_offers(self):
+        """ Тестирование удаления закончившихся на складе предложений корзины одним запросом """
+
+        request = self.client.request().wsgi_request
+        request.user = self.user
+        cart = CartServices(request)
+        cart.update(self.offer1)
+        cart.update(self.offer2)
+        Offer.objects.filter(id=self.offer1.id).update(in_stock=0)
+        # закончившееся предложение другого магазина, которого нет в корзине, не учитывается
+        Offer.objects.filter(product_id=self.offer2.product_id).exclude(id=self.offer2.id).update(in_stock=0)
+        # выборка предложений, удаление позиций и смена версии корзины
+        with self.assertNumQueries(3):
+            warnings = cart.check_cart_products_availability()
+        self.assertEqual([warning.offer_id for warning in warnings], [self.offer1.id])
+        self.assertEqual(str(warnings[0]), f'{self.offer1.product.name} закончился на складе магазина '
+                                           f'{self.offer1.shop.name}')
+        self.assertEqual(list(cart.qs.values_list('offer_id', flat=True)), [self.offer2.id])
+
+    def test_check_session_cart_products_availability(self):
+        """ Тестирование удаления закончившихся на складе предложений из корзины анонимного пользователя """
+
+        self.cart.update(self.offer1)
+        self.cart.update(self.offer2)
+        Offer.objects.filter(id=self.offer2.id).update(held=F('in_stock'))
+        with self.assertNumQueries(1):
+            warnings = self.cart.check_cart_products_availability()
+        self.assertEqual([warning.offer_id for warning in warnings], [self.offer2.id])
+        self.assertEqual(list(self.cart.cart), [str(self.offer1.id)])
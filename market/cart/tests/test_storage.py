@@ -0,0 +1,129 @@
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+
+import fakeredis
+from cart.cart import CartServices
+from cart.models import ProductInCart
+from cart.storage import BaseCartStorage, RedisCartStorage, SessionCartStorage
+from django.conf import settings
+from django.contrib.auth import login
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+
+from products.models import Category, Product
+from shops.models import Offer, Shop
+from users.models import User
+
+
+def get_session():
+    """ Создание сессии с ключом """
+
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session.create()
+    return session
+
+
+class BaseCartStorageTestCase(TestCase):
+    """Класс теста интерфейса хранилища корзины"""
+
+    def test_incomplete_storage_cannot_be_created(self):
+        """Тестирование запрета создания хранилища, не реализующего все методы интерфейса"""
+
+        class IncompleteCartStorage(BaseCartStorage):
+            def load(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            IncompleteCartStorage(get_session())
+
+
+class SessionCartStorageTestCase(TestCase):
+    """Класс теста хранилища корзины в сессии"""
+
+    def test_changes_are_saved_in_session(self):
+        """Тестирование сохранения позиций и версии корзины в сессии"""
+        session = get_session()
+        storage = SessionCartStorage(session)
+        storage.load()
+        storage.add_quantity('1', 2, Decimal('10.00'))
+        version = storage.get_version()
+        storage.add_quantity('1', 1, Decimal('10.00'))
+        self.assertEqual(session[settings.CART_SESSION_ID], {'1': {'quantity': 3, 'price': '10.00'}})
+        self.assertNotEqual(storage.get_version(), version)
+
+        storage.clear()
+        self.assertNotIn(settings.CART_SESSION_ID, session)
+        self.assertEqual(storage.load(), {})
+
+
+class RedisCartStorageTestCase(TestCase):
+    """Класс теста хранилища корзины в Redis"""
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        self.session = get_session()
+
+    def test_changes_are_saved_in_redis(self):
+        """Тестирование атомарного изменения количества товаров и срока хранения корзины"""
+        storage = RedisCartStorage(self.session, client=self.client)
+        storage.load()
+        storage.add_quantity('1', 2, Decimal('10.00'))
+        # параллельный запрос с той же сессией
+        RedisCartStorage(self.session, client=self.client).add_quantity('1', 3, Decimal('10.00'))
+        storage.add_quantity('1', 1, Decimal('10.00'))
+        storage.set_quantity('2', 4, Decimal('20.00'))
+        self.assertEqual(storage.cart, {'1': {'quantity': 6, 'price': '10.00'},
+                                        '2': {'quantity': 4, 'price': '20.00'}})
+        self.assertEqual(RedisCartStorage(self.session, client=self.client).load(), storage.cart)
+        self.assertEqual(storage.get_version(), '4')
+        self.assertGreater(self.client.ttl(storage.get_key('quantities')), 0)
+        self.assertNotIn(settings.CART_SESSION_ID, self.session)
+
+        storage.remove('1')
+        self.assertEqual(list(RedisCartStorage(self.session, client=self.client).load()), ['2'])
+        storage.set_quantity('3', 1, Decimal('30.00'))
+        storage.remove_many(['2', '3'])
+        self.assertEqual(storage.get_version(), '7')
+        self.assertEqual(RedisCartStorage(self.session, client=self.client).load(), {})
+        storage.clear()
+        self.assertEqual(RedisCartStorage(self.session, client=self.client).load(), {})
+
+    def test_cart_services_use_redis_storage(self):
+        """Тестирование корзины анонимного пользователя, хранящейся в Redis"""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.session
+        product = Product.objects.create(name='product', category=Category.objects.create(name='category'))
+        offer = Offer.objects.create(
+            shop=Shop.objects.create(name='shop'), product=product, price=Decimal('100.00'), in_stock=10)
+        with override_settings(CART_STORAGE='cart.storage.RedisCartStorage'), \
+                mock.patch('cart.storage.get_redis_client', return_value=self.client):
+            CartServices(request).update(offer, 2)
+            cart = CartServices(request)
+            self.assertEqual(len(cart), 2)
+            self.assertEqual(cart.get_total_price(), Decimal('200.00'))
+
+    def test_cart_is_moved_to_db_after_login(self):
+        """Тестирование переноса корзины из Redis в БД после входа пользователя, меняющего ключ сессии"""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.session
+        product = Product.objects.create(name='product', category=Category.objects.create(name='category'))
+        offer = Offer.objects.create(
+            shop=Shop.objects.create(name='shop'), product=product, price=Decimal('100.00'), in_stock=10)
+        user = User.objects.create_user(email='buyer@example.com', password='password')
+        with override_settings(CART_STORAGE='cart.storage.RedisCartStorage'), \
+                mock.patch('cart.storage.get_redis_client', return_value=self.client):
+            CartServices(request).update(offer, 2)
+            storage = RedisCartStorage(self.session, client=self.client)
+            session_key = self.session.session_key
+            login(request, user)
+            self.assertNotEqual(request.session.session_key, session_key)
+
+            cart = CartServices(request)
+            self.assertEqual(len(cart), 2)
+            self.assertEqual(list(ProductInCart.objects.filter(cart__user=user).values_list('offer_id', 'quantity')),
+                             [(offer.id, 2)])
+            self.assertEqual(self.client.exists(storage.get_key('quantities'), storage.get_key('prices')), 0)
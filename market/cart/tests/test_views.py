@@ -7,6 +7,7 @@ from django.test import TestCase, Client
 
 from cart.models import Cart
 from config.settings import FIXTURE_DIRS
+from config.testing import QueryBudgetTestMixin
 
 ORIGINAL_JINJA2_RENDERER = Jinja2Template.render
 
@@ -26,7 +27,7 @@ def instrumented_render(template_object, *args, **kwargs):
 Jinja2Template.render = instrumented_render
 
 
-class CartViewTest(TestCase):
+class CartViewTest(QueryBudgetTestMixin, TestCase):
     """Тестирование представлений корзины пользователя."""
 
     fixtures = os.listdir(*FIXTURE_DIRS)
@@ -49,6 +50,10 @@ class CartViewTest(TestCase):
         name = cart_items[1].offer.product.name
         self.assertIn('Евгений Онегин', name)
 
+    def test_cart_view_is_within_query_budget(self):
+        self.client.login(username='admin@admin.ru', password='admin')
+        self.assertWithinQueryBudget(self.client.get(self.url))
+
     def test_update_cart_view(self):
         url = reverse('cart:update_to_cart')
         response = self.client.post(url, {
@@ -66,6 +71,25 @@ class CartViewTest(TestCase):
             'cart_len': '1'
         })
 
+    def test_update_cart_delta_view(self):
+        url = reverse('cart:update_to_cart_delta')
+        self.client.login(username='admin@admin.ru', password='admin')
+        data = {'product_id': 6, 'quantity': 3, 'action': 'update'}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        delta = response.json()
+        self.assertEqual(delta['product_quantity'], '3')
+        self.assertNotIn('disc_price', delta)
+
+        cart_response = self.client.get(self.url)
+        self.assertEqual(delta['cart_total_price'], str(cart_response.context_data['cart_total_price']))
+        self.assertEqual(delta['cart_final_price_with_discount'],
+                         str(cart_response.context_data['cart_final_price_with_discount']))
+
+        with self.assertMaxQueries(12):
+            response = self.client.post(url, data)
+        self.assertJSONEqual(response.content, {'product_id': '6'})
+
     def test_remove_from_cart_view(self):
         url = reverse('cart:remove_from_cart', kwargs={'product_id': 6})
         response = self.client.get(url)
@@ -1,10 +1,11 @@
 from django.urls import path
-from cart.views import CartView, UpdateCartView, RemoveFromCartView
+from cart.views import CartView, UpdateCartView, UpdateCartDeltaView, RemoveFromCartView
 
 app_name = 'cart'
 
 urlpatterns = [
     path('', CartView.as_view(), name='cart'),
     path('update/', UpdateCartView.as_view(), name='update_to_cart'),
+    path('update/delta/', UpdateCartDeltaView.as_view(), name='update_to_cart_delta'),
     path('remove/<int:product_id>', RemoveFromCartView.as_view(), name='remove_from_cart'),
 ]
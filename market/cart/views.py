@@ -1,9 +1,14 @@
+from typing import Dict, Tuple
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
 from django.http import JsonResponse
 from django.views.generic.base import RedirectView, TemplateView, View
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 
-from cart.cart import CartServices
+from cart.cart import get_cart
+from cart.pricing import get_pricing_delta, get_pricing_values
 from shops.models import Offer
 
 
@@ -15,37 +20,42 @@ class CartView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart_services = CartServices(self.request)
-        cart_services.check_cart_products_availability(self.request)
+        cart_services = get_cart(self.request)
+        for warning in cart_services.check_cart_products_availability():
+            messages.warning(self.request, str(warning))
         if cart_services.use_db:
             cart = cart_services.qs
         else:
             cart = cart_services
+        pricing = cart_services.get_pricing()
         context['cart_items'] = cart
-        context['cart_total_price'] = cart_services.get_total_price()
+        context['cart_pricing'] = pricing
+        context['cart_total_price'] = pricing.total_price
         context['shops_by_product'] = cart_services.get_shops_with_products()
-        context['cart_final_price_with_discount'] = cart_services.get_final_price_with_discount()
+        context['cart_final_price_with_discount'] = pricing.final_price
         return context
 
     def post(self, request):
         """ Метод post представления, отвечающего за отображение корзины """
 
-        cart_services = CartServices(request)
+        cart_services = get_cart(request)
         shop_id = request.POST.get('shop_id')
         offer_id = request.POST.get('product_id')
         cart_services.update_shops_with_products(offer_id=offer_id, shop_id=shop_id)
         return redirect("cart:cart")
 
 
-class UpdateCartView(View):
+class CartUpdateMixin:
     """
-    Обнавляет количество товара в корзине
+    Разбор запроса на изменение количества товара в корзине
     """
 
-    def post(self, request):
-        """ Метод post для обновления количества товаров в корзине """
-
-        cart = CartServices(request)
+    def get_update_data(self, request) -> Tuple[Offer, str, bool]:
+        """
+        Получает предложение, количество и способ изменения количества из запроса
+        :param request: запрос
+        :return: предложение, количество, флаг замены количества
+        """
         offer_id = request.POST.get('product_id')
         user_quantity = request.POST.get('quantity')
         offer = get_object_or_404(Offer, id=offer_id)
@@ -54,35 +64,64 @@ class UpdateCartView(View):
 
         if action == "add":
             update_quantity = False
-        if offer.in_stock <= int(user_quantity):
+        if offer.available <= int(user_quantity):
             update_quantity = True
-            user_quantity = offer.in_stock
+            user_quantity = offer.available
+        return offer, user_quantity, update_quantity
+
 
-        if offer_id and user_quantity:
+class UpdateCartView(CartUpdateMixin, View):
+    """
+    Обнавляет количество товара в корзине
+    """
+
+    def post(self, request):
+        """ Метод post для обновления количества товаров в корзине """
+
+        cart = get_cart(request)
+        offer, user_quantity, update_quantity = self.get_update_data(request)
+
+        if user_quantity:
             try:
                 cart.update(offer=offer, quantity=int(user_quantity), update_quantity=update_quantity)
             except ValueError:
-                error_message = f'Извините, но на складе есть, только {offer.in_stock} шт.'
+                error_message = f'Извините, но на складе есть, только {offer.available} шт.'
                 return JsonResponse({'error': error_message}, status=400)
         else:
             error_message = 'Не удалось обновить корзину'
             return JsonResponse({'error': error_message}, status=400)
 
-        product_data = cart.get_product_data(offer_id)
-        if product_data:
-            quantity = product_data['quantity']
-            total_price = product_data['total_price']
-            disc_price = product_data['disc_price']
-            data = {
-                'product_id': str(offer_id),
-                'product_quantity': str(quantity),
-                'disc_price': str(disc_price),
-                'product_total_price': str(total_price),
-                'cart_total_price': str(cart.get_total_price()),
-                'cart_final_price_with_discount': str(cart.get_final_price_with_discount()),
-                'cart_len': str(cart.__len__()),
-            }
-            return JsonResponse(data)
+        return JsonResponse(get_pricing_values(cart.get_pricing(), offer.id))
+
+
+class UpdateCartDeltaView(CartUpdateMixin, View):
+    """
+    Асинхронно обновляет количество товара в корзине и возвращает только изменившиеся значения.
+    Стоимость корзины пересчитывается по предыдущему расчету без повторной загрузки позиций корзины
+    """
+
+    async def post(self, request):
+        """ Метод post для обновления количества товаров в корзине """
+
+        data, status = await sync_to_async(self.update_cart)(request)
+        return JsonResponse(data, status=status)
+
+    def update_cart(self, request) -> Tuple[Dict, int]:
+        """
+        Изменяет количество товара в корзине
+        :param request: запрос
+        :return: данные ответа и код статуса
+        """
+        cart = get_cart(request)
+        offer, user_quantity, update_quantity = self.get_update_data(request)
+        if not user_quantity:
+            return {'error': 'Не удалось обновить корзину'}, 400
+        try:
+            previous_pricing, pricing = cart.update_with_delta(
+                offer=offer, quantity=int(user_quantity), update_quantity=update_quantity)
+        except ValueError:
+            return {'error': f'Извините, но на складе есть, только {offer.available} шт.'}, 400
+        return get_pricing_delta(previous_pricing, pricing, offer.id), 200
 
 
 class RemoveFromCartView(RedirectView):
@@ -93,7 +132,7 @@ class RemoveFromCartView(RedirectView):
 
     def get_redirect_url(self, *args, **kwargs):
         offer_id = self.kwargs['product_id']
-        cart = CartServices(self.request)
+        cart = get_cart(self.request)
         offer = Offer.objects.get(id=offer_id)
         cart.remove(offer=offer)
         return super().get_redirect_url(*args, **kwargs)
@@ -6,13 +6,14 @@ from jinja2 import Template as Jinja2Template
 
 from comparison.comparison import Comparison
 from config.settings import FIXTURE_DIRS
+from config.testing import QueryBudgetTestMixin
 from products.models import Product
 from products.tests.test_views import instrumented_render
 
 Jinja2Template.render = instrumented_render
 
 
-class CompareDetailTest(TestCase):
+class CompareDetailTest(QueryBudgetTestMixin, TestCase):
     """ Класс тестирования представления детальной страницы сравнения """
 
     def setUp(self):
@@ -25,13 +26,16 @@ class CompareDetailTest(TestCase):
     def test_view_renders_desired_template(self):
         self.assertTemplateUsed(self.response, "comparison/compare.j2")
 
+    def test_view_is_within_query_budget(self):
+        self.assertWithinQueryBudget(self.response)
+
     def test_compare_detail_context(self):
         compare = self.response.context
         self.assertIn("compare", compare)
         self.assertIsInstance(compare["compare"], Comparison)
 
 
-class AddCompareViewTest(TestCase):
+class AddCompareViewTest(QueryBudgetTestMixin, TestCase):
     """ Класс тестирования представления для добавления в список сравнения. """
 
     fixtures = os.listdir(*FIXTURE_DIRS)
@@ -48,6 +52,9 @@ class AddCompareViewTest(TestCase):
         self.assertEqual(self.response.status_code, 302)
         self.assertEqual(self.response.url, redirect_url)
 
+    def test_view_is_within_query_budget(self):
+        self.assertWithinQueryBudget(self.response)
+
     def test_view_adds_product_to_compare(self):
         compare = Comparison(self.client)
         compare.add(self.product)
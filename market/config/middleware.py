@@ -0,0 +1,98 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов: количество, суммарное время выполнения и повторяющиеся запросы.
+    Запросы перехватываются через connection.execute_wrapper, поэтому учитываются и при DEBUG = False
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def __enter__(self) -> 'QueryStats':
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def time_ms(self) -> float:
+        """ Суммарное время выполнения запросов в миллисекундах """
+
+        return round(self.time * 1000, 3)
+
+    @property
+    def duplicates(self) -> Dict[str, int]:
+        """ Запросы, выполненные больше одного раза (признак N+1), с количеством выполнений """
+
+        return {sql: count for sql, count in self.statements.most_common() if count > 1}
+
+    @property
+    def duplicates_count(self) -> int:
+        """ Количество лишних выполнений повторяющихся запросов """
+
+        return sum(count - 1 for count in self.duplicates.values())
+
+
+def get_query_budget(view_name: Optional[str]) -> Optional[int]:
+    """
+    Получение допустимого количества запросов для представления из настройки QUERY_BUDGETS
+    :param view_name: имя URL представления с пространством имен, например products:products_by_category
+    :return: количество запросов или QUERY_BUDGET_DEFAULT, если для представления бюджет не задан
+    """
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы каждого запроса к сайту и записывает в лог представления, превысившие
+    бюджет запросов (см. QUERY_BUDGETS). В режиме отладки (QUERY_BUDGET_HEADERS) статистика
+    добавляется в заголовки ответа
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryStats() as stats:
+            response = self.get_response(request)
+        response.query_stats = stats
+
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        budget = get_query_budget(view_name)
+        if budget is not None and stats.count > budget:
+            logger.warning(
+                'Превышен бюджет запросов %s: %s запросов при бюджете %s, %s мс, повторяющихся запросов: %s',
+                view_name or request.path, stats.count, budget, stats.time_ms, stats.duplicates_count,
+                extra={'duplicates': stats.duplicates},
+            )
+        if settings.QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time-Ms'] = str(stats.time_ms)
+            response['X-Query-Duplicates'] = str(stats.duplicates_count)
+        return response
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.sites",
+    "django.contrib.postgres",
     "django_extensions",
     "mptt",
     "taggit",
@@ -72,6 +73,7 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    "config.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -220,6 +222,46 @@ EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 
 CART_SESSION_ID = 'cart'
+CART_VERSION_SESSION_ID = 'cart_version'
+# Хранилище корзины анонимного пользователя: cart.storage.SessionCartStorage или cart.storage.RedisCartStorage
+CART_STORAGE = 'cart.storage.SessionCartStorage'
+CART_REDIS_URL = REDIS_URL
+CART_REDIS_PREFIX = 'cart'
+# Ключ сессии с токеном корзины в Redis, токен не меняется при смене ключа сессии при входе пользователя
+CART_TOKEN_SESSION_ID = 'cart_token'
+# Время хранения корзины в Redis после последнего изменения, секунд
+CART_REDIS_TTL = 60 * 60 * 24 * 14
+# Время кэширования расчета стоимости корзины, секунд
+CART_SNAPSHOT_CACHE_TIME = 60 * 10
+
+# Допустимое количество SQL-запросов на один запрос к представлению (см. config.middleware.QueryBudgetMiddleware),
+# представления, превысившие бюджет, записываются в лог config.middleware. Бюджет проверяется в тестах представлений
+# (QueryBudgetTestMixin.assertWithinQueryBudget) и снижается при каждой оптимизации представления
+QUERY_BUDGETS = {
+    'shops:home': 10,
+    'products:products_by_category': 20,
+    'products:product_detail': 40,
+    'cart:cart': 20,
+    'shops:search': 20,
+    'shops:search-suggest': 2,
+    'users:login_user': 5,
+    'users:register_user': 5,
+    'users:password_reset': 5,
+    'users:set_new_password': 5,
+    'order:step1': 10,
+    'order:step2': 8,
+    'order:step3': 8,
+    'order:step4': 25,
+    'order:detail_order': 10,
+    'order:history': 10,
+    'settings:sales': 5,
+    'comparison:compare-detail': 8,
+    'comparison:add-to-compare': 8,
+}
+# Бюджет представлений, не перечисленных в QUERY_BUDGETS (None - не проверяется)
+QUERY_BUDGET_DEFAULT = None
+# Добавление количества запросов, их времени и количества повторов в заголовки ответа X-Query-*
+QUERY_BUDGET_HEADERS = DEBUG
 DELIVERY_SESSION_ID = 'delivery_id'
 
 # The key for comparing products
@@ -272,6 +314,33 @@ STRIPE_SECRET_KEY = config['STRIPE_SECRET_KEY']
 STRIPE_WEBHOOK_KEY = config['STRIPE_WEBHOOK_KEY']
 
 CELERY_TASK_NAME_1 = 'Импорт товаров'
+CELERY_TASK_NAME_2 = 'Снятие просроченных резервов товаров'
+CELERY_TASK_NAME_3 = 'Построение фасетов каталога'
+CELERY_TASK_NAME_4 = 'Обновление блоков главной страницы'
+
+# Время резервирования товаров неоплаченного заказа, секунд
+STOCK_HOLD_TTL = 60 * 30
+# Интервал обновления блоков главной страницы (популярные товары, горячие предложения, предложение дня), секунд
+HOME_BLOCKS_REFRESH_INTERVAL = 60 * 5
+# Периодические задачи, переносятся в планировщик из базы данных при запуске celery beat
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-stock-holds': {
+        'task': CELERY_TASK_NAME_2,
+        'schedule': 60,  # каждую минуту
+    },
+    'build-category-facets': {
+        'task': CELERY_TASK_NAME_3,
+        'schedule': 60,  # каждую минуту
+    },
+    'refresh-home-blocks': {
+        'task': CELERY_TASK_NAME_4,
+        'schedule': HOME_BLOCKS_REFRESH_INTERVAL,
+    },
+}
 
 # Устанавливаем количество записей для страниц, использующих пагинацию
 PAGINATE_BY = 3
+# Постраничный вывод каталога: 'keyset' - по курсору (ссылки "назад/вперед"), 'offset' - по номеру страницы
+CATALOG_PAGINATION = 'keyset'
+# Вывод количества найденных товаров каталога при выводе по курсору (количество кэшируется до изменения каталога)
+CATALOG_KEYSET_COUNT = True
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+
+from config.middleware import QueryStats, get_query_budget
+
+
+class QueryBudgetTestMixin:
+    """
+    Примесь к тестам представлений для проверки количества SQL-запросов
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, number: int):
+        """
+        Проверяет, что код внутри блока with выполняет не больше number запросов.
+        В сообщении об ошибке перечисляются повторяющиеся запросы
+        :param number: допустимое количество запросов
+        """
+        with QueryStats() as stats:
+            yield stats
+        if stats.count > number:
+            duplicates = '\n'.join(f'{count} x {sql}' for sql, count in stats.duplicates.items())
+            self.fail(f'{stats.count} запросов при допустимых {number}. Повторяющиеся запросы:\n{duplicates}')
+
+    def assertWithinQueryBudget(self, response):
+        """
+        Проверяет, что запрос к представлению уложился в бюджет запросов из настройки QUERY_BUDGETS
+        :param response: ответ тестового клиента
+        """
+        budget = get_query_budget(response.resolver_match.view_name)
+        self.assertIsNotNone(budget, f'Не задан бюджет запросов {response.resolver_match.view_name}')
+        self.assertLessEqual(response.query_stats.count, budget,
+                             f'Превышен бюджет запросов {response.resolver_match.view_name}')
@@ -1,12 +1,16 @@
-from cart.cart import CartServices
+from cart.cart import get_cart
+from django.utils.functional import SimpleLazyObject
 
 
 def cart(request):
     """Контекстный процессор для
-     добавления корзины в контекст шаблонов."""
+     добавления корзины в контекст шаблонов.
+     Значения вычисляются при первом обращении шаблона к ним, поэтому шаблоны
+     без блока корзины не загружают корзину."""
 
-    cart_len = str(CartServices(request).__len__())
-    total_price = str(CartServices(request).get_total_price())
-    final_price_with_discount = str(CartServices(request).get_final_price_with_discount())
-
-    return {'cart_len': cart_len, "total_price": total_price, "final_price_with_discount": final_price_with_discount}
+    return {
+        'cart_len': SimpleLazyObject(lambda: str(len(get_cart(request)))),
+        'total_price': SimpleLazyObject(lambda: str(get_cart(request).get_total_price())),
+        'final_price_with_discount': SimpleLazyObject(
+            lambda: str(get_cart(request).get_final_price_with_discount())),
+    }
@@ -1,25 +1,23 @@
-from shops.models import Offer
+from django.utils.functional import SimpleLazyObject
+from products.services import get_request_category_facets
 
+# URL, для которого выводятся характеристики товаров в фильтре каталога
+CATALOG_VIEW_NAME = 'products:products_by_category'
 
-def properties(request):
-    """ Контекст-процессор для вывода названий и значений свойств товаров конкретной категории в фильтре каталога """
 
-    names_properties = {}
+def properties(request):
+    """
+    Контекст-процессор для вывода названий и значений свойств товаров конкретной категории в фильтре каталога.
+    Значения берутся из фасетов каталога категории, общих с фильтром каталога, только на странице каталога
+    и только при обращении шаблона к ним
+    """
 
-    try:
-        category_id = request.get_full_path().split('/')[2]
-        properties_names_lst = list(
-            Offer.objects.select_related('shop', 'product__category').filter(
-                product__category=category_id).values_list(
-                'product__product_properties__property__name', 'product__product_properties__value'))
-        for value in properties_names_lst:
-            if value[0] not in names_properties:
-                names_properties[value[0]] = {value[1]}
-            else:
-                names_properties[value[0]].add(value[1])
-    except (IndexError, UnboundLocalError, ValueError):
-        pass
+    def get_names_properties():
+        match = request.resolver_match
+        if match is None or match.view_name != CATALOG_VIEW_NAME:
+            return {}
+        return get_request_category_facets(request, match.kwargs['pk']).get_names_properties()
 
     return {
-        'names_properties': names_properties,
+        'names_properties': SimpleLazyObject(get_names_properties),
     }
@@ -12,7 +12,9 @@ from django.utils.translation import gettext_lazy as _
 
 from config.settings import RECIPIENTS_EMAIL, DEFAULT_FROM_EMAIL
 from products.models import Product
+from products.services import bump_catalog_versions, refresh_catalog_entries
 from shops.models import Shop, Offer
+from shops.services import bump_offers_versions
 from users.models import User
 
 logger = logging.getLogger()
@@ -72,6 +74,10 @@ class Imports:
                             price=float(data['price']),
                             in_stock=F('in_stock') + int(data['in_stock'])
                         )
+                        # update не отправляет сигналы моделей, каталог обновляется явно
+                        refresh_catalog_entries(Offer.objects.filter(shop=shop, product=product))
+                        bump_catalog_versions(product.category_id)
+                        bump_offers_versions([product.id])
                         logger_imports.info('Продукт `%data` обновлён', data["name"])
                     else:
                         Offer.objects.update_or_create(
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from orders.models import Order, OrderItem
+from orders.models import Order, OrderItem, StockHold
 
 
 class OrderItemInline(admin.TabularInline):
@@ -14,8 +14,9 @@ class OrderAdmin(admin.ModelAdmin):
     """Используется для настройки отображения
          и поведения модели заказа в Django Admin."""
     list_display = ('id', 'user', 'full_name', 'created', 'updated', 'status', 'payment_date',
-                    'delivery_option', 'delivery_address', 'delivery_city', 'payment_option', 'total_cost')
-    list_filter = ('status', 'created', 'payment_option', 'delivery_option',)
+                    'delivery_option', 'delivery_address', 'delivery_city', 'payment_option', 'total_cost',
+                    'stock_shortage')
+    list_filter = ('status', 'stock_shortage', 'created', 'payment_option', 'delivery_option',)
     inlines = [OrderItemInline]
     search_fields = ('user__username', 'delivery_city')
     ordering = 'id',
@@ -30,5 +31,15 @@ class OrderItemAdmin(admin.ModelAdmin):
     ordering = 'id',
 
 
+class StockHoldAdmin(admin.ModelAdmin):
+    """Используется для настройки отображения
+         модели резерва товара в Django Admin."""
+    list_display = ('id', 'order', 'offer', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    raw_id_fields = ('order', 'offer')
+    ordering = 'expires_at',
+
+
 admin.site.register(Order, OrderAdmin)
 admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(StockHold, StockHoldAdmin)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 07:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0003_offer_held'),
+        ('orders', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='действует до')),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='shops.offer', verbose_name='предложение')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='orders.order', verbose_name='заказ')),
+            ],
+            options={
+                'verbose_name': 'резерв товара',
+                'verbose_name_plural': 'резервы товаров',
+            },
+        ),
+    ]
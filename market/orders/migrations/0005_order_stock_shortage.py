@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_stockhold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stock_shortage',
+            field=models.BooleanField(default=False, verbose_name='нехватка товара при оплате'),
+        ),
+    ]
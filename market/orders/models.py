@@ -42,6 +42,8 @@ class Order(models.Model):
     comment = models.CharField(max_length=200, verbose_name=_('комментарий'))
     offer = models.ManyToManyField(Offer, through='OrderItem', verbose_name=_('предложение'))
     final_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, verbose_name=_("итоговая цена"))
+    # товара не хватило для списания при оплате заказа, резерв которого истек (см. orders.services)
+    stock_shortage = models.BooleanField(default=False, verbose_name=_('нехватка товара при оплате'))
 
     class Meta:
         verbose_name = _('заказ')
@@ -78,3 +80,18 @@ class OrderItem(models.Model):
 
     def get_cost(self):
         return self.offer.price * self.quantity
+
+
+class StockHold(models.Model):
+    """Резерв товара на складе под неоплаченный заказ."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, verbose_name=_('заказ'), related_name='holds')
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, verbose_name=_('предложение'), related_name='holds')
+    quantity = models.PositiveIntegerField(verbose_name=_('количество'))
+    expires_at = models.DateTimeField(db_index=True, verbose_name=_('действует до'))
+
+    class Meta:
+        verbose_name = _('резерв товара')
+        verbose_name_plural = _('резервы товаров')
+
+    def __str__(self):
+        return f'{self.offer_id} x {self.quantity}'
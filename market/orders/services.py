@@ -1,11 +1,104 @@
-from orders.models import OrderItem, Order
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from orders.models import OrderItem, Order, StockHold
+from products.services import refresh_catalog_entries
+from shops.models import Offer
+from shops.services import bump_offers_versions
 
-def add_items_from_cart(order: Order, cart):
-    cart_items = cart.qs
+logger = logging.getLogger(__name__)
+
+
+class StockReservationError(Exception):
+    """Товара на складе недостаточно для резервирования."""
+
+
+def add_items_from_cart(order: Order, cart) -> List[OrderItem]:
+    cart_items = cart.qs.select_related('offer__product')
     order_items = [OrderItem(
         order=order,
         offer=item.offer,
         quantity=item.quantity,
     ) for item in cart_items]
-    OrderItem.objects.bulk_create(order_items)
+    return OrderItem.objects.bulk_create(order_items)
+
+
+def reserve_order_items(order: Order, order_items: List[OrderItem]) -> List[StockHold]:
+    """
+    Резервирование товаров заказа. Резерв увеличивается условным запросом, который выполняется,
+    только если доступного товара достаточно, поэтому параллельные заказы не могут зарезервировать больше наличия.
+    Вызывается внутри транзакции: при нехватке товара резервы, сделанные для других позиций, откатываются
+    :param order: заказ
+    :param order_items: позиции заказа
+    :return: резервы товаров
+    """
+    expires_at = datetime.now(tz=timezone.utc) + timedelta(seconds=settings.STOCK_HOLD_TTL)
+    holds = []
+    for item in order_items:
+        reserved = Offer.objects.filter(pk=item.offer_id, in_stock__gte=F('held') + item.quantity).update(
+            held=F('held') + item.quantity)
+        if not reserved:
+            raise StockReservationError(
+                f'Извините, товара {item.offer.product.name} нет на складе в количестве {item.quantity} шт.')
+        holds.append(StockHold(order=order, offer_id=item.offer_id, quantity=item.quantity, expires_at=expires_at))
+    holds = StockHold.objects.bulk_create(holds)
+    # резервы изменяются запросами update, без сигналов моделей
+    bump_offers_versions(item.offer.product_id for item in order_items)
+    return holds
+
+
+def confirm_order_holds(order_id: int) -> List[OrderItem]:
+    """
+    Списание товаров оплаченного заказа со склада. Резервы заказа удаляются, что снимает резерв с предложений
+    (см. orders.signals). Товар с действующим резервом списывается безусловно, товар с истекшим резервом -
+    условным запросом, только если его хватает без учета резервов других заказов. Позиции, товара для которых
+    не хватило, не списываются, а заказ отмечается признаком stock_shortage
+    :param order_id: id заказа
+    :return: позиции заказа, товара для которых не хватило
+    """
+    with transaction.atomic():
+        # резервы заказа блокируются, чтобы их не снял параллельно release_expired_holds
+        held = Counter()
+        for offer_id, quantity in StockHold.objects.select_for_update().filter(order_id=order_id).values_list(
+                'offer_id', 'quantity'):
+            held[offer_id] += quantity
+        shortage = []
+        items = list(OrderItem.objects.select_related('offer__product').filter(order_id=order_id))
+        for item in items:
+            offers = Offer.objects.filter(pk=item.offer_id)
+            if held[item.offer_id] >= item.quantity:
+                held[item.offer_id] -= item.quantity
+            else:
+                offers = offers.filter(in_stock__gte=F('held') - held[item.offer_id] + item.quantity)
+                held[item.offer_id] = 0
+            if not offers.update(in_stock=F('in_stock') - item.quantity):
+                shortage.append(item)
+        StockHold.objects.filter(order_id=order_id).delete()
+        if shortage:
+            Order.objects.filter(pk=order_id).update(stock_shortage=True)
+            logger.error('Недостаточно товара для списания по оплаченному заказу %s: %s', order_id,
+                         ', '.join(f'{item.offer.product.name} ({item.quantity} шт.)' for item in shortage))
+        # статус заказа и остатки изменяются запросами update, без сигналов моделей
+        bump_offers_versions(item.offer.product_id for item in items)
+        refresh_catalog_entries(Offer.objects.filter(
+            pk__in=OrderItem.objects.filter(order_id=order_id).values('offer_id')))
+    return shortage
+
+
+def release_expired_holds() -> int:
+    """
+    Снятие резервов товаров, срок действия которых истёк
+    :return: количество снятых резервов
+    """
+    with transaction.atomic():
+        # резервы, которые в этот момент списываются оплатой, пропускаются
+        expired_hold_ids = list(StockHold.objects.select_for_update(skip_locked=True).filter(
+            expires_at__lte=datetime.now(tz=timezone.utc)).values_list('id', flat=True))
+        StockHold.objects.filter(id__in=expired_hold_ids).delete()
+    return len(expired_hold_ids)
@@ -0,0 +1,14 @@
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from orders.models import StockHold
+from shops.models import Offer
+from shops.services import bump_offers_versions
+
+
+@receiver(post_delete, sender=StockHold)
+def release_stock_hold(sender, instance, **kwargs):
+    """Снятие резерва товара при удалении резерва: по истечении срока, после оплаты или вместе с заказом."""
+    Offer.objects.filter(pk=instance.offer_id).update(held=F('held') - instance.quantity)
+    bump_offers_versions(Offer.objects.filter(pk=instance.offer_id).values_list('product_id', flat=True))
@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from config.settings import CELERY_TASK_NAME_2
+from orders.services import release_expired_holds
+
+
+@shared_task(name=CELERY_TASK_NAME_2)
+def release_expired_holds_task(*args, **kwargs):
+    """Задача на снятие резервов товаров, срок действия которых истёк."""
+    return f'Снято резервов: {release_expired_holds()}'
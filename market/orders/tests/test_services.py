@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, StockHold
+from orders.services import (StockReservationError, confirm_order_holds, release_expired_holds,
+                             reserve_order_items)
+from users.models import User
+from shops.models import Offer, Shop
+from products.models import Product, Category
+
+
+class StockHoldServicesTest(TestCase):
+    """Класс теста резервирования товаров заказа"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='ivan', email='ivan@mail.ru', password='Password123')
+        cls.category = Category.objects.create(name='Category 1', description="Description 1")
+        cls.product = Product.objects.create(name='Product 1', category=cls.category)
+        cls.shop = Shop.objects.create(name='Shop 1', user=cls.user)
+        cls.offer = Offer.objects.create(shop=cls.shop, product=cls.product, price=90, in_stock=5)
+
+    def create_order(self, quantity):
+        """Создание заказа с одной позицией"""
+        order = Order.objects.create(user=self.user, status='created', delivery_option='Delivery',
+                                     delivery_address='Novgorod', delivery_city='Moscow',
+                                     payment_option='Online Card', comment='Comment 1')
+        return order, [OrderItem.objects.create(order=order, offer=self.offer, quantity=quantity)]
+
+    def test_reserve_order_items(self):
+        """Тестирование резервирования товара и отказа при нехватке доступного товара"""
+        reserve_order_items(*self.create_order(3))
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.held, self.offer.available), (3, 2))
+
+        with self.assertRaises(StockReservationError):
+            reserve_order_items(*self.create_order(3))
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.held, 3)
+
+    def test_release_expired_holds(self):
+        """Тестирование снятия резервов с истекшим сроком действия"""
+        holds = reserve_order_items(*self.create_order(2))
+        reserve_order_items(*self.create_order(1))
+        StockHold.objects.filter(pk=holds[0].pk).update(expires_at=datetime.now(tz=timezone.utc) - timedelta(1))
+
+        self.assertEqual(release_expired_holds(), 1)
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.in_stock, self.offer.held), (5, 1))
+
+    def test_confirm_order_holds(self):
+        """Тестирование списания зарезервированного товара после оплаты заказа"""
+        order, order_items = self.create_order(2)
+        reserve_order_items(order, order_items)
+
+        confirm_order_holds(order.pk)
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.in_stock, self.offer.held), (3, 0))
+        self.assertFalse(StockHold.objects.filter(order=order).exists())
+
+    def test_confirm_order_without_hold_does_not_oversell(self):
+        """Тестирование оплаты заказа с истекшим резервом, товар которого зарезервирован другим заказом"""
+        order, order_items = self.create_order(3)
+        holds = reserve_order_items(order, order_items)
+        StockHold.objects.filter(pk=holds[0].pk).update(expires_at=datetime.now(tz=timezone.utc) - timedelta(1))
+        release_expired_holds()
+        reserve_order_items(*self.create_order(4))
+
+        shortage = confirm_order_holds(order.pk)
+        self.offer.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual([item.pk for item in shortage], [order_items[0].pk])
+        self.assertEqual((self.offer.in_stock, self.offer.held), (5, 4))
+        self.assertTrue(order.stock_shortage)
+
+    def test_confirm_order_without_hold_with_enough_stock(self):
+        """Тестирование списания товара по заказу с истекшим резервом при достаточном наличии"""
+        order, order_items = self.create_order(2)
+        holds = reserve_order_items(order, order_items)
+        StockHold.objects.filter(pk=holds[0].pk).update(expires_at=datetime.now(tz=timezone.utc) - timedelta(1))
+        release_expired_holds()
+
+        self.assertEqual(confirm_order_holds(order.pk), [])
+        self.offer.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((self.offer.in_stock, self.offer.held), (3, 0))
+        self.assertFalse(order.stock_shortage)
@@ -1,10 +1,14 @@
+from django.db.models import F
 from django.test import signals
 from django.urls import reverse
 from jinja2 import Template as Jinja2Template
 from django.test import TestCase, Client
 
 from cart.cart import CartServices
+from cart.pricing import CartPricingEngine
+from config.testing import QueryBudgetTestMixin
 from orders.models import Order
+from shops.models import Offer
 from users.models import User
 
 ORIGINAL_JINJA2_RENDERER = Jinja2Template.render
@@ -46,7 +50,7 @@ class UpdateSessionMixin:  # позволяет избежать повтора
         session.save()
 
 
-class TestOrderViews(TestCase):
+class TestOrderViews(QueryBudgetTestMixin, TestCase):
     """
     Тест представлений оформления заказа
     """
@@ -131,8 +135,16 @@ class TestOrderViews(TestCase):
         self.assertTemplateUsed(response, "order/history.j2")
         self.assertEqual(response.status_code, 200)
 
+    def test_views_are_within_query_budget(self):
+        """ Тестирование количества запросов к БД на страницах оформления заказа и истории заказов """
 
-class Step4ViewTestCase(TestCase, UpdateSessionMixin):
+        self.client.login(username='test@test.ru', password='2304test')
+        for url in (reverse('order:step1'), reverse('order:step2'), reverse('order:step3'),
+                    reverse('order:detail_order', kwargs={'pk': self.order.pk}), reverse('order:history')):
+            self.assertWithinQueryBudget(self.client.get(url))
+
+
+class Step4ViewTestCase(QueryBudgetTestMixin, TestCase, UpdateSessionMixin):
     """
     Тест представления 4 шага оформления заказа
     """
@@ -165,6 +177,7 @@ class Step4ViewTestCase(TestCase, UpdateSessionMixin):
         })
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Order.objects.count(), 1)
+        self.assertWithinQueryBudget(response)
 
     def test_order_price_is_correct(self):
         """ Тестирование корректности цены заказа """
@@ -183,3 +196,21 @@ class Step4ViewTestCase(TestCase, UpdateSessionMixin):
         self.cart = CartServices(self.request)
         delivery_price = self.cart.get_delivery_cost()
         self.assertEqual(total_order_price, cart_price + delivery_price)
+
+    def test_order_price_uses_current_offer_prices(self):
+        """ Тестирование расчета цены заказа по ценам предложений, измененным после показа 4 шага """
+
+        self.client.login(username='admin@admin.ru', password='admin')
+        self.update_session(self.client.session)
+        cart = CartServices(self.client.request().wsgi_request)
+        # расчет кэшируется только для корзины, которая уже изменялась
+        cart.invalidate()
+        response = self.client.get(self.url)
+        shown_price = response.context['get_final_price_with_discount'] + response.context['get_delivery_cost']
+        Offer.objects.filter(id__in=cart.qs.values('offer_id')).update(price=F('price') + 100)
+        pricing = CartPricingEngine().calculate(cart.get_items())
+        expected_price = pricing.final_price + cart.calculate_delivery_cost(pricing.total_price)
+
+        self.client.post(self.url, {'comment': 'This is a test comment'})
+        self.assertNotEqual(expected_price, shown_price)
+        self.assertEqual(Order.objects.get().final_price, expected_price)
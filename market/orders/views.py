@@ -1,5 +1,4 @@
-from cart.cart import CartServices
-from cart.models import ProductInCart
+from cart.cart import get_cart
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -11,7 +10,7 @@ from django.views import View
 from django.views.generic import FormView, CreateView, DetailView, ListView
 from orders.forms import UserForm, DeliveryForm, PaymentForm, CommentForm
 from orders.models import Order
-from orders.services import add_items_from_cart
+from orders.services import StockReservationError, add_items_from_cart, reserve_order_items
 from users.models import User
 from users.services import create_user, normalize_email
 
@@ -69,7 +68,7 @@ class Step1View(View):
                     authenticated_user = authenticate(request, email=user_data['email'], password=password1)
                     if authenticated_user is not None:
                         login(request, authenticated_user)
-            cart = CartServices(request)
+            cart = get_cart(request)
             cart.add_user_data(form)
             return redirect('order:step2')
         return render(request, self.template_name, {'form': form})
@@ -90,7 +89,7 @@ class Step2View(LoginRequiredMixin, FormView):
             'delivery_address': form.cleaned_data['delivery_address'],
             'delivery_city': form.cleaned_data['delivery_city']
         }
-        cart = CartServices(self.request)
+        cart = get_cart(self.request)
         cart.add_shipping_data(form)
 
         return super().form_valid(form)
@@ -109,7 +108,7 @@ class Step3View(LoginRequiredMixin, FormView):
         payment_data = {  # noqa F841
             'payment_option': form.cleaned_data['payment_option'],
         }
-        cart = CartServices(self.request)
+        cart = get_cart(self.request)
         cart.add_payment_data(form)
         return super().form_valid(form)
 
@@ -124,16 +123,29 @@ class Step4View(LoginRequiredMixin, CreateView):
     login_url = reverse_lazy('users:login_user')
 
     def get_queryset(self):
-        cart = CartServices(self.request)
-        return ProductInCart.objects.filter(cart=cart).select_related('offer')
+        return get_cart(self.request).qs.select_related('offer')
 
     def get_success_url(self):
         order_id = Order.objects.filter(user_id=self.request.user.pk).first()
         return reverse('payment:payment_view', args=[order_id.id])
 
     def form_valid(self, form):
-        cart = CartServices(self.request)
+        cart = get_cart(self.request)
 
+        try:
+            self.create_order(form, cart)
+        except StockReservationError as error:
+            messages.error(self.request, str(error))
+            return redirect('cart:cart')
+        return super().form_valid(form)
+
+    def create_order(self, form, cart) -> None:
+        """
+        Создание заказа из корзины с резервированием товаров
+        :param form: форма комментария к заказу
+        :param cart: корзина пользователя
+        :return: None
+        """
         with transaction.atomic():
             self.object = form.save(commit=False)
             self.object.user = self.request.user
@@ -144,15 +156,18 @@ class Step4View(LoginRequiredMixin, CreateView):
             self.object.delivery_city = cart.get_shipping_data()['delivery_city']
             self.object.payment_option = cart.get_payment_data()['payment_option']
             self.object.comment = form.cleaned_data['comment']
-            self.object.final_price = cart.get_final_price_with_discount() + cart.get_delivery_cost()
+            # закэшированный расчет корзины может не учитывать последние изменения цен, стоимость заказа
+            # рассчитывается заново
+            snapshot = cart.refresh_snapshot()
+            self.object.final_price = snapshot.pricing.final_price + snapshot.delivery_cost
             self.object.save()
-            add_items_from_cart(self.object, cart)
+            order_items = add_items_from_cart(self.object, cart)
+            reserve_order_items(self.object, order_items)
             cart.clear()
-        return super().form_valid(form)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart = CartServices(self.request)
+        cart = get_cart(self.request)
         context['order_items'] = cart.qs
         context['get_total_price'] = cart.get_total_price()
         context['get_final_price_with_discount'] = cart.get_final_price_with_discount()
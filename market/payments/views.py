@@ -4,7 +4,6 @@ from datetime import datetime
 import stripe
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import F
 from django.http import JsonResponse, HttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.views import View
@@ -12,7 +11,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView
 
 from orders.models import Order, OrderItem
-from shops.models import Offer
+from orders.services import confirm_order_holds
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -123,9 +122,7 @@ def stripe_webhook(request):
 
         # устанавливаем статус заказа и время оплаты
         Order.objects.filter(pk=order_id).update(status=Order.STATUS_CHOICES[1][0], payment_date=datetime.now())
-        # списываем товар со склада
-        items = OrderItem.objects.prefetch_related('offer').filter(order_id=order_id)
-        for item in items:
-            Offer.objects.filter(pk=item.offer.pk).update(in_stock=F('in_stock') - item.quantity)
+        # списываем товар со склада и снимаем резерв заказа
+        confirm_order_holds(order_id)
 
     return HttpResponse(status=200)
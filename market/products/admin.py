@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django_mptt_admin.admin import DjangoMpttAdmin
-from products.models import Category, Product, ProductImage, ProductProperty, Property, ProductTag
+from products.models import CatalogEntry, Category, Product, ProductImage, ProductProperty, Property, ProductTag
 
 
 class CategoryAdmin(DjangoMpttAdmin):
@@ -48,7 +48,22 @@ class ProductTagAdmin(admin.ModelAdmin):
         return ", ".join(o.name for o in obj.tags.all())
 
 
+class CatalogEntryAdmin(admin.ModelAdmin):
+    """Регистрация модели CatalogEntry в админке, записи только для просмотра"""
+    list_display = 'offer_id', 'product_name', 'category', 'shop', 'price', 'discount_price', 'reviews_count', \
+        'purchases_count', 'in_stock'
+    list_filter = 'category', 'shop'
+    search_fields = 'product_name',
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Property, PropertyAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductTag, ProductTagAdmin)
+admin.site.register(CatalogEntry, CatalogEntryAdmin)
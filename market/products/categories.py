@@ -0,0 +1,191 @@
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.urls import reverse
+from products.models import Category
+
+
+class CategoryNode(NamedTuple):
+    """ Категория в снимке дерева категорий """
+
+    id: int
+    name: str
+    parent_id: Optional[int]
+    tree_id: int
+    lft: int
+    rght: int
+    level: int
+    # id дочерних категорий в порядке дерева
+    children: Tuple[int, ...]
+    # id категории и всех ее потомков
+    descendant_ids: FrozenSet[int]
+
+    @property
+    def pk(self) -> int:
+        """ id категории, как у модели Category """
+
+        return self.id
+
+    def get_absolute_url(self) -> str:
+        """ Метод для получения url страницы каталога категории """
+
+        return reverse('products:products_by_category', kwargs={'pk': self.id})
+
+    def __str__(self):
+        return self.name
+
+
+class MenuItem(NamedTuple):
+    """ Пункт меню категорий """
+
+    id: int
+    name: str
+    # путь к иконке категории в статических файлах
+    icon: str
+    children: Tuple['MenuItem', ...]
+
+
+# снимок дерева категорий, хранимый в памяти процесса: (версия, снимок)
+_local_tree: Tuple[Optional[str], Optional['CategoryTree']] = (None, None)
+
+
+class CategoryTree(NamedTuple):
+    """
+    Снимок дерева категорий (MPTT), строится одним запросом и хранится в кэше и в памяти процесса
+    под версией, которая меняется при изменении категорий.
+    Заменяет запросы get_children, get_ancestors и get_descendants при выводе каталога и меню
+    """
+
+    nodes: Dict[int, CategoryNode]
+    # id корневых категорий в порядке дерева
+    roots: Tuple[int, ...]
+    # меню категорий из вложенных кортежей
+    menu: Tuple[MenuItem, ...]
+
+    @classmethod
+    def get_version_key(cls) -> str:
+        """
+        Формирование ключа кэша версии снимка. В ключ входит имя базы данных, чтобы тестовая
+        и рабочая базы, использующие общий файловый кэш, не получали снимки друг друга
+        :return: ключ
+        """
+        return f'category_tree_version:{connection.settings_dict["NAME"]}'
+
+    @classmethod
+    def get_version(cls) -> str:
+        """
+        Получение текущей версии снимка дерева категорий
+        :return: версия
+        """
+        version = cache.get(cls.get_version_key())
+        if version is None:
+            version = cls.invalidate()
+        return version
+
+    @classmethod
+    def get(cls) -> 'CategoryTree':
+        """
+        Получение снимка дерева категорий: из памяти процесса, если его версия совпадает с версией в кэше,
+        иначе из кэша или построением. Обычно стоит одного чтения версии из кэша и ни одного запроса к БД
+        :return: CategoryTree
+        """
+        global _local_tree
+        version = cls.get_version()
+        local_version, tree = _local_tree
+        if local_version == version:
+            return tree
+        cache_key = f'category_tree:{version}'
+        tree = cache.get(cache_key)
+        if tree is None:
+            tree = cls.build()
+            cache.set(cache_key, tree, None)
+        _local_tree = (version, tree)
+        return tree
+
+    @classmethod
+    def build(cls) -> 'CategoryTree':
+        """
+        Построение снимка дерева категорий одним запросом
+        :return: CategoryTree
+        """
+        rows = list(Category.objects.order_by('tree_id', 'lft').values_list(
+            'id', 'name', 'parent_id', 'tree_id', 'lft', 'rght', 'level'))
+        ids = {row[0] for row in rows}
+        children = {row[0]: [] for row in rows}
+        descendants = {row[0]: {row[0]} for row in rows}
+        parents = {row[0]: row[2] for row in rows}
+        for category_id, _, parent_id, *_ in rows:
+            if parent_id in ids:
+                children[parent_id].append(category_id)
+            # категория добавляется в потомки всех предков
+            ancestor_id = parent_id
+            while ancestor_id in ids:
+                descendants[ancestor_id].add(category_id)
+                ancestor_id = parents[ancestor_id]
+        nodes = {
+            category_id: CategoryNode(category_id, name, parent_id, tree_id, lft, rght, level,
+                                      children=tuple(children[category_id]),
+                                      descendant_ids=frozenset(descendants[category_id]))
+            for category_id, name, parent_id, tree_id, lft, rght, level in rows
+        }
+        roots = tuple(category_id for category_id, _, parent_id, *_ in rows if parent_id not in ids)
+
+        def get_menu_item(category_id: int) -> MenuItem:
+            node = nodes[category_id]
+            return MenuItem(node.id, node.name, f'img/icons/departments/{node.name}.svg',
+                            tuple(get_menu_item(child_id) for child_id in node.children))
+
+        return cls(nodes=nodes, roots=roots, menu=tuple(get_menu_item(category_id) for category_id in roots))
+
+    @classmethod
+    def invalidate(cls) -> str:
+        """
+        Смена версии снимка дерева категорий. Версия меняется повторно после фиксации транзакции:
+        другие процессы могли построить снимок по старым данным
+        :return: новая версия
+        """
+        version = uuid4().hex
+        cache.set(cls.get_version_key(), version, None)
+        transaction.on_commit(lambda: cache.set(cls.get_version_key(), uuid4().hex, None))
+        return version
+
+    def get_roots(self) -> List[CategoryNode]:
+        """ Корневые категории """
+
+        return [self.nodes[category_id] for category_id in self.roots]
+
+    def get_children(self, category_id: int) -> List[CategoryNode]:
+        """
+        Дочерние категории
+        :param category_id: id категории
+        :return: список категорий
+        """
+        node = self.nodes.get(category_id)
+        return [self.nodes[child_id] for child_id in node.children] if node else []
+
+    def get_ancestors(self, category_id: int, include_self: bool = False) -> List[CategoryNode]:
+        """
+        Предки категории от корня
+        :param category_id: id категории
+        :param include_self: включить саму категорию
+        :return: список категорий
+        """
+        ancestors = []
+        node = self.nodes.get(category_id)
+        if node and include_self:
+            ancestors.append(node)
+        while node and node.parent_id in self.nodes:
+            node = self.nodes[node.parent_id]
+            ancestors.append(node)
+        return ancestors[::-1]
+
+    def get_descendant_ids(self, category_id: int) -> List[int]:
+        """
+        id категории и всех ее потомков для фильтра category_id IN (...)
+        :param category_id: id категории
+        :return: отсортированный список id, пустой для неизвестной категории
+        """
+        node = self.nodes.get(category_id)
+        return sorted(node.descendant_ids) if node else []
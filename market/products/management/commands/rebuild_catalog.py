@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+
+from products.search import update_search_vectors
+from products.services import rebuild_catalog_entries
+
+
+class Command(BaseCommand):
+    """
+    Кастомная команда Джанго, для полного перестроения записей каталога (CatalogEntry)
+    и поисковых векторов товаров.
+    """
+
+    def handle(self, *args, **kwargs):
+        """Логика выполнения команды."""
+        self.stdout.write(_('Перестроение каталога запущено...'))
+        count = rebuild_catalog_entries()
+        self.stdout.write(_('Перестроение каталога завершено, записей: ') + str(count))
+        count = update_search_vectors()
+        self.stdout.write(_('Перестроение поисковых векторов завершено, товаров: ') + str(count))
@@ -0,0 +1,87 @@
+# Generated by Django 4.2 on 2026-10-18 07:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_catalog_entries(apps, schema_editor):
+    """
+    Заполнение записей каталога для существующих предложений по историческим моделям.
+    Цена со скидкой рассчитывается кодом скидок приложения, поэтому здесь она равна цене предложения;
+    действующие скидки применяет команда rebuild_catalog, которую нужно выполнить после миграции
+    """
+    Offer = apps.get_model('shops', 'Offer')
+    Reviews = apps.get_model('reviews', 'Reviews')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    CatalogEntry = apps.get_model('products', 'CatalogEntry')
+    reviews_count = Reviews.objects.filter(product_id=OuterRef('product_id')).order_by().values(
+        'product_id').annotate(count=Count('id')).values('count')
+    purchases_count = OrderItem.objects.filter(offer_id=OuterRef('pk'), order__status='paid').order_by().values(
+        'offer_id').annotate(count=Sum('quantity')).values('count')
+    rows = Offer.objects.order_by().values(
+        'id', 'product_id', 'product__category_id', 'shop_id', 'product__name', 'price', 'created', 'in_stock',
+    ).annotate(
+        reviews_count=Coalesce(Subquery(reviews_count, output_field=IntegerField()), Value(0)),
+        purchases_count=Coalesce(Subquery(purchases_count, output_field=IntegerField()), Value(0)),
+    )
+    CatalogEntry.objects.bulk_create([
+        CatalogEntry(
+            offer_id=row['id'], category_id=row['product__category_id'], shop_id=row['shop_id'],
+            product_id=row['product_id'], product_name=row['product__name'], price=row['price'],
+            discount_price=row['price'], reviews_count=row['reviews_count'],
+            purchases_count=row['purchases_count'], created=row['created'], in_stock=row['in_stock'],
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0003_offer_held'),
+        ('products', '0001_initial'),
+        ('orders', '0004_stockhold'),
+        ('reviews', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('offer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='shops.offer', verbose_name='предложение')),
+                ('product_name', models.CharField(max_length=512, verbose_name='наименование продукта')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='цена')),
+                ('discount_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='цена со скидкой')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='количество отзывов')),
+                ('purchases_count', models.PositiveIntegerField(default=0, verbose_name='количество покупок')),
+                ('created', models.DateTimeField(verbose_name='создано')),
+                ('in_stock', models.IntegerField(default=0, verbose_name='наличие')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='products.category', verbose_name='категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='products.product', verbose_name='продукт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='shops.shop', verbose_name='магазин')),
+            ],
+            options={
+                'verbose_name': 'запись каталога',
+                'verbose_name_plural': 'записи каталога',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'price'], name='products_ca_categor_c2efb3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'created'], name='products_ca_categor_6a5bb5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'reviews_count'], name='products_ca_categor_4deedb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'purchases_count'], name='products_ca_categor_8a147d_idx'),
+        ),
+        migrations.RunPython(fill_catalog_entries, migrations.RunPython.noop),
+    ]
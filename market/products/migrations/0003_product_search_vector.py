@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-18 07:24
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField
+
+
+def fill_search_vectors(apps, schema_editor):
+    """
+    Заполнение поисковых векторов существующих товаров одним запросом UPDATE по историческим моделям:
+    название (вес A), теги (вес B), значения характеристик (вес C) и описание (вес D)
+    """
+    Product = apps.get_model('products', 'Product')
+    ProductTag = apps.get_model('products', 'ProductTag')
+    ProductProperty = apps.get_model('products', 'ProductProperty')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    # в исторических моделях нет обобщенной связи TaggableManager, теги выбираются по TaggedItem напрямую
+    tags = TaggedItem.objects.filter(
+        content_type__app_label='products', content_type__model='producttag',
+        object_id__in=ProductTag.objects.filter(products=OuterRef(OuterRef('pk'))).values('pk'),
+    ).order_by().values('content_type').annotate(text=StringAgg('tag__name', ' ')).values('text')
+    properties = ProductProperty.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        text=StringAgg('value', ' ')).values('text')
+    Product.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector(Subquery(tags, output_field=TextField()), weight='B', config='russian')
+        + SearchVector(Subquery(properties, output_field=TextField()), weight='C', config='russian')
+        + SearchVector('description', weight='D', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0005_auto_20220424_2025'),
+        ('products', '0002_catalogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
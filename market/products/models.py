@@ -1,6 +1,8 @@
 import os
 from datetime import datetime
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
@@ -33,10 +35,16 @@ class Product(SoftDeleteModel):
     created = models.DateTimeField(auto_now_add=True, verbose_name=_('создан'))
     updated = models.DateTimeField(auto_now=True, verbose_name=_('обновлён'))
     tags = models.ManyToManyField('ProductTag', blank=True, related_name='products', verbose_name=_("теги"))
+    # поисковый вектор названия, тегов, значений характеристик и описания (см. products.search)
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name=_('поисковый вектор'))
 
     class Meta:
         verbose_name = _('продукт')
         verbose_name_plural = _('продукты')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def get_absolute_url(self):
         """ Метод для получения url детальной страницы товара """
@@ -109,6 +117,7 @@ class Category(MPTTModel, SoftDeleteModel):
     class Meta:
         verbose_name = _('категория')
         verbose_name_plural = _('категории')
+        indexes = [GinIndex(fields=['name'], name='category_name_trgm_idx', opclasses=['gin_trgm_ops'])]
 
     def get_absolute_url(self):
         """ Метод для получения url страницы каталога конкретной категории товаров """
@@ -130,3 +139,39 @@ class ProductTag(models.Model):
 
     def __str__(self):
         return ', '.join(self.tags.names())
+
+
+class CatalogEntry(models.Model):
+    """
+    Запись каталога: денормализованные данные предложения для фильтрации и сортировки каталога
+    без соединений и агрегаций. Обновляется при изменении предложений, товаров, отзывов, заказов
+    и скидок (см. products.signals), полностью перестраивается командой rebuild_catalog
+    """
+    offer = models.OneToOneField('shops.Offer', on_delete=models.CASCADE, primary_key=True,
+                                 related_name='catalog_entry', verbose_name=_('предложение'))
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='catalog_entries',
+                                 verbose_name=_('категория'))
+    shop = models.ForeignKey('shops.Shop', on_delete=models.CASCADE, related_name='catalog_entries',
+                             verbose_name=_('магазин'))
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='catalog_entries',
+                                verbose_name=_('продукт'))
+    product_name = models.CharField(max_length=512, verbose_name=_('наименование продукта'))
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('цена'))
+    discount_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('цена со скидкой'))
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name=_('количество отзывов'))
+    purchases_count = models.PositiveIntegerField(default=0, verbose_name=_('количество покупок'))
+    created = models.DateTimeField(verbose_name=_('создано'))
+    in_stock = models.IntegerField(default=0, verbose_name=_('наличие'))
+
+    class Meta:
+        verbose_name = _('запись каталога')
+        verbose_name_plural = _('записи каталога')
+        indexes = [
+            models.Index(fields=['category', 'price']),
+            models.Index(fields=['category', 'created']),
+            models.Index(fields=['category', 'reviews_count']),
+            models.Index(fields=['category', 'purchases_count']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} | {self.shop_id} | {self.price}'
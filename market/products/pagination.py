@@ -0,0 +1,177 @@
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, QuerySet
+from django.http import QueryDict
+from products.models import CatalogEntry
+from products.services import get_catalog_offers
+from shops.models import Offer
+
+# параметр запроса с курсором страницы каталога
+CURSOR_PARAM = 'cursor'
+# соль подписи курсоров, чтобы курсор нельзя было подделать или перенести из другого места сайта
+CURSOR_SALT = 'products.catalog.cursor'
+# сортировка каталога по умолчанию
+DEFAULT_SORT = '-created'
+# поля записи каталога, по которым строится курсор для каждого ключа сортировки
+KEYSET_SORT_FIELDS = {
+    'price': 'price',
+    'created': 'created',
+    'reviews': 'reviews_count',
+    'popularity': 'purchases_count',
+}
+
+
+class KeysetPage(NamedTuple):
+    """ Страница каталога при постраничном выводе по курсору """
+
+    object_list: List[Offer]
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        """ Есть ли следующая страница """
+
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        """ Есть ли предыдущая страница """
+
+        return self.previous_cursor is not None
+
+
+def is_keyset_mode(params: QueryDict) -> bool:
+    """
+    Проверка, выводится ли каталог по курсору: режим задается настройкой CATALOG_PAGINATION,
+    ссылки с номером страницы (page) продолжают работать в режиме постраничного вывода по смещению
+    :param params: параметры запроса
+    :return: True, если страница выводится по курсору
+    """
+    if CURSOR_PARAM in params:
+        return True
+    return settings.CATALOG_PAGINATION == 'keyset' and 'page' not in params
+
+
+def get_sort_param(params: QueryDict) -> Optional[str]:
+    """
+    Получение значения параметра sort_by. При повторе параметра используется первое значение,
+    как в фильтре каталога (ProductFilter.multiple_sorting_method)
+    :param params: параметры запроса
+    :return: значение параметра или None
+    """
+    values = params.getlist('sort_by')
+    return values[0] if values else None
+
+
+def get_sort(params: QueryDict) -> Tuple[str, bool]:
+    """
+    Получение поля сортировки записи каталога и ее направления из параметра sort_by
+    :param params: параметры запроса
+    :return: поле и признак сортировки по убыванию
+    """
+    sort = get_sort_param(params) or DEFAULT_SORT
+    field = KEYSET_SORT_FIELDS.get(sort.lstrip('-'), KEYSET_SORT_FIELDS[DEFAULT_SORT.lstrip('-')])
+    return field, sort.startswith('-')
+
+
+def encode_cursor(field: str, sort_key, offer_id: int, backwards: bool = False) -> str:
+    """
+    Формирование непрозрачного подписанного курсора по значению ключа сортировки и id предложения
+    :param field: поле сортировки
+    :param sort_key: значение ключа сортировки предложения, None для пустого значения
+    :param offer_id: id предложения
+    :param backwards: курсор на предыдущую страницу
+    :return: курсор
+    """
+    if sort_key is None:
+        value = None
+    else:
+        value = sort_key.isoformat() if isinstance(sort_key, datetime) else str(sort_key)
+    return signing.dumps([field, value, offer_id, int(backwards)], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor: str, field: str) -> Optional[Tuple[str, int, bool]]:
+    """
+    Разбор курсора
+    :param cursor: курсор из параметра запроса
+    :param field: текущее поле сортировки
+    :return: значение ключа сортировки (None для пустого значения), id предложения и признак курсора
+        на предыдущую страницу; None для поддельного курсора, курсора другой сортировки или значения,
+        которое не приводится к типу поля сортировки
+    """
+    try:
+        cursor_field, value, offer_id, backwards = signing.loads(cursor, salt=CURSOR_SALT)
+        if cursor_field != field:
+            return None
+        if value is not None:
+            value = CatalogEntry._meta.get_field(field).to_python(value)
+        return value, int(offer_id), bool(backwards)
+    except (signing.BadSignature, ValidationError, TypeError, ValueError):
+        return None
+
+
+def get_keyset_page(queryset: QuerySet, params: QueryDict, page_size: int) -> KeysetPage:
+    """
+    Получение страницы каталога по курсору: вместо COUNT(*) и OFFSET выбираются page_size + 1 id предложений,
+    следующих за курсором в порядке (ключ сортировки, id), после чего загружаются только предложения страницы.
+    Записи с пустым ключом сортировки выводятся в конце каталога
+    :param queryset: отфильтрованный набор записей каталога
+    :param params: параметры запроса с сортировкой и курсором
+    :param page_size: количество предложений на странице
+    :return: KeysetPage
+    """
+    field, descending = get_sort(params)
+    position = decode_cursor(params.get(CURSOR_PARAM, ''), field)
+    backwards = bool(position and position[2])
+    # при переходе на предыдущую страницу предложения выбираются в обратном порядке,
+    # записи с пустым ключом сортировки при этом идут первыми
+    reverse = descending != backwards
+    sort_key = F('sort_key').desc if reverse else F('sort_key').asc
+    queryset = queryset.annotate(sort_key=F(field)).order_by(
+        sort_key(nulls_first=True) if backwards else sort_key(nulls_last=True), '-pk' if reverse else 'pk')
+    if position:
+        value, offer_id, _ = position
+        lookup = 'lt' if reverse else 'gt'
+        if value is None:
+            after = Q(sort_key__isnull=True, **{f'pk__{lookup}': offer_id})
+            if backwards:
+                after |= Q(sort_key__isnull=False)
+        else:
+            after = Q(**{f'sort_key__{lookup}': value}) | Q(sort_key=value, **{f'pk__{lookup}': offer_id})
+            if not backwards:
+                after |= Q(sort_key__isnull=True)
+        queryset = queryset.filter(after)
+    rows = list(queryset.values_list('sort_key', 'pk')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(field, *rows[-1])
+        if position and (has_more or not backwards):
+            previous_cursor = encode_cursor(field, *rows[0], backwards=True)
+    return KeysetPage(object_list=get_catalog_offers(offer_id for _, offer_id in rows),
+                      next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def get_cursor_url(params: QueryDict, cursor: Optional[str]) -> Optional[str]:
+    """
+    Формирование строки запроса страницы каталога с курсором и прежними фильтрами и сортировкой
+    :param params: параметры текущего запроса
+    :param cursor: курсор страницы
+    :return: строка запроса или None, если страницы нет
+    """
+    if cursor is None:
+        return None
+    params = params.copy()
+    params.pop('page', None)
+    params[CURSOR_PARAM] = cursor
+    return f'?{params.urlencode()}'
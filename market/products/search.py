@@ -0,0 +1,176 @@
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import CharField, F, OuterRef, Q, QuerySet, Subquery, TextField
+from django.db.models.lookups import IContains
+from django.urls import reverse
+from products.models import Category, Product, ProductProperty, ProductTag
+from shops.models import Offer
+
+# конфигурация полнотекстового поиска PostgreSQL со стеммингом русского языка
+SEARCH_CONFIG = 'russian'
+
+# слова поискового запроса: буквы и цифры, остальные символы (в том числе операторы tsquery) отбрасываются
+SEARCH_WORD_RE = re.compile(r'\w+')
+
+# количество товаров и категорий в подсказках поисковой строки
+SUGGEST_LIMIT = 8
+# минимальная и максимальная длина текста, по которому подбираются подсказки
+SUGGEST_MIN_LENGTH = 2
+SUGGEST_MAX_LENGTH = 64
+# количество подсказок, хранимых в памяти процесса, и время их актуальности, секунд
+SUGGEST_CACHE_SIZE = 2048
+SUGGEST_CACHE_TIME = 60
+
+
+@CharField.register_lookup
+class ILikeContains(IContains):
+    """
+    Поиск подстроки без учета регистра оператором ILIKE по самому столбцу. Стандартный icontains в PostgreSQL
+    сравнивает UPPER(столбец), а такое выражение триграммный GIN-индекс по столбцу не использует
+    """
+    lookup_name = 'ilike_contains'
+
+    def as_postgresql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs_sql} ILIKE {rhs_sql}', [*lhs_params, *rhs_params]
+
+
+def get_search_vector() -> SearchVector:
+    """
+    Формирование поискового вектора товара: название (вес A), теги (вес B), значения характеристик (вес C)
+    и описание (вес D). Теги и характеристики собираются подзапросами, поэтому выражение подходит для update()
+    :return: SearchVector
+    """
+    tags = ProductTag.objects.filter(products=OuterRef('pk')).order_by().values('products').annotate(
+        text=StringAgg('tags__name', ' ')).values('text')
+    properties = ProductProperty.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        text=StringAgg('value', ' ')).values('text')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(tags, output_field=TextField()), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(properties, output_field=TextField()), weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(products: QuerySet = None) -> int:
+    """
+    Пересчет поисковых векторов товаров одним запросом UPDATE
+    :param products: товары, по умолчанию все (включая удаленные)
+    :return: количество обновленных товаров
+    """
+    products = Product.global_objects.all() if products is None else products
+    return products.update(search_vector=get_search_vector())
+
+
+def get_search_query(text: str) -> Optional[SearchQuery]:
+    """
+    Формирование поискового запроса: все слова запроса должны встретиться в товаре, последнее слово
+    ищется по префиксу, чтобы недописанное слово тоже находило товары
+    :param text: текст запроса пользователя
+    :return: SearchQuery или None, если в запросе нет слов
+    """
+    words = SEARCH_WORD_RE.findall(text or '')
+    if not words:
+        return None
+    words[-1] = f'{words[-1]}:*'
+    return SearchQuery(' & '.join(words), config=SEARCH_CONFIG, search_type='raw')
+
+
+def search_products(text: str, products: QuerySet = None) -> QuerySet:
+    """
+    Поиск товаров по GIN-индексу поискового вектора с сортировкой по релевантности
+    :param text: текст запроса пользователя
+    :param products: набор товаров для поиска, по умолчанию все товары
+    :return: товары с аннотацией rank
+    """
+    products = Product.objects.all() if products is None else products
+    query = get_search_query(text)
+    if query is None:
+        return products.none()
+    return products.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)).order_by('-rank', 'id')
+
+
+def search_offers(text: str) -> QuerySet:
+    """
+    Поиск предложений товаров всех категорий, отсортированных по релевантности товара и цене
+    :param text: текст запроса пользователя
+    :return: предложения с аннотациями rank и discount_price
+    """
+    query = get_search_query(text)
+    if query is None:
+        return Offer.objects.none()
+    return Offer.objects.with_discount_price().select_related('shop', 'product__category__parent').prefetch_related(
+        'product__product_images').filter(
+        product__search_vector=query).annotate(
+        rank=SearchRank(F('product__search_vector'), query)).order_by('-rank', 'price', 'id')
+
+
+def normalize_suggest_text(text: str) -> str:
+    """
+    Приведение текста поисковой строки к виду ключа подсказок: нижний регистр, одиночные пробелы
+    :param text: текст поисковой строки
+    :return: нормализованный текст
+    """
+    return ' '.join((text or '').lower().split())[:SUGGEST_MAX_LENGTH]
+
+
+def get_suggestions(text: str) -> Dict[str, List[Dict]]:
+    """
+    Получение подсказок поисковой строки: товары и категории, название которых содержит текст
+    или похоже на него (с опечатками). Подсказки популярных запросов хранятся в памяти процесса
+    :param text: текст поисковой строки
+    :return: словарь со списками товаров и категорий
+    """
+    text = normalize_suggest_text(text)
+    if len(text) < SUGGEST_MIN_LENGTH:
+        return {'products': [], 'categories': []}
+    return _get_cached_suggestions(text, int(time.monotonic() // SUGGEST_CACHE_TIME))
+
+
+def get_suggest_queryset(model, text: str) -> QuerySet:
+    """
+    Формирование запроса подсказок по названию. Оба условия (ILIKE и %>) сравнивают сам столбец name,
+    поэтому PostgreSQL объединяет по ним результаты поиска по триграммному GIN-индексу (BitmapOr)
+    вместо последовательного чтения таблицы
+    :param model: модель с полем name: Product или Category
+    :param text: нормализованный текст поисковой строки
+    :return: QuerySet пар (id, название)
+    """
+    return model.objects.filter(Q(name__ilike_contains=text) | Q(name__trigram_word_similar=text)).annotate(
+        similarity=TrigramWordSimilarity(text, 'name')).order_by('-similarity', 'name').values_list(
+        'id', 'name')[:SUGGEST_LIMIT]
+
+
+@lru_cache(maxsize=SUGGEST_CACHE_SIZE)
+def _get_cached_suggestions(text: str, period: int) -> Dict[str, List[Dict]]:
+    """
+    Подбор подсказок по триграммным GIN-индексам названий товаров и категорий.
+    Номер периода входит в ключ LRU-кэша, поэтому подсказки пересчитываются не реже раза в SUGGEST_CACHE_TIME
+    :param text: нормализованный текст поисковой строки
+    :param period: номер периода актуальности подсказок
+    :return: словарь со списками товаров и категорий
+    """
+    products = get_suggest_queryset(Product, text)
+    categories = get_suggest_queryset(Category, text)
+    return {
+        'products': [{'name': name, 'url': reverse('products:product_detail', kwargs={'pk': pk})}
+                     for pk, name in products],
+        'categories': [{'name': name, 'url': reverse('products:products_by_category', kwargs={'pk': pk})}
+                       for pk, name in categories],
+    }
+
+
+def clear_suggestions() -> None:
+    """
+    Очистка подсказок, хранимых в памяти процесса, после изменения товаров или категорий
+    :return: None
+    """
+    _get_cached_suggestions.cache_clear()
@@ -0,0 +1,334 @@
+from collections import defaultdict
+from hashlib import md5
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Set, Tuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import QueryDict
+from orders.models import OrderItem
+from products.categories import CategoryTree
+from products.models import CatalogEntry, ProductProperty
+from reviews.models import Reviews
+from settings.services import DiscountIndex
+from shops.models import Offer
+from shops.services import offer_price_with_discount
+
+# параметры запроса, не влияющие на состав и порядок товаров каталога
+CATALOG_IGNORED_PARAMS = ('page', 'sort_by', 'cursor')
+# время хранения фасетов каталога категории, секунд (фасеты сбрасываются сменой версии каталога категории)
+CATALOG_FACETS_CACHE_TIME = 60 * 60 * 24
+
+
+def get_catalog_version_key(category_id: int) -> str:
+    """
+    Формирование ключа кэша версии каталога категории. В ключ входит имя базы данных, чтобы тестовая
+    и рабочая базы, использующие общий файловый кэш, не получали списки товаров друг друга
+    :param category_id: id категории
+    :return: ключ
+    """
+    return f'catalog_version:{category_id}:{connection.settings_dict["NAME"]}'
+
+
+def get_catalog_version(category_id: int) -> str:
+    """
+    Получение текущей версии каталога категории
+    :param category_id: id категории
+    :return: версия
+    """
+    version = cache.get(get_catalog_version_key(category_id))
+    if version is None:
+        version = bump_catalog_version(category_id)
+    return version
+
+
+def bump_catalog_version(category_id: int) -> str:
+    """
+    Смена версии каталога категории, после которой закэшированные списки товаров категории не используются
+    :param category_id: id категории
+    :return: новая версия
+    """
+    version = uuid4().hex
+    cache.set(get_catalog_version_key(category_id), version, None)
+    return version
+
+
+def bump_catalog_versions(category_id: int) -> None:
+    """
+    Смена версий каталогов категории и ее предков: каталог родительской категории включает товары потомков
+    :param category_id: id категории
+    :return: None
+    """
+    ancestors = CategoryTree.get().get_ancestors(category_id)
+    for category in ancestors:
+        bump_catalog_version(category.id)
+    bump_catalog_version(category_id)
+
+
+def get_catalog_cache_key(category_id: int, params: QueryDict) -> str:
+    """
+    Формирование ключа кэша списка товаров каталога по категории, версии каталога категории,
+    параметрам фильтрации и сортировке
+    :param category_id: id категории
+    :param params: параметры запроса
+    :return: ключ
+    """
+    filters = sorted((name, sorted(params.getlist(name))) for name in params if name not in CATALOG_IGNORED_PARAMS)
+    filter_hash = md5(repr(filters).encode()).hexdigest()
+    sort = ','.join(params.getlist('sort_by')) or 'default'
+    return f'catalog:{category_id}:{get_catalog_version(category_id)}:{filter_hash}:{sort}'
+
+
+def get_catalog_offer_ids(category_id: int, params: QueryDict, queryset: QuerySet, timeout: int) -> List[int]:
+    """
+    Получение упорядоченного списка id предложений каталога из кэша, либо выборкой одних id по отфильтрованному
+    и отсортированному набору записей каталога (id записи каталога совпадает с id предложения)
+    :param category_id: id категории
+    :param params: параметры фильтрации и сортировки из запроса
+    :param queryset: отфильтрованный и отсортированный набор записей каталога
+    :param timeout: время кэширования, секунд
+    :return: список id предложений
+    """
+    cache_key = get_catalog_cache_key(category_id, params)
+    offer_ids = cache.get(cache_key)
+    if offer_ids is None:
+        offer_ids = list(queryset.values_list('pk', flat=True))
+        cache.set(cache_key, offer_ids, timeout)
+    return offer_ids
+
+
+def get_catalog_count(category_id: int, params: QueryDict, queryset: QuerySet, timeout: int) -> int:
+    """
+    Получение количества предложений каталога из кэша, либо подсчетом по отфильтрованному набору предложений.
+    Количество хранится до смены версии каталога категории, поэтому COUNT(*) не выполняется на каждой странице
+    :param category_id: id категории
+    :param params: параметры фильтрации и сортировки из запроса
+    :param queryset: отфильтрованный набор записей каталога
+    :param timeout: время кэширования, секунд
+    :return: количество предложений
+    """
+    cache_key = f'{get_catalog_cache_key(category_id, params)}:count'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+def get_catalog_offers(offer_ids: Iterable[int]) -> List[Offer]:
+    """
+    Загрузка предложений страницы каталога одним запросом (и одним запросом изображений товаров)
+    в порядке переданных id
+    :param offer_ids: id предложений страницы
+    :return: список предложений
+    """
+    offer_ids = list(offer_ids)
+    offers = Offer.objects.with_discount_price().select_related(
+        'shop', 'product__category__parent', 'catalog_entry').prefetch_related('product__product_images').in_bulk(
+        offer_ids)
+    return [offers[offer_id] for offer_id in offer_ids if offer_id in offers]
+
+
+def refresh_catalog_entries(offers: QuerySet = None) -> int:
+    """
+    Пересчет записей каталога для предложений: данные предложений вместе с количеством отзывов
+    и оплаченных покупок выбираются одним запросом, записи сохраняются одной вставкой с обновлением
+    :param offers: предложения, по умолчанию все
+    :return: количество обновленных записей
+    """
+    offers = Offer.objects.all() if offers is None else offers
+    reviews_count = Reviews.objects.filter(product_id=OuterRef('product_id')).order_by().values(
+        'product_id').annotate(count=Count('id')).values('count')
+    purchases_count = OrderItem.objects.filter(offer_id=OuterRef('pk'), order__status='paid').order_by().values(
+        'offer_id').annotate(count=Sum('quantity')).values('count')
+    rows = offers.order_by().values(
+        'id', 'product_id', 'product__category_id', 'shop_id', 'product__name', 'price', 'created', 'in_stock',
+    ).annotate(
+        reviews_count=Coalesce(Subquery(reviews_count, output_field=IntegerField()), Value(0)),
+        purchases_count=Coalesce(Subquery(purchases_count, output_field=IntegerField()), Value(0)),
+    )
+    discount_index = DiscountIndex.get()
+    entries = [
+        CatalogEntry(
+            offer_id=row['id'], category_id=row['product__category_id'], shop_id=row['shop_id'],
+            product_id=row['product_id'], product_name=row['product__name'], price=row['price'],
+            discount_price=offer_price_with_discount(row['product_id'], row['price'], discount_index) or row['price'],
+            reviews_count=row['reviews_count'], purchases_count=row['purchases_count'], created=row['created'],
+            in_stock=row['in_stock'],
+        )
+        for row in rows
+    ]
+    if entries:
+        CatalogEntry.objects.bulk_create(
+            entries, batch_size=1000, update_conflicts=True, unique_fields=['offer'],
+            update_fields=['category', 'shop', 'product', 'product_name', 'price', 'discount_price', 'reviews_count',
+                           'purchases_count', 'created', 'in_stock'])
+    return len(entries)
+
+
+def rebuild_catalog_entries() -> int:
+    """
+    Полное перестроение записей каталога
+    :return: количество записей
+    """
+    with transaction.atomic():
+        CatalogEntry.objects.all().delete()
+        return refresh_catalog_entries()
+
+
+class CategoryFacets(NamedTuple):
+    """ Фасеты каталога категории: количество предложений по магазинам и по значениям характеристик """
+
+    # (id магазина, название магазина, количество предложений)
+    shops: Tuple[Tuple[int, str, int], ...]
+    # название характеристики -> ((значение, количество предложений), ...)
+    properties: Dict[str, Tuple[Tuple[str, int], ...]]
+
+    def get_shop_choices(self) -> List[Tuple[int, str]]:
+        """ Варианты фильтра по магазинам с количеством предложений """
+
+        return [(shop_id, f'{shop_name} ({count})') for shop_id, shop_name, count in self.shops]
+
+    def get_property_choices(self) -> List[Tuple[str, str]]:
+        """ Варианты фильтра по значениям характеристик с количеством предложений """
+
+        counts = defaultdict(int)
+        for values in self.properties.values():
+            for value, count in values:
+                counts[value] += count
+        return [(value, f'{value} ({count})') for value, count in sorted(counts.items())]
+
+    def get_names_properties(self) -> Dict[str, set]:
+        """ Значения характеристик по названиям характеристик для вывода в фильтре каталога """
+
+        return {name: {value for value, _ in values} for name, values in self.properties.items()}
+
+
+def get_catalog_facets_cache_key(category_id: int) -> str:
+    """
+    Формирование ключа кэша фасетов каталога категории по версии каталога категории
+    :param category_id: id категории
+    :return: ключ
+    """
+    return f'catalog_facets:{category_id}:{get_catalog_version(category_id)}'
+
+
+def build_category_facets(category_id: int) -> CategoryFacets:
+    """
+    Построение фасетов каталога категории (вместе с подкатегориями) двумя запросами и сохранение их в кэш
+    :param category_id: id категории
+    :return: CategoryFacets
+    """
+    cache_key = get_catalog_facets_cache_key(category_id)
+    category_ids = CategoryTree.get().get_descendant_ids(category_id)
+    shops = CatalogEntry.objects.filter(category_id__in=category_ids).values_list('shop_id', 'shop__name').annotate(
+        count=Count('offer_id')).order_by('shop_id')
+    properties = defaultdict(list)
+    values = ProductProperty.objects.filter(product__category_id__in=category_ids).values_list(
+        'property__name', 'value').annotate(count=Count('product__offers')).filter(count__gt=0).order_by(
+        'property__name', 'value')
+    for name, value, count in values:
+        properties[name].append((value, count))
+    facets = CategoryFacets(shops=tuple(shops),
+                            properties={name: tuple(values) for name, values in properties.items()})
+    cache.set(cache_key, facets, CATALOG_FACETS_CACHE_TIME)
+    return facets
+
+
+def get_category_facets(category_id: int) -> CategoryFacets:
+    """
+    Получение фасетов каталога категории из кэша, либо их построение, если задача построения фасетов
+    еще не выполнялась после изменения каталога категории
+    :param category_id: id категории
+    :return: CategoryFacets
+    """
+    facets = cache.get(get_catalog_facets_cache_key(category_id))
+    if facets is None:
+        facets = build_category_facets(category_id)
+    return facets
+
+
+def get_request_category_facets(request, category_id: int) -> CategoryFacets:
+    """
+    Получение фасетов каталога категории один раз за запрос для фильтра каталога и контекстного процессора
+    :param request: запрос
+    :param category_id: id категории
+    :return: CategoryFacets
+    """
+    facets_by_category = request.__dict__.setdefault('_category_facets', {})
+    if category_id not in facets_by_category:
+        facets_by_category[category_id] = get_category_facets(category_id)
+    return facets_by_category[category_id]
+
+
+def build_all_category_facets() -> int:
+    """
+    Построение отсутствующих в кэше фасетов каталогов всех категорий
+    :return: количество построенных фасетов
+    """
+    built = 0
+    for category_id in CatalogEntry.objects.values_list('category_id', flat=True).distinct().order_by():
+        if cache.get(get_catalog_facets_cache_key(category_id)) is None:
+            build_category_facets(category_id)
+            built += 1
+    return built
+
+
+class PropertyIndex(NamedTuple):
+    """
+    Индекс значений характеристик товаров категории: значение -> (id характеристики, id товаров со значением).
+    Фильтрация по выбранным значениям выполняется пересечением множеств id товаров без запросов к БД
+    """
+
+    values: Dict[str, Tuple[int, FrozenSet[int]]]
+
+    def match(self, values: Iterable[str]) -> Set[int]:
+        """
+        Получение id товаров, подходящих под выбранные значения характеристик: значения одной характеристики
+        объединяются, значения разных характеристик пересекаются
+        :param values: выбранные значения характеристик
+        :return: множество id товаров
+        """
+        groups = defaultdict(set)
+        for value in values:
+            if value in self.values:
+                property_id, product_ids = self.values[value]
+                groups[property_id].update(product_ids)
+        if not groups:
+            return set()
+        return set.intersection(*groups.values())
+
+
+def get_property_index_cache_key(category_id: int) -> str:
+    """
+    Формирование ключа кэша индекса значений характеристик категории по версии каталога категории
+    :param category_id: id категории
+    :return: ключ
+    """
+    return f'catalog_properties:{category_id}:{get_catalog_version(category_id)}'
+
+
+def get_property_index(category_id: int) -> PropertyIndex:
+    """
+    Получение индекса значений характеристик товаров категории из кэша, либо его построение одним запросом
+    :param category_id: id категории
+    :return: PropertyIndex
+    """
+    cache_key = get_property_index_cache_key(category_id)
+    index = cache.get(cache_key)
+    if index is None:
+        properties = {}
+        products = defaultdict(set)
+        rows = ProductProperty.objects.filter(
+            product__category_id__in=CategoryTree.get().get_descendant_ids(category_id), value__isnull=False,
+        ).values_list('value', 'property_id', 'product_id').order_by('property_id')
+        for value, property_id, product_id in rows:
+            # значение, встречающееся у нескольких характеристик, относится к первой из них
+            properties.setdefault(value, property_id)
+            products[value].add(product_id)
+        index = PropertyIndex(values={value: (property_id, frozenset(products[value]))
+                                      for value, property_id in properties.items()})
+        cache.set(cache_key, index, CATALOG_FACETS_CACHE_TIME)
+    return index
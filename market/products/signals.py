@@ -0,0 +1,158 @@
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from orders.models import Order, OrderItem
+from products.models import Category, Product, ProductProperty, ProductTag
+from products.search import clear_suggestions, update_search_vectors
+from products.categories import CategoryTree
+from products.services import bump_catalog_version, bump_catalog_versions, refresh_catalog_entries
+from reviews.models import Reviews
+from shops.models import Offer
+from taggit.models import TaggedItem
+
+
+@receiver(pre_save, sender=Product)
+def invalidate_previous_product_category(sender, instance, **kwargs):
+    """ Смена версии каталога категории, из которой переносится товар """
+
+    if instance.pk:
+        category_id = Product.global_objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        if category_id and category_id != instance.category_id:
+            bump_catalog_versions(category_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_category(sender, instance, **kwargs):
+    """ Смена версии каталога категории товара при изменении товара """
+
+    bump_catalog_versions(instance.category_id)
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+@receiver(post_save, sender=ProductProperty)
+@receiver(post_delete, sender=ProductProperty)
+def invalidate_offer_category(sender, instance, **kwargs):
+    """ Смена версии каталога категории товара при изменении предложения или характеристики товара """
+
+    category_id = Product.global_objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    if category_id:
+        bump_catalog_versions(category_id)
+
+
+@receiver(post_save, sender=Offer)
+def refresh_offer_catalog_entry(sender, instance, **kwargs):
+    """ Обновление записи каталога при изменении предложения """
+
+    refresh_catalog_entries(Offer.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_catalog_entries(sender, instance, **kwargs):
+    """ Обновление записей каталога предложений товара при изменении названия или категории товара """
+
+    refresh_catalog_entries(Offer.objects.filter(product_id=instance.pk))
+
+
+def is_deleted_with_offers(origin) -> bool:
+    """
+    Проверка, что удаление начато с предложения или товара: записи каталога удаляются вместе с предложениями,
+    и пересчитывать их при каскадном удалении отзывов и позиций заказов нельзя
+    :param origin: объект или набор объектов, с которого начато удаление
+    :return: True, если удаление начато с предложения или товара
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, (Offer, Product))
+
+
+@receiver(post_save, sender=Reviews)
+@receiver(post_delete, sender=Reviews)
+def refresh_reviews_catalog_entries(sender, instance, origin=None, **kwargs):
+    """ Обновление количества отзывов в записях каталога предложений товара """
+
+    if is_deleted_with_offers(origin):
+        return
+    refresh_catalog_entries(Offer.objects.filter(product_id=instance.product_id))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_item_catalog_entry(sender, instance, origin=None, **kwargs):
+    """ Обновление количества покупок в записи каталога предложения из позиции заказа """
+
+    if is_deleted_with_offers(origin):
+        return
+    refresh_catalog_entries(Offer.objects.filter(pk=instance.offer_id))
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_catalog_entries(sender, instance, created, **kwargs):
+    """ Обновление количества покупок в записях каталога предложений заказа при изменении статуса заказа """
+
+    if not created:
+        refresh_catalog_entries(Offer.objects.filter(
+            pk__in=OrderItem.objects.filter(order_id=instance.pk).values('offer_id')))
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    """ Пересчет поискового вектора товара при изменении названия или описания товара """
+
+    update_search_vectors(Product.global_objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ProductProperty)
+@receiver(post_delete, sender=ProductProperty)
+def update_property_search_vector(sender, instance, **kwargs):
+    """ Пересчет поискового вектора товара при изменении значения характеристики товара """
+
+    update_search_vectors(Product.global_objects.filter(pk=instance.product_id))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_tags_search_vectors(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Пересчет поисковых векторов товаров при изменении тегов товаров """
+
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_search_vectors(Product.global_objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        # при очистке товаров набора тегов pk_set не передается, поэтому товары запоминаются до удаления связей
+        instance._cleared_product_ids = list(instance.products.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        update_search_vectors(Product.global_objects.filter(pk__in=instance.__dict__.pop('_cleared_product_ids', [])))
+    elif action in ('post_add', 'post_remove'):
+        update_search_vectors(Product.global_objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def update_tagged_item_search_vectors(sender, instance, **kwargs):
+    """ Пересчет поисковых векторов товаров при изменении названий в наборе тегов (ProductTag) """
+
+    if instance.content_type.model_class() is ProductTag:
+        update_search_vectors(Product.global_objects.filter(tags=instance.object_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def clear_search_suggestions(sender, **kwargs):
+    """ Очистка подсказок поисковой строки текущего процесса при изменении товаров или категорий """
+
+    clear_suggestions()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    """
+    Сброс снимка дерева категорий и смена версий каталогов всех категорий: при переносе категории
+    меняется состав товаров каталогов ее прежних и новых предков
+    """
+
+    CategoryTree.invalidate()
+    for category_id in CategoryTree.get().nodes:
+        bump_catalog_version(category_id)
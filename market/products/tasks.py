@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from config.settings import CELERY_TASK_NAME_3
+from products.services import build_all_category_facets
+
+
+@shared_task(name=CELERY_TASK_NAME_3)
+def build_category_facets_task(*args, **kwargs):
+    """Задача на построение фасетов каталогов категорий, сброшенных изменением товаров или предложений."""
+    return f'Построено фасетов каталога: {build_all_category_facets()}'
@@ -0,0 +1,347 @@
+import os
+from importlib import import_module
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from config.settings import FIXTURE_DIRS
+from context_processors.categories_context import categories
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, F, Sum
+from django.http import QueryDict
+from django.test import TestCase
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from orders.services import confirm_order_holds
+from products.categories import CategoryTree
+from products.models import CatalogEntry, Category, Product, ProductProperty, ProductTag
+from products.search import get_suggest_queryset, search_products
+from products.services import (build_all_category_facets, bump_catalog_version, get_catalog_cache_key,
+                               get_catalog_offer_ids, get_catalog_offers, get_category_facets,
+                               get_property_index)
+from reviews.models import Reviews
+from settings.models import Discount
+from settings.services import DiscountIndex
+from shops.models import Offer
+from users.models import User
+
+
+class CatalogCacheTest(TestCase):
+    """ Тестирование кэша списков предложений каталога """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.product = Product.objects.filter(offers__isnull=False).first()
+        self.category_id = self.product.category_id
+        self.queryset = Offer.objects.filter(product__category_id=self.category_id).order_by('-created')
+
+    def test_offer_ids_are_cached_per_category_filters_and_sort(self):
+        """ Тестирование кэширования списка id предложений по категории, фильтрам и сортировке """
+
+        params = QueryDict('product_name=&sort_by=price&page=2')
+        offer_ids = get_catalog_offer_ids(self.category_id, params, self.queryset, 60)
+        self.assertEqual(offer_ids, list(self.queryset.values_list('id', flat=True)))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_offer_ids(self.category_id, QueryDict('sort_by=price&product_name='),
+                                                   self.queryset.none(), 60), offer_ids)
+        self.assertNotEqual(get_catalog_cache_key(self.category_id, params),
+                            get_catalog_cache_key(self.category_id, QueryDict('product_name=&sort_by=-price')))
+        self.assertNotEqual(get_catalog_cache_key(self.category_id, params),
+                            get_catalog_cache_key(self.category_id + 1, params))
+
+    def test_offer_save_bumps_category_version(self):
+        """ Тестирование смены версии каталога категории при изменении предложения """
+
+        params = QueryDict('')
+        cache_key = get_catalog_cache_key(self.category_id, params)
+        other_category_key = get_catalog_cache_key(self.category_id + 1, params)
+        offer = self.product.offers.first()
+        offer.price += 1
+        offer.save()
+        self.assertNotEqual(get_catalog_cache_key(self.category_id, params), cache_key)
+        self.assertEqual(get_catalog_cache_key(self.category_id + 1, params), other_category_key)
+
+    def test_offers_are_loaded_in_order_with_single_query(self):
+        """ Тестирование загрузки предложений страницы в порядке id одним запросом и запросом изображений """
+
+        offer_ids = list(self.queryset.values_list('id', flat=True))[::-1]
+        DiscountIndex.get()
+        with self.assertNumQueries(2):
+            offers = get_catalog_offers(offer_ids)
+            for offer in offers:
+                offer.product.product_images.first()
+                str(offer.product.category.parent)
+        self.assertEqual([offer.id for offer in offers], offer_ids)
+
+
+class CatalogEntryTest(TestCase):
+    """ Тестирование денормализованных записей каталога """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        DiscountIndex.invalidate()
+        self.addCleanup(DiscountIndex.invalidate)
+        self.offer = Offer.objects.select_related('product').first()
+
+    def test_entries_match_offers_after_rebuild(self):
+        """ Тестирование соответствия записей каталога предложениям после полного перестроения """
+
+        CatalogEntry.objects.all().delete()
+        call_command('rebuild_catalog', stdout=open(os.devnull, 'w'))
+        self.assertEqual(CatalogEntry.objects.count(), Offer.objects.count())
+        offers = Offer.objects.select_related('product').annotate(reviews=Count('product__product_reviews'))
+        for offer in offers:
+            entry = offer.catalog_entry
+            purchases = OrderItem.objects.filter(offer=offer, order__status='paid').aggregate(
+                total=Sum('quantity'))['total'] or 0
+            self.assertEqual((entry.category_id, entry.shop_id, entry.product_name, entry.price, entry.in_stock),
+                             (offer.product.category_id, offer.shop_id, offer.product.name, offer.price,
+                              offer.in_stock))
+            self.assertEqual((entry.reviews_count, entry.purchases_count), (offer.reviews, purchases))
+
+    def test_entries_follow_reviews_and_paid_orders(self):
+        """ Тестирование обновления количества отзывов и покупок при добавлении отзыва и оплате заказа """
+
+        entry = CatalogEntry.objects.get(offer=self.offer)
+        Reviews.objects.create(product=self.offer.product, author=User.objects.first(), content='Отзыв')
+        entry.refresh_from_db()
+        self.assertEqual(entry.reviews_count, self.offer.product.product_reviews.count())
+
+        order = Order.objects.create(user=User.objects.first(), delivery_option='Delivery', delivery_address='a',
+                                     delivery_city='b', payment_option='Online card', comment='')
+        OrderItem.objects.create(order=order, offer=self.offer, quantity=2)
+        purchases = entry.purchases_count
+        Order.objects.filter(pk=order.pk).update(status='paid')
+        confirm_order_holds(order.pk)
+        entry.refresh_from_db()
+        self.assertEqual((entry.purchases_count, entry.in_stock), (purchases + 2, self.offer.in_stock - 2))
+
+    def test_entries_follow_discounts(self):
+        """ Тестирование обновления цены со скидкой при добавлении товара в скидку """
+
+        date_now = datetime.now(tz=timezone.utc)
+        discount = Discount.objects.create(name='test', value=1, value_type='fixed_price',
+                                           start_date=date_now - timedelta(days=1),
+                                           end_date=date_now + timedelta(days=1))
+        discount.products.add(self.offer.product)
+        self.assertEqual(CatalogEntry.objects.get(offer=self.offer).discount_price, Decimal(1))
+        discount.delete()
+        self.assertEqual(CatalogEntry.objects.get(offer=self.offer).discount_price,
+                         Offer.objects.with_discount_price().get(pk=self.offer.pk).discount_price)
+
+
+class CategoryFacetsTest(TestCase):
+    """ Тестирование фасетов каталога категории """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.offer = Offer.objects.filter(product__product_properties__isnull=False).first()
+        self.category_id = self.offer.product.category_id
+        self.offers = Offer.objects.filter(product__category_id=self.category_id)
+        # кэш не откатывается вместе с транзакцией теста
+        bump_catalog_version(self.category_id)
+
+    def test_facets_count_offers_by_shop_and_property(self):
+        """ Тестирование количества предложений по магазинам и значениям характеристик """
+
+        facets = get_category_facets(self.category_id)
+        expected_shops = self.offers.values_list('shop_id', 'shop__name').annotate(
+            count=Count('id')).order_by('shop_id')
+        self.assertEqual(facets.shops, tuple(expected_shops))
+        product_property = ProductProperty.objects.filter(product=self.offer.product).first()
+        values = dict(facets.properties[product_property.property.name])
+        self.assertEqual(values[product_property.value], self.offers.filter(
+            product__product_properties__property=product_property.property,
+            product__product_properties__value=product_property.value).count())
+        shop_id, shop_name, count = facets.shops[0]
+        self.assertIn((shop_id, f'{shop_name} ({count})'), facets.get_shop_choices())
+
+    def test_facets_are_read_from_cache_until_catalog_changes(self):
+        """ Тестирование чтения фасетов из кэша и их сброса при изменении предложения """
+
+        facets = get_category_facets(self.category_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_category_facets(self.category_id), facets)
+        self.offer.delete()
+        self.assertGreaterEqual(build_all_category_facets(), 1)
+        with self.assertNumQueries(0):
+            facets = get_category_facets(self.category_id)
+        self.assertEqual(sum(count for _, _, count in facets.shops), self.offers.count())
+
+
+class PropertyIndexTest(TestCase):
+    """ Тестирование индекса значений характеристик категории """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.category_id = 17
+        bump_catalog_version(self.category_id)
+        self.products = Product.objects.filter(category_id=self.category_id)
+
+    def test_match_unites_values_of_property_and_intersects_properties(self):
+        """ Тестирование объединения значений одной характеристики и пересечения разных характеристик """
+
+        index = get_property_index(self.category_id)
+        authors = ['Александр Сергеевич Пушкин', 'Бронислав Брониславович Виногродский']
+        expected = set(self.products.filter(product_properties__value__in=authors).filter(
+            product_properties__value='Тонкий').values_list('id', flat=True))
+        self.assertEqual(index.match(authors + ['Тонкий']), expected)
+        self.assertEqual(index.match(authors), set(self.products.filter(
+            product_properties__value__in=authors).values_list('id', flat=True)))
+        self.assertEqual(index.match(['Нет такого значения']), set())
+
+    def test_index_is_read_from_cache(self):
+        """ Тестирование чтения индекса из кэша без запросов к БД """
+
+        index = get_property_index(self.category_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_property_index(self.category_id), index)
+
+
+class ProductSearchTest(TestCase):
+    """ Тестирование полнотекстового поиска товаров """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.product_property = ProductProperty.objects.select_related('product').first()
+        self.product = self.product_property.product
+
+    def test_search_vector_follows_property_values(self):
+        """ Тестирование поиска по значению характеристики и пересчета вектора при ее изменении """
+
+        self.assertNotIn(self.product, search_products('Абракадабра'))
+        self.product_property.value = 'Абракадабра'
+        self.product_property.save()
+        self.assertIn(self.product, search_products('абракадабры'))
+
+    def test_name_matches_rank_higher_than_description(self):
+        """ Тестирование ранжирования: совпадение в названии важнее совпадения в описании """
+
+        other = Product.objects.exclude(pk=self.product.pk).first()
+        self.product.name = 'Тестовый телескоп'
+        self.product.save()
+        other.description = 'Подходит к любому телескопу'
+        other.save()
+        self.assertEqual(list(search_products('телескоп')), [self.product, other])
+
+
+class DataMigrationTest(TestCase):
+    """ Тестирование заполнения записей каталога и поисковых векторов миграциями по историческим моделям """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.apps = MigrationExecutor(connection).loader.project_state(
+            ('products', '0003_product_search_vector')).apps
+
+    def test_catalog_entries_are_filled(self):
+        """ Тестирование совпадения записей каталога из миграции с записями команды rebuild_catalog """
+
+        fields = ('offer_id', 'category_id', 'shop_id', 'product_id', 'product_name', 'price', 'reviews_count',
+                  'purchases_count', 'created', 'in_stock')
+        call_command('rebuild_catalog', stdout=open(os.devnull, 'w'))
+        expected = list(CatalogEntry.objects.order_by('offer_id').values_list(*fields))
+        CatalogEntry.objects.all().delete()
+        import_module('products.migrations.0002_catalogentry').fill_catalog_entries(self.apps, None)
+        self.assertEqual(list(CatalogEntry.objects.order_by('offer_id').values_list(*fields)), expected)
+        self.assertFalse(CatalogEntry.objects.exclude(discount_price=F('price')).exists())
+
+    def test_search_vectors_are_filled(self):
+        """ Тестирование совпадения поисковых векторов из миграции с векторами команды rebuild_catalog """
+
+        product_tag = ProductTag.objects.create()
+        product_tag.tags.add('Телескопы', 'Оптика')
+        Product.objects.first().tags.add(product_tag)
+        call_command('rebuild_catalog', stdout=open(os.devnull, 'w'))
+        expected = list(Product.global_objects.order_by('pk').values_list('pk', 'search_vector'))
+        Product.global_objects.update(search_vector=None)
+        import_module('products.migrations.0003_product_search_vector').fill_search_vectors(self.apps, None)
+        self.assertEqual(list(Product.global_objects.order_by('pk').values_list('pk', 'search_vector')), expected)
+
+
+class SuggestQueryTest(TestCase):
+    """ Тестирование запроса подсказок поисковой строки """
+
+    def test_conditions_compare_name_column(self):
+        """ Тестирование того, что условия подсказок сравнивают сам столбец name, а не UPPER(name) """
+
+        sql = str(get_suggest_queryset(Product, 'тел').query)
+        self.assertIn('"products_product"."name" ILIKE', sql)
+        self.assertIn('"products_product"."name" %>', sql)
+        self.assertNotIn('UPPER', sql)
+
+    def test_plan_uses_trigram_index(self):
+        """ Тестирование использования триграммного GIN-индекса вместо последовательного чтения таблицы """
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('расширение pg_trgm не установлено')
+        for model, index in ((Product, 'product_name_trgm_idx'), (Category, 'category_name_trgm_idx')):
+            with transaction.atomic(), connection.cursor() as cursor:
+                # на небольшой тестовой таблице последовательное чтение дешевле, поэтому оно запрещается:
+                # если одно из условий не обслуживается индексом, план все равно останется последовательным
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = get_suggest_queryset(model, 'тел').explain()
+            self.assertIn(index, plan)
+            self.assertNotIn('Seq Scan', plan)
+
+
+class CategoryTreeTest(TestCase):
+    """ Тестирование снимка дерева категорий """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        CategoryTree.invalidate()
+        self.addCleanup(CategoryTree.invalidate)
+
+    def test_tree_matches_mptt(self):
+        """ Тестирование совпадения снимка с деревом категорий MPTT """
+
+        tree = CategoryTree.get()
+        for category in Category.objects.all():
+            self.assertEqual(tree.get_descendant_ids(category.id),
+                             sorted(category.get_descendants(include_self=True).values_list('id', flat=True)))
+            self.assertEqual([node.id for node in tree.get_ancestors(category.id)],
+                             [ancestor.id for ancestor in category.get_ancestors()])
+            self.assertEqual([node.id for node in tree.get_children(category.id)],
+                             [child.id for child in category.get_children()])
+        self.assertEqual([node.id for node in tree.get_roots()],
+                         list(Category.objects.root_nodes().values_list('id', flat=True)))
+        with self.assertNumQueries(0):
+            CategoryTree.get()
+
+    def test_menu_is_served_from_process_memory(self):
+        """ Тестирование меню категорий из вложенных кортежей без запросов к БД и его обновления по версии """
+
+        menu = CategoryTree.get().menu
+        parent = next(item for item in menu if item.children)
+        self.assertEqual([child.id for child in parent.children],
+                         list(Category.objects.get(id=parent.id).get_children().values_list('id', flat=True)))
+        self.assertEqual(parent.icon, f'img/icons/departments/{parent.name}.svg')
+        with self.assertNumQueries(0):
+            self.assertEqual(tuple(categories(None)['categories']), menu)
+        category = Category.objects.get(id=parent.children[0].id)
+        category.name = 'Переименованная категория'
+        category.save()
+        updated_parent = next(item for item in categories(None)['categories'] if item.id == parent.id)
+        self.assertIn(category.name, [child.name for child in updated_parent.children])
+
+    def test_tree_is_rebuilt_after_category_move(self):
+        """ Тестирование обновления снимка и версии каталога предка после переноса категории """
+
+        parent = Category.objects.get(id=15)
+        cache_key = get_catalog_cache_key(parent.id, QueryDict())
+        CategoryTree.get()
+        category = Category.objects.get(id=16)
+        category.parent = parent
+        category.save()
+        self.assertEqual(CategoryTree.get().get_descendant_ids(parent.id), [15, 16])
+        self.assertNotEqual(get_catalog_cache_key(parent.id, QueryDict()), cache_key)
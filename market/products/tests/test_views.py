@@ -1,14 +1,19 @@
 import os
 
 from config.settings import FIXTURE_DIRS
+from config.testing import QueryBudgetTestMixin
 from django.db.models import Min, Count, Max, Sum
 from django.db.models import Q
 from django.shortcuts import get_list_or_404
-from django.test import TestCase, Client, override_settings
+from context_processors.cart_context import cart
+from context_processors.properties_context import properties
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.test import signals
-from django.urls import reverse
+from django.urls import resolve, reverse
 from jinja2 import Template as Jinja2Template
 from products.models import Category, Product
+from products.pagination import decode_cursor, encode_cursor
+from products.services import bump_catalog_version
 from shops.models import Offer
 from users.models import User
 
@@ -31,7 +36,7 @@ Jinja2Template.render = instrumented_render
 
 
 @override_settings(PAGINATE_BY=1000)
-class ProductsByCategoryViewTest(TestCase):
+class ProductsByCategoryViewTest(QueryBudgetTestMixin, TestCase):
     """ Тестирование представления для отображения товаров конкретной категории """
 
     fixtures = [
@@ -70,6 +75,18 @@ class ProductsByCategoryViewTest(TestCase):
 
         self.assertTemplateUsed(self.response, "products/products.j2")
 
+    def test_view_is_within_query_budget(self):
+        """ Тестирование количества запросов к БД при открытии страницы товаров категории """
+
+        self.assertWithinQueryBudget(self.response)
+        self.assertWithinQueryBudget(self.client.get(self.url + "?price_min=&price_max=&product_name=лопата#"))
+
+    def test_filter_shows_facet_counts(self):
+        """ Тестирование вывода количества предложений магазинов в фильтре каталога """
+
+        shop = self.offers.first().shop
+        self.assertContains(self.response, f'{shop.name} ({self.offers.filter(shop=shop).count()})')
+
     def test_products_by_category_count_is_correct(self):
         """ Тестирование количества выводимых товаров, принадлежащих конкретной категории """
 
@@ -189,6 +206,16 @@ class ProductsByCategoryViewTest(TestCase):
         for offer in desired_offers:
             self.assertContains(response, offer.product.name)
 
+    def test_products_filtering_by_properties_query_count_does_not_depend_on_values(self):
+        """ Тестирование того, что количество запросов не растет с количеством выбранных значений характеристик """
+
+        query = "?multiple_properties=Александр+Сергеевич+Пушкин"
+        self.client.get(self.url_books + query)
+        one_value = self.client.get(self.url_books + query + "&cache_buster=1").query_stats.count
+        query += ("&multiple_properties=Бронислав+Брониславович+Виногродский&multiple_properties=Тонкий&"
+                  "multiple_properties=Роман&multiple_properties=Твердый&multiple_properties=Проза")
+        self.assertLessEqual(self.client.get(self.url_books + query).query_stats.count, one_value)
+
     def test_products_filtering_by_properties_failure(self):
         """ Тестирование невхождения неподходящих товаров в искомые при фильтрации по
         значениям нескольких характеристик одновременно """
@@ -330,7 +357,147 @@ class ProductsByCategoryViewTest(TestCase):
             first_elem_in_queryset_total_purchases >= second_elem_in_queryset_total_purchases)
 
 
-class ProductDetailViewTest(TestCase):
+@override_settings(PAGINATE_BY=2, CATALOG_PAGINATION='keyset')
+class KeysetPaginationTest(QueryBudgetTestMixin, TestCase):
+    """ Тестирование вывода каталога по курсору """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.get(id=16)
+        self.url = reverse("products:products_by_category", kwargs={'pk': self.category.pk})
+        self.offers = Offer.objects.filter(product__category=self.category)
+
+    def walk(self, response, url_name):
+        """ Обход страниц каталога по ссылкам "вперед" или "назад" """
+
+        pages = [[offer.id for offer in response.context['offer_list']]]
+        while response.context[url_name]:
+            response = self.client.get(self.url + response.context[url_name])
+            self.assertWithinQueryBudget(response)
+            pages.append([offer.id for offer in response.context['offer_list']])
+        return pages, response
+
+    def test_pages_follow_sort_key_and_id(self):
+        """ Тестирование обхода всех страниц каталога вперед и назад для каждой сортировки """
+
+        for sort_by, ordering in (('price', ('catalog_entry__price', 'id')),
+                                  ('-created', ('-catalog_entry__created', '-id')),
+                                  ('-reviews', ('-catalog_entry__reviews_count', '-id'))):
+            response = self.client.get(self.url, {'sort_by': sort_by})
+            forward, last = self.walk(response, 'next_page_url')
+            self.assertEqual(sum(forward, []), list(self.offers.order_by(*ordering).values_list('id', flat=True)))
+            self.assertTrue(all(len(page) <= 2 for page in forward))
+            backward, first = self.walk(last, 'previous_page_url')
+            self.assertEqual(backward, forward[::-1])
+            self.assertEqual(response.context['offers_count'], self.offers.count())
+
+    def test_foreign_cursor_opens_first_page(self):
+        """ Тестирование открытия первой страницы по поддельному курсору или курсору другой сортировки """
+
+        first_page = self.client.get(self.url, {'sort_by': 'price'})
+        next_page = self.client.get(self.url + first_page.context['next_page_url'])
+        for params in ({'sort_by': 'price', 'cursor': 'подделка'},
+                       {'sort_by': 'price', 'cursor': next_page.wsgi_request.GET['cursor'] + 'x'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(list(response.context['offer_list']), list(first_page.context['offer_list']))
+        response = self.client.get(self.url, {'sort_by': 'created', 'cursor': next_page.wsgi_request.GET['cursor']})
+        self.assertIsNone(response.context['previous_page_url'])
+
+    def test_unparsable_or_empty_cursor_values(self):
+        """ Тестирование курсоров с неприводимым к полю сортировки и пустым значением ключа сортировки """
+
+        last_id = self.offers.order_by('-id').first().id
+        for field, value in (('price', 'None'), ('created', 'abc'), ('reviews_count', '1.5')):
+            sort_by = {'price': 'price', 'created': '-created', 'reviews_count': 'reviews'}[field]
+            response = self.client.get(self.url, {'sort_by': sort_by, 'cursor': encode_cursor(field, value, last_id)})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['previous_page_url'])
+        self.assertEqual(decode_cursor(encode_cursor('price', None, last_id), 'price'), (None, last_id, False))
+        response = self.client.get(self.url, {'sort_by': 'price',
+                                              'cursor': encode_cursor('price', None, last_id, backwards=True)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['offer_list'])
+
+    def test_repeated_sort_uses_first_value(self):
+        """ Тестирование курсора по первому значению повторяющегося параметра sort_by, как в фильтре """
+
+        response = self.client.get(self.url, {'sort_by': ['price', '-created']})
+        forward, _ = self.walk(response, 'next_page_url')
+        self.assertEqual(sum(forward, []),
+                         list(self.offers.order_by('catalog_entry__price', 'id').values_list('id', flat=True)))
+
+    def test_page_number_links_keep_offset_pagination(self):
+        """ Тестирование постраничного вывода по номеру страницы для ссылок с параметром page """
+
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertNotIn('keyset_page', response.context)
+
+
+class CategorySubtreeCatalogTest(QueryBudgetTestMixin, TestCase):
+    """ Тестирование каталога родительской категории """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.client = Client()
+        self.parent = Category.objects.get(id=15)
+        self.child = Category.objects.get(id=16)
+        self.child.parent = self.parent
+        self.child.save()
+
+    def test_parent_catalog_lists_offers_of_subcategories(self):
+        """ Тестирование вывода предложений подкатегорий и хлебных крошек каталога """
+
+        url = reverse("products:products_by_category", kwargs={'pk': self.parent.pk})
+        response = self.client.get(url, {'page': 1})
+        expected = Offer.objects.filter(product__category__in=[self.parent, self.child])
+        self.assertEqual(response.context['paginator'].count, expected.count())
+        self.assertGreater(expected.filter(product__category=self.child).count(), 0)
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.get(reverse("products:products_by_category", kwargs={'pk': self.child.pk}))
+        self.assertEqual([node.id for node in response.context['category_ancestors']], [self.parent.id])
+        self.assertContains(response, self.parent.get_absolute_url())
+
+    def test_unknown_category_returns_404(self):
+        """ Тестирование ответа 404 для несуществующей категории """
+
+        response = self.client.get(reverse("products:products_by_category", kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, 404)
+
+
+class LazyContextProcessorsTest(TestCase):
+    """ Тестирование отложенного вычисления значений контекст-процессоров """
+
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def get_request(self, url):
+        request = RequestFactory().get(url)
+        request.resolver_match = resolve(url)
+        return request
+
+    def test_values_are_computed_on_access(self):
+        """ Тестирование отсутствия запросов к БД до обращения шаблона к значениям """
+
+        category_id = 15
+        bump_catalog_version(category_id)
+        request = self.get_request(reverse("products:products_by_category", kwargs={'pk': category_id}))
+        with self.assertNumQueries(0):
+            context = {**properties(request), **cart(request)}
+        self.assertTrue(context['names_properties'])
+
+    def test_properties_are_limited_to_catalog(self):
+        """ Тестирование пустых характеристик вне страницы каталога """
+
+        request = self.get_request(reverse("shops:shop-detail", kwargs={'pk': 1}))
+        with self.assertNumQueries(0):
+            self.assertEqual(dict(properties(request)['names_properties']), {})
+
+
+class ProductDetailViewTest(QueryBudgetTestMixin, TestCase):
     """ Тестирование представления для отображения детальной страницы продукта """
 
     fixtures = os.listdir(*FIXTURE_DIRS)
@@ -354,6 +521,11 @@ class ProductDetailViewTest(TestCase):
 
         self.assertTemplateUsed(self.response, "products/product.j2")
 
+    def test_view_is_within_query_budget(self):
+        """ Тестирование количества запросов к БД при открытии детальной страницы товара """
+
+        self.assertWithinQueryBudget(self.response)
+
     def test_context_is_correct(self):
         """ Тестирование корректности передаваемого в шаблон контекста """
 
@@ -1,14 +1,16 @@
 from django.conf import settings
-from django.core.cache import cache
 from django.db.models import Min, Count
+from django.http import Http404
 from django.shortcuts import get_list_or_404
 from django.utils.translation import gettext_lazy as _
 from django.views import generic
 from django_filters.views import FilterView
+from products.categories import CategoryTree
 from products.filters import ProductFilter
-from products.models import Category, Product
+from products.models import CatalogEntry, Category, Product
+from products.pagination import get_cursor_url, get_keyset_page, get_sort_param, is_keyset_mode
+from products.services import get_catalog_count, get_catalog_offer_ids, get_catalog_offers
 from settings.models import SiteSettings
-from shops.models import Offer
 from viewings.models import HistorySearch, HistorySearchProduct
 
 
@@ -17,33 +19,52 @@ class ProductsByCategoryView(FilterView):
 
     template_name = 'products/products.j2'
     filterset_class = ProductFilter
+    context_object_name = 'offer_list'
 
     def get_queryset(self):
-        self.category = Category.objects.get(id=self.kwargs['pk'])
-        products_cache_time = 60 * 60 * 24 * SiteSettings.load().product_cache_time
-        products_by_category = cache.get('products_by_category')
-        if not products_by_category:
-            products_by_category = Offer.objects.select_related('shop', 'product__category').filter(
-                product__category=self.category).order_by(
-                '-created')
-            cache.set('products_by_category', products_by_category, products_cache_time)
-        else:
-            actual_products_by_category = Offer.objects.select_related('shop', 'product__category').filter(
-                product__category=self.category).order_by(
-                '-created')
-            if repr(products_by_category) != repr(actual_products_by_category):
-                cache.delete('products_by_category')
-                products_by_category = actual_products_by_category
-                cache.set('products_by_category', products_by_category, products_cache_time)
-        return products_by_category
+        tree = CategoryTree.get()
+        self.category = tree.nodes.get(self.kwargs['pk'])
+        if self.category is None:
+            raise Http404(_('Категория не найдена'))
+        # каталог категории включает товары всех ее подкатегорий; записи каталога выбираются без соединений,
+        # предложения загружаются по id только для выводимой страницы (см. paginate_queryset и get_keyset_page)
+        return CatalogEntry.objects.filter(
+            category_id__in=tree.get_descendant_ids(self.category.id)).order_by('-created')
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Пагинация закэшированного списка id предложений: предложения загружаются только для текущей страницы
+        """
+        paginator, page, offer_ids, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = get_catalog_offers(offer_ids)
+        return paginator, page, page.object_list, is_paginated
 
     def get_context_data(self, **kwargs):
+        products_cache_time = 60 * 60 * 24 * SiteSettings.load().product_cache_time
+        keyset_page = None
+        if is_keyset_mode(self.request.GET):
+            keyset_page = get_keyset_page(self.object_list, self.request.GET, settings.PAGINATE_BY)
+            kwargs['object_list'] = keyset_page.object_list
+        else:
+            kwargs['object_list'] = get_catalog_offer_ids(self.category.id, self.request.GET, self.object_list,
+                                                          products_cache_time)
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
-        context['sorting'] = self.request.GET.get('sort_by')
+        context['category_ancestors'] = CategoryTree.get().get_ancestors(self.category.id)
+        context['sorting'] = get_sort_param(self.request.GET)
+        if keyset_page:
+            context['keyset_page'] = keyset_page
+            context['next_page_url'] = get_cursor_url(self.request.GET, keyset_page.next_cursor)
+            context['previous_page_url'] = get_cursor_url(self.request.GET, keyset_page.previous_cursor)
+            if settings.CATALOG_KEYSET_COUNT:
+                context['offers_count'] = get_catalog_count(self.category.id, self.request.GET, self.object_list,
+                                                            products_cache_time)
         return context
 
     def get_paginate_by(self, queryset):  # переопределяем данный метод, чтобы проходил тест,
+        # при выводе по курсору страница уже выбрана get_keyset_page
+        if is_keyset_mode(self.request.GET):
+            return None
         return settings.PAGINATE_BY  # учитывающий пагинацию (общее количество товаров в каталоге)
 
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppSettingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'settings'
+
+    def ready(self):
+        import settings.signals  # noqa F401
@@ -0,0 +1,186 @@
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from settings.models import Discount, DiscountOnCart, DiscountOnSet, ProductInDiscountOnSet
+
+
+def get_discount_index_cache_key(name: str) -> str:
+    """
+    Формирование ключа кэша индекса скидок. В ключ входит имя базы данных, чтобы тестовая
+    и рабочая базы, использующие общий файловый кэш, не получали индексы друг друга
+    """
+    return f'{name}:{connection.settings_dict["NAME"]}'
+
+
+class SetDiscountMatcher:
+    """
+    Инвертированный индекс скидок на наборы товаров: id продукта -> id наборов, в которые он входит.
+    Поиск применимых наборов зависит только от количества товаров в корзине, а не от количества наборов
+    """
+
+    def __init__(self, products_in_sets: Iterable[Tuple[int, int]]):
+        """
+        :param products_in_sets: пары (id скидки на набор, id продукта)
+        """
+        products_by_set = defaultdict(set)
+        for set_id, product_id in products_in_sets:
+            products_by_set[set_id].add(product_id)
+        self.products_by_set: Dict[int, FrozenSet[int]] = {
+            set_id: frozenset(product_ids) for set_id, product_ids in products_by_set.items()}
+        sets_by_product = defaultdict(list)
+        for set_id, product_ids in self.products_by_set.items():
+            for product_id in product_ids:
+                sets_by_product[product_id].append(set_id)
+        self.sets_by_product: Dict[int, Tuple[int, ...]] = {
+            product_id: tuple(set_ids) for product_id, set_ids in sets_by_product.items()}
+
+    def match(self, product_ids: Iterable[int]) -> List[int]:
+        """
+        Поиск наборов, все товары которых есть среди переданных
+        :param product_ids: id продуктов корзины
+        :return: список id скидок на наборы
+        """
+        hits = Counter()
+        for product_id in set(product_ids):
+            hits.update(self.sets_by_product.get(product_id, ()))
+        return [set_id for set_id, count in hits.items() if count == len(self.products_by_set[set_id])]
+
+    def get_product_ids(self) -> FrozenSet[int]:
+        """ Получение id всех продуктов, входящих в наборы """
+
+        return frozenset(self.sets_by_product)
+
+
+class DiscountIndex:
+    """
+    Скомпилированный индекс действующих скидок. Индекс хранится в памяти процесса и в кэше и
+    перестраивается при изменении скидок (см. settings.signals), а также при наступлении даты
+    начала или окончания действия любой из скидок
+    """
+
+    _current = None
+
+    def __init__(self, version: str, date_now: datetime):
+        self.version = version
+        # ближайшая дата начала или окончания действия скидки, после которой индекс устаревает
+        self.valid_until: Optional[datetime] = None
+
+        product_discounts = defaultdict(list)
+        relations = Discount.products.through.objects.select_related('discount').filter(
+            discount__end_date__gte=date_now)
+        for relation in relations:
+            if self.is_active(relation.discount, date_now):
+                product_discounts[relation.product_id].append(relation.discount)
+        self.product_discounts: Dict[int, Tuple[Discount, ...]] = {
+            product_id: tuple(discounts) for product_id, discounts in product_discounts.items()}
+
+        self.cart_discounts: Tuple[DiscountOnCart, ...] = tuple(sorted(
+            (discount for discount in DiscountOnCart.objects.filter(end_date__gte=date_now)
+             if self.is_active(discount, date_now)),
+            key=lambda discount: discount.cart_total_price_at))
+        self.cart_thresholds = [discount.cart_total_price_at for discount in self.cart_discounts]
+
+        self.set_discounts: Dict[int, DiscountOnSet] = {}
+        products_in_sets = []
+        for product_in_set in ProductInDiscountOnSet.objects.select_related('discount').filter(
+                discount__end_date__gte=date_now):
+            if self.is_active(product_in_set.discount, date_now):
+                products_in_sets.append((product_in_set.discount_id, product_in_set.product_id))
+                self.set_discounts[product_in_set.discount_id] = product_in_set.discount
+        self.set_matcher = SetDiscountMatcher(products_in_sets)
+
+    def is_active(self, discount, date_now: datetime) -> bool:
+        """
+        Проверяет, действует ли скидка, и запоминает ближайшую дату изменения состава действующих скидок
+        :param discount: скидка любого вида
+        :param date_now: текущее время
+        :return: bool
+        """
+        if discount.start_date and discount.start_date > date_now:
+            self.update_valid_until(discount.start_date)
+            return False
+        self.update_valid_until(discount.end_date)
+        return True
+
+    def update_valid_until(self, date: datetime) -> None:
+        """ Сдвигает срок актуальности индекса на более раннюю дату """
+
+        if self.valid_until is None or date < self.valid_until:
+            self.valid_until = date
+
+    def is_expired(self, date_now: datetime) -> bool:
+        """ Проверяет, наступила ли дата начала или окончания действия какой-либо скидки """
+
+        return self.valid_until is not None and date_now > self.valid_until
+
+    def get_product_discounts(self, product_id: int) -> Tuple[Discount, ...]:
+        """
+        Получение действующих скидок на товар
+        :param product_id: id продукта
+        :return: кортеж скидок
+        """
+        return self.product_discounts.get(product_id, ())
+
+    def get_cart_discounts(self, total_price: Decimal) -> Tuple[DiscountOnCart, ...]:
+        """
+        Получение действующих скидок на корзину, порог стоимости которых не превышает стоимость корзины
+        :param total_price: общая стоимость товаров в корзине
+        :return: кортеж скидок на корзину
+        """
+        return self.cart_discounts[:bisect_right(self.cart_thresholds, total_price)]
+
+    def get_set_discounts(self, product_ids: Iterable[int]) -> Dict[DiscountOnSet, FrozenSet[int]]:
+        """
+        Получение действующих скидок на наборы, все товары которых есть среди переданных
+        :param product_ids: id продуктов
+        :return: словарь {скидка на набор: id продуктов набора}
+        """
+        return {self.set_discounts[set_id]: self.set_matcher.products_by_set[set_id]
+                for set_id in self.set_matcher.match(product_ids)}
+
+    def get_discounted_product_ids(self) -> FrozenSet[int]:
+        """
+        Получение id продуктов, на которые действует скидка на товар или скидка на набор
+        :return: множество id продуктов
+        """
+        return frozenset(self.product_discounts) | self.set_matcher.get_product_ids()
+
+    @classmethod
+    def get(cls) -> 'DiscountIndex':
+        """
+        Получение актуального индекса скидок: из памяти процесса, из кэша или построением по базе данных
+        :return: DiscountIndex
+        """
+        date_now = datetime.now(tz=timezone.utc)
+        version = cache.get(get_discount_index_cache_key('discount_index_version'))
+        if version is None:
+            version = cls.invalidate()
+
+        index = cls._current
+        if index is None or index.version != version or index.is_expired(date_now):
+            index = cache.get(get_discount_index_cache_key('discount_index'))
+            if index is None or index.version != version or index.is_expired(date_now):
+                index = cls(version=version, date_now=date_now)
+                timeout = (index.valid_until - date_now).total_seconds() if index.valid_until else None
+                cache.set(get_discount_index_cache_key('discount_index'), index, timeout)
+            cls._current = index
+        return index
+
+    @classmethod
+    def invalidate(cls) -> str:
+        """
+        Сброс индекса скидок во всех процессах за счет смены его версии
+        :return: новая версия индекса
+        """
+        version = uuid4().hex
+        cache.set(get_discount_index_cache_key('discount_index_version'), version, None)
+        cache.delete(get_discount_index_cache_key('discount_index'))
+        cls._current = None
+        return version
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from products.services import refresh_catalog_entries
+from settings.models import Discount, DiscountOnCart, DiscountOnSet, ProductInDiscountOnSet
+from settings.services import DiscountIndex
+from shops.models import Offer
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_save, sender=DiscountOnCart)
+@receiver(post_save, sender=DiscountOnSet)
+@receiver(post_save, sender=ProductInDiscountOnSet)
+@receiver(post_delete, sender=Discount)
+@receiver(post_delete, sender=DiscountOnCart)
+@receiver(post_delete, sender=DiscountOnSet)
+@receiver(post_delete, sender=ProductInDiscountOnSet)
+@receiver(m2m_changed, sender=Discount.products.through)
+def invalidate_discount_index(sender, **kwargs):
+    """ Сброс индекса действующих скидок при изменении скидок """
+
+    DiscountIndex.invalidate()
+    # повторный сброс после фиксации транзакции: другие процессы могли построить индекс по старым данным
+    transaction.on_commit(DiscountIndex.invalidate)
+
+
+def refresh_discount_catalog_entries(product_ids) -> None:
+    """
+    Обновление цен со скидкой в записях каталога предложений товаров скидки.
+    Receiver'ы ниже подключены после invalidate_discount_index, поэтому цены считаются по новому индексу скидок
+    """
+    if product_ids:
+        refresh_catalog_entries(Offer.objects.filter(product_id__in=product_ids))
+
+
+@receiver(pre_delete, sender=Discount)
+def remember_discount_products(sender, instance, **kwargs):
+    """ Запоминает товары удаляемой скидки: связи с товарами удаляются до post_delete """
+
+    instance.catalog_product_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Discount)
+def refresh_saved_discount_catalog_entries(sender, instance, **kwargs):
+    """ Обновление записей каталога товаров измененной скидки """
+
+    refresh_discount_catalog_entries(list(instance.products.values_list('id', flat=True)))
+
+
+@receiver(post_delete, sender=Discount)
+def refresh_deleted_discount_catalog_entries(sender, instance, **kwargs):
+    """ Обновление записей каталога товаров удаленной скидки """
+
+    refresh_discount_catalog_entries(getattr(instance, 'catalog_product_ids', []))
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+def refresh_discount_products_catalog_entries(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Обновление записей каталога товаров, добавленных в скидку или удаленных из нее """
+
+    if reverse:
+        if action.startswith('post_'):
+            refresh_discount_catalog_entries([instance.pk])
+    elif action == 'pre_clear':
+        remember_discount_products(sender, instance)
+    elif action == 'post_clear':
+        refresh_discount_catalog_entries(instance.catalog_product_ids)
+    elif action in ('post_add', 'post_remove'):
+        refresh_discount_catalog_entries(pk_set)
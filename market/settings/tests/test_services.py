@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from products.models import Product, Category
+from settings.models import Discount, DiscountOnCart, DiscountOnSet, ProductInDiscountOnSet
+from settings.services import DiscountIndex, SetDiscountMatcher
+
+
+class DiscountIndexTest(TestCase):
+    """ Класс тестов индекса действующих скидок """
+
+    @classmethod
+    def setUpTestData(cls):
+        date_now = datetime.now(tz=timezone.utc)
+        cls.category = Category.objects.create(name='тест категория', description='тест описание категории')
+        cls.product = Product.objects.create(name='тестовый продукт', category=cls.category)
+        cls.product_2 = Product.objects.create(name='тестовый продукт 2', category=cls.category)
+        cls.discount = Discount.objects.create(name='тест скидка на товар', end_date=date_now + timedelta(days=1),
+                                               value=10, value_type='percentage')
+        cls.discount.products.set([cls.product])
+        cls.future_discount = Discount.objects.create(name='будущая скидка на товар',
+                                                      start_date=date_now + timedelta(days=1),
+                                                      end_date=date_now + timedelta(days=2),
+                                                      value=20, value_type='percentage')
+        cls.future_discount.products.set([cls.product])
+        cls.discount_on_cart_high = DiscountOnCart.objects.create(name='скидка на корзину от 1000',
+                                                                  end_date=date_now + timedelta(days=1), value=20,
+                                                                  value_type='percentage', cart_total_price_at=1000)
+        cls.discount_on_cart_low = DiscountOnCart.objects.create(name='скидка на корзину от 100',
+                                                                 end_date=date_now + timedelta(days=1), value=10,
+                                                                 value_type='percentage', cart_total_price_at=100)
+        cls.discount_on_set = DiscountOnSet.objects.create(name='скидка на набор',
+                                                           end_date=date_now + timedelta(days=1), value=50,
+                                                           value_type='fixed_amount')
+        ProductInDiscountOnSet.objects.create(product=cls.product, discount=cls.discount_on_set)
+        ProductInDiscountOnSet.objects.create(product=cls.product_2, discount=cls.discount_on_set)
+
+    def setUp(self):
+        # откат транзакции теста не вызывает сигналов, поэтому индекс сбрасывается явно
+        DiscountIndex.invalidate()
+        self.addCleanup(DiscountIndex.invalidate)
+
+    def test_product_discounts_contain_only_active_discounts(self):
+        """ Тестирование отбора в индекс только уже начавшихся скидок на товар """
+
+        self.assertEqual(DiscountIndex.get().get_product_discounts(self.product.id), (self.discount,))
+        self.assertEqual(DiscountIndex.get().get_product_discounts(self.product_2.id), ())
+
+    def test_index_is_expired_on_discount_start_date(self):
+        """ Тестирование устаревания индекса при наступлении даты начала действия скидки """
+
+        index = DiscountIndex.get()
+        self.assertFalse(index.is_expired(datetime.now(tz=timezone.utc)))
+        self.assertTrue(index.is_expired(self.future_discount.start_date + timedelta(seconds=1)))
+
+    def test_cart_discounts_are_sorted_by_threshold(self):
+        """ Тестирование отбора скидок на корзину по порогу стоимости корзины """
+
+        index = DiscountIndex.get()
+        self.assertEqual(index.get_cart_discounts(Decimal('50')), ())
+        self.assertEqual(index.get_cart_discounts(Decimal('500')), (self.discount_on_cart_low,))
+        self.assertEqual(index.get_cart_discounts(Decimal('1500')),
+                         (self.discount_on_cart_low, self.discount_on_cart_high))
+
+    def test_set_discounts_are_found_only_for_complete_sets(self):
+        """ Тестирование поиска скидок на наборы, все товары которых есть в корзине """
+
+        index = DiscountIndex.get()
+        self.assertEqual(index.get_set_discounts([self.product_2.id]), {})
+        self.assertEqual(index.get_set_discounts([self.product.id, self.product_2.id]),
+                         {self.discount_on_set: frozenset({self.product.id, self.product_2.id})})
+
+    def test_index_is_rebuilt_after_discount_change(self):
+        """ Тестирование перестроения индекса при изменении скидок """
+
+        DiscountIndex.get()
+        self.discount.products.add(self.product_2)
+        self.assertEqual(DiscountIndex.get().get_product_discounts(self.product_2.id), (self.discount,))
+        self.discount.delete()
+        self.assertEqual(DiscountIndex.get().get_product_discounts(self.product.id), ())
+        with self.assertNumQueries(0):
+            DiscountIndex.get()
+
+
+class SetDiscountMatcherTest(TestCase):
+    """ Класс тестов поиска применимых скидок на наборы товаров """
+
+    def test_match(self):
+        """ Тестирование поиска наборов, все товары которых есть среди переданных """
+
+        matcher = SetDiscountMatcher([(1, 10), (1, 11), (2, 11), (3, 12), (3, 13)])
+        self.assertEqual(sorted(matcher.match([10, 11])), [1, 2])
+        self.assertEqual(matcher.match([11, 11, 13]), [2])
+        self.assertEqual(matcher.match([14]), [])
+        self.assertEqual(matcher.get_product_ids(), frozenset({10, 11, 12, 13}))
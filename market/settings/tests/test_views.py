@@ -5,11 +5,12 @@ from django.conf import settings
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from config.testing import QueryBudgetTestMixin
 from settings.models import Discount, DiscountOnCart, DiscountOnSet
 
 
 @override_settings(PAGINATE_BY=1000)
-class DiscountsListViewTest(TestCase):
+class DiscountsListViewTest(QueryBudgetTestMixin, TestCase):
     """ Тестирование представления для отображения скидок на товары и скидок на корзину """
 
     fixtures = os.listdir(*settings.FIXTURE_DIRS)
@@ -28,6 +29,11 @@ class DiscountsListViewTest(TestCase):
 
         self.assertEqual(self.response.status_code, 200)
 
+    def test_view_is_within_query_budget(self):
+        """ Тестирование количества запросов к БД при открытии страницы скидок """
+
+        self.assertWithinQueryBudget(self.response)
+
     def test_view_renders_desired_template(self):
         """ Тестирование использования ожидаемого шаблона для рендеринга страницы """
 
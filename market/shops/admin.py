@@ -21,7 +21,7 @@ class ShopAdmin(admin.ModelAdmin):
 
 class OfferAdmin(admin.ModelAdmin):
     """ Модель для отображения модели Offer в админке. """
-    list_display = ("id", "shop", "product", "price", "in_stock", "limited_edition", 'index', 'created')
+    list_display = ("id", "shop", "product", "price", "in_stock", "held", "limited_edition", 'index', 'created')
     list_filter = ("shop", "product", "price", "in_stock", "limited_edition",)
     search_fields = ("shop", 'product', 'limited_edition', "price")
     ordering = ('shop', 'product')
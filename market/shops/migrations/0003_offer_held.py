@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='held',
+            field=models.PositiveIntegerField(default=0, verbose_name='зарезервировано'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.core.validators import RegexValidator
 from django.db import models
 from django.db.models import Max, Sum
+from django.db.models.query import ModelIterable
 from django.templatetags.static import static
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
+from settings.services import DiscountIndex
 
 from users.models import User
 
@@ -40,6 +43,29 @@ class Shop(models.Model):
         return self.name
 
 
+class DiscountPriceIterable(ModelIterable):
+    """Итератор, добавляющий предложениям цену со скидкой по индексу скидок без дополнительных запросов"""
+
+    def __iter__(self):
+        discount_index = DiscountIndex.get()
+        for offer in super().__iter__():
+            offer.discount_price = offer_price_with_discount(
+                product_id=offer.product_id, price=offer.price, discount_index=discount_index) or offer.price
+            yield offer
+
+
+class OfferQuerySet(models.QuerySet):
+    """QuerySet предложений магазинов"""
+
+    def with_discount_price(self):
+        """
+        Добавляет каждому предложению атрибут discount_price - цену с учетом действующих скидок на товар
+        """
+        clone = self._chain()
+        clone._iterable_class = DiscountPriceIterable
+        return clone
+
+
 class Offer(models.Model):
     """Предложение магазина"""
 
@@ -51,9 +77,13 @@ class Offer(models.Model):
     updated = models.DateTimeField(auto_now=True, verbose_name=_('обновлено'))
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("цена"))
     in_stock = models.IntegerField(blank=True, null=False, default=0, verbose_name=_("наличие"))
+    # количество товара, зарезервированного под неоплаченные заказы (см. orders.models.StockHold)
+    held = models.PositiveIntegerField(default=0, verbose_name=_("зарезервировано"))
     limited_edition = models.BooleanField(default=True, verbose_name=_("ограниченное предложение"))
     index = models.IntegerField(default=0, verbose_name=_("индекс сортировки"))
 
+    objects = OfferQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('предложение')
         verbose_name_plural = _('предложения')
@@ -74,8 +104,13 @@ class Offer(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
+        # количество покупок берется из загруженной вместе с предложением записи каталога без дополнительного запроса
+        if Offer.catalog_entry.is_cached(self):
+            purchases = self.catalog_entry.purchases_count
+        else:
+            purchases = self.total_purchases() or 0
         return f'{self.shop} | {self.product} | {_("цена")}: {self.price} | {_("наличие")}: {self.in_stock} | ' \
-               f'{_("уже купили")}: {self.total_purchases() if self.total_purchases() else 0}'
+               f'{_("уже купили")}: {purchases}'
 
     def total_purchases(self):
         """
@@ -88,15 +123,28 @@ class Offer(models.Model):
             if offer.id == self.id:
                 return offer.total_purchases
 
+    @property
+    def available(self) -> int:
+        """
+        Количество товара, доступного для покупки: наличие за вычетом резерва
+        """
+
+        return self.in_stock - self.held
+
     def get_price_on_discount(self):
         """
         Метод получения цены на товар со скидкой
         """
 
-        disc_price = offer_price_with_discount(product_id=self.product.id, price=self.price)
-        if not disc_price:
-            disc_price = self.price
-        return disc_price
+        return self.discount_price
+
+    @cached_property
+    def discount_price(self):
+        """
+        Цена на товар со скидкой. Для предложений из Offer.objects.with_discount_price() уже рассчитана
+        """
+
+        return offer_price_with_discount(product_id=self.product_id, price=self.price) or self.price
 
 
 class BannerManager(models.Manager):
@@ -1,10 +1,15 @@
-from datetime import datetime
+from collections import defaultdict
 from decimal import Decimal
+from hashlib import md5
+from typing import Dict, Iterable, NamedTuple, Tuple
+from uuid import uuid4
 
 from django.apps import apps
 from django.core.cache import cache
-from django.utils import timezone
-from settings.models import Discount, SiteSettings
+from django.db import connection
+from django.db.models import F
+from settings.models import SiteSettings
+from settings.services import DiscountIndex
 
 
 class BannerService:
@@ -31,13 +36,12 @@ class BannerService:
         return banners
 
 
-def offer_price_with_discount(product_id: int, price: Decimal) -> Decimal:
+def offer_price_with_discount(product_id: int, price: Decimal, discount_index: DiscountIndex = None) -> Decimal:
     """
     Функция возвращает цену товара со скидкой
     """
 
-    date_now = datetime.now(tz=timezone.utc)
-    discounts = Discount.objects.filter(products__id=product_id, end_date__gte=date_now)
+    discounts = (discount_index or DiscountIndex.get()).get_product_discounts(product_id)
     if discounts:
         disc_prices_lst = []
         for discount in discounts:
@@ -54,3 +58,81 @@ def offer_price_with_discount(product_id: int, price: Decimal) -> Decimal:
                 disc_prices_lst.append(1)
         disc_price = min(disc_prices_lst)
         return Decimal(disc_price).quantize(Decimal('1.00'))
+
+
+# время кэширования предложений магазинов по набору продуктов, секунд
+OFFERS_BY_PRODUCTS_CACHE_TIME = 60
+
+
+class ShopOffer(NamedTuple):
+    """ Предложение магазина, используемое для выбора продавца в корзине """
+
+    shop_id: int
+    shop_name: str
+    offer_id: int
+    price: Decimal
+    # количество товара, доступного для покупки
+    available: int
+
+
+def get_offers_version_key(product_id: int) -> str:
+    """
+    Формирование ключа кэша версии предложений продукта. В ключ входит имя базы данных, чтобы тестовая
+    и рабочая базы, использующие общий файловый кэш, не получали предложения друг друга
+    :param product_id: id продукта
+    :return: ключ
+    """
+    return f'offers_version:{product_id}:{connection.settings_dict["NAME"]}'
+
+
+def bump_offers_versions(product_ids: Iterable[int]) -> None:
+    """
+    Смена версий предложений продуктов после изменения цены, наличия или резерва их предложений,
+    после которой закэшированные предложения магазинов (см. get_offers_by_products) не используются
+    :param product_ids: id продуктов
+    :return: None
+    """
+    cache.set_many({get_offers_version_key(product_id): uuid4().hex for product_id in set(product_ids)}, None)
+
+
+def get_offers_versions(product_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Получение текущих версий предложений продуктов одним обращением к кэшу
+    :param product_ids: id продуктов
+    :return: словарь {id продукта: версия}
+    """
+    keys = {get_offers_version_key(product_id): product_id for product_id in product_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    missing = {product_id: uuid4().hex for product_id in keys.values() if product_id not in versions}
+    if missing:
+        cache.set_many({get_offers_version_key(product_id): version for product_id, version in missing.items()},
+                       None)
+    return {**versions, **missing}
+
+
+def get_offers_by_products(product_ids: Iterable[int]) -> Dict[int, Tuple[ShopOffer, ...]]:
+    """
+    Получение предложений магазинов, сгруппированных по продуктам, одним запросом.
+    Результат кэшируется для набора продуктов и версий их предложений, поэтому изменение цены,
+    наличия или резерва предложения (см. bump_offers_versions) сразу дает новый ключ
+    :param product_ids: id продуктов
+    :return: словарь {id продукта: предложения магазинов, упорядоченные по цене}
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    versions = get_offers_versions(product_ids)
+    key = ','.join(f'{product_id}:{versions[product_id]}' for product_id in product_ids)
+    cache_key = f'offers_by_products:{connection.settings_dict["NAME"]}:{md5(key.encode()).hexdigest()}'
+    offers_by_product = cache.get(cache_key)
+    if offers_by_product is None:
+        Offer = apps.get_model('shops', 'Offer')
+        grouped_offers = defaultdict(list)
+        offers = Offer.objects.filter(product_id__in=product_ids).order_by('price', 'shop__name').annotate(
+            available=F('in_stock') - F('held')).values_list('product_id', 'shop_id', 'shop__name', 'id', 'price',
+                                                             'available')
+        for product_id, *fields in offers:
+            grouped_offers[product_id].append(ShopOffer(*fields))
+        offers_by_product = {product_id: tuple(offers) for product_id, offers in grouped_offers.items()}
+        cache.set(cache_key, offers_by_product, OFFERS_BY_PRODUCTS_CACHE_TIME)
+    return offers_by_product
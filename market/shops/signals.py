@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shops.models import Offer, Shop
+from shops.services import bump_offers_versions
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def reset_offers_cache(sender, instance, **kwargs):
+    """Сброс закэшированных предложений магазинов продукта после изменения предложения."""
+    bump_offers_versions([instance.product_id])
+
+
+@receiver(post_save, sender=Shop)
+def reset_shop_offers_cache(sender, instance, created, **kwargs):
+    """Сброс закэшированных предложений магазина после изменения магазина (в предложениях хранится его название)."""
+    if not created:
+        bump_offers_versions(instance.offers.values_list('product_id', flat=True))
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from config.settings import CELERY_TASK_NAME_4
+from shops.utils import refresh_home_blocks
+
+
+@shared_task(name=CELERY_TASK_NAME_4)
+def refresh_home_blocks_task(*args, **kwargs):
+    """Задача на расчет блоков главной страницы и их сохранение в кэше."""
+    blocks = refresh_home_blocks()
+    return f'Обновлены блоки главной страницы: {len(blocks.offer_ids)} предложений'
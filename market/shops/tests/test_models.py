@@ -5,7 +5,9 @@ from django.core.cache import cache
 from django.test import TestCase
 
 from products.models import Product, Property, Category
+from settings.services import DiscountIndex
 from shops.models import Shop, Offer, Banner, phone_validate
+from shops.services import offer_price_with_discount
 from users.models import User
 
 
@@ -153,6 +155,31 @@ class OfferModelTest(TestCase):
         self.assertEqual(decimal_places, 2)
 
 
+class OfferQuerySetTest(TestCase):
+    """ Класс тестов QuerySet предложений магазинов """
+
+    fixtures = [
+        "004_groups.json",
+        "005_users.json",
+        "010_shops.json",
+        "015_categories.json",
+        "020_products.json",
+        "030_offers.json",
+        "075_discounts.json",
+    ]
+
+    def test_with_discount_price(self):
+        """ Тестирование получения цен со скидкой для страницы предложений без дополнительных запросов """
+
+        DiscountIndex.get()
+        with self.assertNumQueries(1):
+            offers = list(Offer.objects.with_discount_price())
+        for offer in offers:
+            with self.subTest(offer=offer.id):
+                expected_price = offer_price_with_discount(product_id=offer.product_id, price=offer.price)
+                self.assertEqual(offer.discount_price, expected_price or offer.price)
+
+
 class BannerManagerTestCase(TestCase):
     """Класс тестов менеджера баннеров"""
 
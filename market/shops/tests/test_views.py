@@ -1,14 +1,25 @@
 import os
+import time
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
 from django.test import signals
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from jinja2 import Template as Jinja2Template
+from kombu.exceptions import OperationalError
 
 from config.settings import FIXTURE_DIRS
+from config.testing import QueryBudgetTestMixin
+from products.models import Category
+from products.search import clear_suggestions
 from settings.models import SiteSettings
 from shops.models import Shop, Banner, Offer
-from shops.utils import get_time_left
+from shops.tasks import refresh_home_blocks_task
+from shops.utils import get_home_blocks, get_home_blocks_cache_key, get_time_left, refresh_home_blocks
 
 ORIGINAL_JINJA2_RENDERER = Jinja2Template.render
 
@@ -28,7 +39,7 @@ def instrumented_render(template_object, *args, **kwargs):
 Jinja2Template.render = instrumented_render
 
 
-class ShopDetailViewTest(TestCase):
+class ShopDetailViewTest(QueryBudgetTestMixin, TestCase):
     """ Тестирование детального представления магазина """
     fixtures = [
         "004_groups.json",
@@ -52,7 +63,7 @@ class ShopDetailViewTest(TestCase):
         self.assertTemplateUsed(self.response, "shops/shop_detail.j2")
 
 
-class TestHomePageView(TestCase):
+class TestHomePageView(QueryBudgetTestMixin, TestCase):
     """ Тестирование главной страницы магазина """
     fixtures = os.listdir(*FIXTURE_DIRS)
 
@@ -62,6 +73,7 @@ class TestHomePageView(TestCase):
         self.num_top_product_count = SiteSettings.load().top_product_count
         self.num_limited_edition = SiteSettings.load().limited_edition_count
         self.url = reverse('shops:home')
+        self.blocks = refresh_home_blocks()
         self.response = self.client.get(self.url)
 
     def test_homepage_view(self):
@@ -76,9 +88,6 @@ class TestHomePageView(TestCase):
         self.assertTrue(len(self.response.context_data['top_products']) > 0)
         self.assertTrue(len(self.response.context_data['hot_deals']) <= self.num_hot_deals)
         self.assertTrue(len(self.response.context_data['hot_deals']) > 0)
-        self.assertTrue(self.response.context_data['limited_edition_products'].exists())
-        self.assertTrue(self.response.context_data['hot_deals'].exists())
-        self.assertTrue(self.response.context_data['top_products'].exists())
         self.assertTrue(len(self.response.context_data['limited_edition_products']) > 0)
 
         offer_of_the_day = self.response.context_data['offer_of_the_day']
@@ -91,3 +100,158 @@ class TestHomePageView(TestCase):
         """ Тестирование испоьзования ожидаемого шаблона для рендеринга страницы """
 
         self.assertTemplateUsed(self.response, "home.j2")
+
+    def test_view_is_within_query_budget(self):
+        """ Тестирование количества запросов к БД при открытии главной страницы """
+
+        self.assertWithinQueryBudget(self.response)
+
+    def test_blocks_are_hydrated_without_aggregates(self):
+        """ Тестирование вывода заранее рассчитанных блоков без агрегации по заказам """
+
+        self.assertEqual([offer.id for offer in self.response.context_data['top_products']],
+                         list(self.blocks.top_product_ids))
+        self.assertNotIn(self.blocks.offer_of_the_day_id, self.blocks.limited_edition_ids)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('SUM(' in query['sql'] for query in queries.captured_queries))
+
+    @mock.patch('shops.tasks.refresh_home_blocks_task.apply_async')
+    def test_stale_blocks_are_served_while_refresh_runs(self, apply_async):
+        """ Тестирование вывода прежних блоков и постановки одной задачи обновления """
+
+        stale = self.blocks._replace(built=time.time() - 3 * settings.HOME_BLOCKS_REFRESH_INTERVAL)
+        cache.set(get_home_blocks_cache_key(), stale, None)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_home_blocks(), stale)
+            self.assertEqual(get_home_blocks(), stale)
+        apply_async.assert_called_once_with(retry=False)
+        refresh_home_blocks_task()
+        self.assertFalse(get_home_blocks().is_stale())
+
+    @mock.patch('shops.tasks.refresh_home_blocks_task.apply_async')
+    def test_cold_cache_serves_empty_blocks(self, apply_async):
+        """ Тестирование вывода главной страницы без блоков до выполнения задачи обновления """
+
+        cache.delete(get_home_blocks_cache_key())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['top_products'], [])
+        self.assertIsNone(response.context_data['offer_of_the_day'])
+        self.assertFalse(any('SUM(' in query['sql'] for query in queries.captured_queries))
+        apply_async.assert_called_once_with(retry=False)
+
+    @mock.patch('shops.tasks.refresh_home_blocks_task.apply_async', side_effect=OperationalError)
+    def test_unavailable_broker_keeps_page_working(self, apply_async):
+        """ Тестирование вывода главной страницы при недоступном брокере задач """
+
+        cache.delete(get_home_blocks_cache_key())
+        with self.assertLogs('shops.utils', level='WARNING'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        # следующие запросы не ждут подключения к брокеру
+        self.client.get(self.url)
+        apply_async.assert_called_once_with(retry=False)
+
+    def test_deleted_offers_are_skipped(self):
+        """ Тестирование пропуска предложений, удаленных после расчета блоков """
+
+        offer_id = self.blocks.top_product_ids[0]
+        Offer.objects.filter(id=offer_id).delete()
+        response = self.client.get(self.url)
+        self.assertNotIn(offer_id, [offer.id for offer in response.context_data['top_products']])
+
+    @override_settings(QUERY_BUDGET_HEADERS=True, QUERY_BUDGETS={'shops:home': 1})
+    def test_query_budget_is_logged_and_exposed_in_headers(self):
+        """ Тестирование записи в лог превышения бюджета запросов и заголовков ответа в режиме отладки """
+
+        with self.assertLogs('config.middleware', level='WARNING') as logs:
+            response = self.client.get(self.url)
+        self.assertIn('shops:home', logs.output[0])
+        self.assertEqual(response['X-Query-Count'], str(response.query_stats.count))
+        self.assertEqual(response['X-Query-Duplicates'], str(response.query_stats.duplicates_count))
+        self.assertIn('X-Query-Time-Ms', response)
+
+
+class SearchViewTest(QueryBudgetTestMixin, TestCase):
+    """ Тестирование страницы результатов поиска """
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('shops:search')
+        self.offer = Offer.objects.select_related('product').first()
+
+    def test_search_by_word_form_finds_offers_of_all_categories(self):
+        """ Тестирование поиска по словоформе и префиксу слова названия товара """
+
+        word = self.offer.product.name.split()[0]
+        for query in (word, word[:-1], word.lower()):
+            response = self.client.get(self.url, {'query': query})
+            self.assertEqual(response.status_code, 200)
+            self.assertTemplateUsed(response, "shops/search.j2")
+            self.assertIn(self.offer, response.context_data['offer_list'])
+        self.assertWithinQueryBudget(response)
+
+    def test_search_without_results(self):
+        """ Тестирование пустого результата поиска """
+
+        response = self.client.get(self.url, {'query': 'ъъъъъ & | !'})
+        self.assertEqual(len(response.context_data['offer_list']), 0)
+
+    def test_post_redirects_to_results_page(self):
+        """ Тестирование перенаправления запроса старой формы поиска на страницу результатов """
+
+        response = self.client.post(self.url, {'query': 'книга'})
+        self.assertRedirects(response, self.url + '?query=%D0%BA%D0%BD%D0%B8%D0%B3%D0%B0')
+
+
+class SearchSuggestViewTest(QueryBudgetTestMixin, TestCase):
+    """ Тестирование подсказок поисковой строки """
+    fixtures = os.listdir(*FIXTURE_DIRS)
+
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('shops:search-suggest')
+        self.product = Offer.objects.select_related('product').first().product
+        clear_suggestions()
+        self.addCleanup(clear_suggestions)
+
+    def get_names(self, query, key='products'):
+        """ Получение названий из подсказок по тексту поисковой строки """
+
+        response = self.client.get(self.url, {'query': query})
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        return [item['name'] for item in response.json()[key]]
+
+    def test_suggestions_by_prefix_and_typo(self):
+        """ Тестирование подсказок по началу названия товара и по названию с опечаткой """
+
+        word = self.product.name.split()[0]
+        self.assertIn(self.product.name, self.get_names(word[:3]))
+        typo = word[:-2] + word[-1] + word[-2] if len(word) > 4 else word
+        self.assertIn(self.product.name, self.get_names(typo))
+
+    def test_suggestions_include_categories(self):
+        """ Тестирование подсказок категорий """
+
+        category = Category.objects.first()
+        self.assertIn(category.name, self.get_names(category.name[:4], key='categories'))
+
+    def test_suggestions_are_cached_in_process(self):
+        """ Тестирование повторной выдачи подсказок без запросов к БД и их сброса при изменении товара """
+
+        query = self.product.name[:4]
+        self.get_names(query)
+        with self.assertNumQueries(0):
+            self.get_names(query.upper() + ' ')
+        self.product.name = query + ' обновленный'
+        self.product.save()
+        self.assertIn(self.product.name, self.get_names(query))
+
+    def test_short_query_returns_empty_suggestions(self):
+        """ Тестирование пустых подсказок для слишком короткого текста """
+
+        self.assertEqual(self.get_names('a'), [])
@@ -8,5 +8,6 @@ urlpatterns = [
     path("", views.HomePageView.as_view(), name="home"),
     path("shops/<int:pk>/", views.ShopDetailView.as_view(), name="shop-detail"),
     path("search/", views.SearchView.as_view(), name="search"),
+    path("search/suggest/", views.SearchSuggestView.as_view(), name="search-suggest"),
 
 ]
@@ -1,24 +1,27 @@
+import logging
 import random
+import time
 from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.db.models import Sum
-from settings.models import SiteSettings, Discount, DiscountOnSet
+from kombu.exceptions import OperationalError
+from settings.models import SiteSettings
+from settings.services import DiscountIndex
 from shops.models import Offer
 
+logger = logging.getLogger(__name__)
+
 
 def hot_deals():
     """
     Функция возвращает список продуктов на которых действует какая-то акция.
     """
-    now = datetime.now()
-    discounts = Discount.objects.filter(end_date__gte=now)
-    discount_products = []
-    for discount in discounts:
-        discount_products += list(discount.products.all())
-    discount_sets = DiscountOnSet.objects.filter(end_date__gte=now).prefetch_related('products_in_set')
-    for discount_set in discount_sets:
-        discount_products += [p.product for p in discount_set.products_in_set.all()]
-    discount_queryset = Offer.objects.filter(in_stock__gte=1, product__in=discount_products)
+    discount_products = DiscountIndex.get().get_discounted_product_ids()
+    discount_queryset = Offer.objects.with_discount_price().filter(in_stock__gte=1, product__in=discount_products)
     num_products = SiteSettings.load().hot_deals
     ids = list(discount_queryset.values_list("id", flat=True))
     if len(ids) <= num_products:
@@ -44,9 +47,11 @@ def get_offer_of_the_day():
     Функция возвращает предложение текущего дня.
     """
     today = datetime.now().date()
-    offer_of_the_day = Offer.objects.filter(created__date=today, limited_edition=True, in_stock__gte=1).first()
+    offer_of_the_day = Offer.objects.with_discount_price().filter(
+        created__date=today, limited_edition=True, in_stock__gte=1).first()
     if not offer_of_the_day:
-        offer_of_the_day = Offer.objects.filter(limited_edition=True, in_stock__gte=1).order_by('?').first()
+        offer_of_the_day = Offer.objects.with_discount_price().filter(limited_edition=True, in_stock__gte=1).order_by(
+            '?').first()
         if offer_of_the_day:
             offer_of_the_day.is_offer_of_the_day = True
             offer_of_the_day.created = today
@@ -59,15 +64,129 @@ def get_top_products():
     Функция возвращает список 8 саммых популярных товаров
     """
     count = SiteSettings.load().top_product_count
-    return Offer.objects.annotate(
+    return Offer.objects.with_discount_price().annotate(
         total_purchases=Sum('orderitem__quantity')).order_by('-total_purchases', '-index')[:count]
 
 
-def limited_edition_products():
+def limited_edition_products(offer_of_the_day: Optional[Offer] = None):
     """
     Функция возвращает список товаров ограниченного тиража
+    :param offer_of_the_day: предложение дня, которое исключается из списка, по умолчанию определяется заново
     """
     count = SiteSettings.load().limited_edition_count
-    return Offer.objects.filter(limited_edition=True, in_stock__gte=1).exclude(
-        id=get_offer_of_the_day().id if get_offer_of_the_day() else -1
+    if offer_of_the_day is None:
+        offer_of_the_day = get_offer_of_the_day()
+    return Offer.objects.with_discount_price().filter(limited_edition=True, in_stock__gte=1).exclude(
+        id=offer_of_the_day.id if offer_of_the_day else -1
     )[:count]
+
+
+class HomeBlocks(NamedTuple):
+    """ Блоки главной страницы, рассчитанные заранее: id предложений каждого блока """
+
+    top_product_ids: Tuple[int, ...]
+    hot_deal_ids: Tuple[int, ...]
+    offer_of_the_day_id: Optional[int]
+    limited_edition_ids: Tuple[int, ...]
+    # время расчета блоков (time.time())
+    built: float
+
+    @property
+    def offer_ids(self) -> List[int]:
+        """ id предложений всех блоков """
+
+        offer_ids = [*self.top_product_ids, *self.hot_deal_ids, *self.limited_edition_ids]
+        if self.offer_of_the_day_id is not None:
+            offer_ids.append(self.offer_of_the_day_id)
+        return offer_ids
+
+    def is_stale(self) -> bool:
+        """ Устарели ли блоки: обновление по расписанию пропущено дважды """
+
+        return time.time() - self.built > 2 * settings.HOME_BLOCKS_REFRESH_INTERVAL
+
+
+def get_home_blocks_cache_key() -> str:
+    """
+    Формирование ключа кэша блоков главной страницы. В ключ входит имя базы данных, чтобы тестовая
+    и рабочая базы, использующие общий файловый кэш, не получали блоки друг друга
+    :return: ключ
+    """
+    return f'home_blocks:{connection.settings_dict["NAME"]}'
+
+
+def build_home_blocks() -> HomeBlocks:
+    """
+    Расчет блоков главной страницы: популярные товары (агрегация по всем позициям заказов),
+    горячие предложения, предложение дня и товары ограниченного тиража
+    :return: HomeBlocks
+    """
+    offer_of_the_day = get_offer_of_the_day()
+    return HomeBlocks(
+        top_product_ids=tuple(get_top_products().values_list('id', flat=True)),
+        hot_deal_ids=tuple(hot_deals().values_list('id', flat=True)),
+        offer_of_the_day_id=offer_of_the_day.id if offer_of_the_day else None,
+        limited_edition_ids=tuple(limited_edition_products(offer_of_the_day).values_list('id', flat=True)),
+        built=time.time(),
+    )
+
+
+def refresh_home_blocks() -> HomeBlocks:
+    """
+    Расчет блоков главной страницы и их сохранение в кэше. Прежние блоки заменяются новыми
+    только после расчета, поэтому во время обновления главная страница выводит прежние блоки
+    :return: HomeBlocks
+    """
+    cache_key = get_home_blocks_cache_key()
+    try:
+        blocks = build_home_blocks()
+        cache.set(cache_key, blocks, None)
+    finally:
+        cache.delete(f'{cache_key}:refresh')
+    return blocks
+
+
+def get_home_blocks() -> HomeBlocks:
+    """
+    Получение блоков главной страницы из кэша без расчета блоков в запросе. Блоки обновляет задача
+    по расписанию; если блоков нет или они устарели, запрос, захвативший блокировку, ставит задачу обновления
+    в очередь, а страница выводит прежние (или пустые) блоки до ее выполнения
+    :return: HomeBlocks
+    """
+    from shops.tasks import refresh_home_blocks_task
+
+    cache_key = get_home_blocks_cache_key()
+    blocks = cache.get(cache_key)
+    if blocks is None or blocks.is_stale():
+        if cache.add(f'{cache_key}:refresh', 1, settings.HOME_BLOCKS_REFRESH_INTERVAL):
+            try:
+                refresh_home_blocks_task.apply_async(retry=False)
+            except OperationalError as error:
+                # брокер недоступен: страница выводится с прежними блоками, блокировка не снимается, чтобы
+                # следующие запросы не ждали подключения к брокеру до истечения HOME_BLOCKS_REFRESH_INTERVAL
+                logger.warning('Не удалось поставить задачу обновления блоков главной страницы: %s', error)
+    if blocks is None:
+        return HomeBlocks(top_product_ids=(), hot_deal_ids=(), offer_of_the_day_id=None, limited_edition_ids=(),
+                          built=0)
+    return blocks
+
+
+def get_home_offers(blocks: HomeBlocks) -> Dict[str, object]:
+    """
+    Загрузка предложений всех блоков главной страницы одним запросом (и одним запросом изображений товаров).
+    Удаленные после расчета блоков предложения пропускаются
+    :param blocks: блоки главной страницы
+    :return: словарь со списками предложений блоков и предложением дня
+    """
+    offers = Offer.objects.with_discount_price().select_related('shop', 'product__category').prefetch_related(
+        'product__product_images').in_bulk(blocks.offer_ids)
+
+    def get_offers(offer_ids: Iterable[int]) -> List[Offer]:
+        return [offers[offer_id] for offer_id in offer_ids if offer_id in offers]
+
+    return {
+        'top_products': get_offers(blocks.top_product_ids),
+        'hot_deals': get_offers(blocks.hot_deal_ids),
+        'offer_of_the_day': offers.get(blocks.offer_of_the_day_id),
+        'limited_edition_products': get_offers(blocks.limited_edition_ids),
+    }
@@ -1,9 +1,13 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.urls import reverse
-from django.views.generic import DetailView, TemplateView
-from products.models import Product
+from django.views.generic import DetailView, ListView, TemplateView, View
+from products.search import get_suggestions, search_offers
 from shops.models import Shop, Banner
-from shops.utils import get_offer_of_the_day, get_time_left, get_top_products, hot_deals, limited_edition_products
+from shops.utils import get_home_blocks, get_home_offers, get_time_left
 
 
 class ShopDetailView(DetailView):
@@ -23,31 +27,39 @@ class HomePageView(TemplateView):
         context = super().get_context_data(**kwargs)
         days, hours, minutes, seconds = get_time_left()
         context['banners'] = Banner.objects.get_active_banners()
-        context['top_products'] = get_top_products()
-        context["offer_of_the_day"] = get_offer_of_the_day()
+        context.update(get_home_offers(get_home_blocks()))
         context["days"] = days
         context["hours"] = hours
         context["minutes"] = minutes
         context["seconds"] = seconds
-        context["hot_deals"] = hot_deals()
-        context["limited_edition_products"] = limited_edition_products()
         return context
 
 
-class SearchView(TemplateView):
-    """ Представление для поисковой строки в хэдере """
+class SearchView(ListView):
+    """ Представление страницы результатов поиска из поисковой строки в хэдере """
 
-    template_name = "includes/header/header_search_wrap.j2"
+    template_name = "shops/search.j2"
+    context_object_name = "offer_list"
 
     def post(self, request, *args, **kwargs):
-        """ Метод post для обработки запросов поисковой строки в хэдере """
-
-        query = request.POST.get('query')
-        products = Product.objects.select_related('category').prefetch_related('property', 'tags').filter(
-            name__icontains=query)
-        if products:
-            category = products.first().category
-            redirect_url = reverse('products:products_by_category',
-                                   kwargs={'pk': category.id}) + f'?product_name={query}'
-            return redirect(redirect_url)
-        return redirect('shops:home')
+        """ Метод post для запросов поисковой строки из закэшированных страниц со старой формой поиска """
+
+        return redirect(reverse('shops:search') + '?' + urlencode({'query': request.POST.get('query', '')}))
+
+    def get_queryset(self):
+        return search_offers(self.request.GET.get('query', ''))
+
+    def get_paginate_by(self, queryset):
+        return settings.PAGINATE_BY
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('query', '')
+        return context
+
+
+class SearchSuggestView(View):
+    """ Подсказки поисковой строки в хэдере: товары и категории по началу названия или с опечаткой """
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(get_suggestions(request.GET.get('query', '')))
@@ -862,37 +862,27 @@
     function updateProduct(data) {
       console.log('updateProduct', data);
 
-      // Проверка, существует ли количество продукта в объекте данных
+      // Ответ /cart/update/delta/ содержит только изменившиеся значения корзины,
+      // отсутствующее в объекте данных значение не изменилось и не обновляется
       if (data.hasOwnProperty('product_quantity')) {
         $('#quantity-' + data.product_id).val(data.product_quantity);
-      } else {
-        console.error('Количество продукта отсутствует в объекте данных');
       }
-
-      // Проверка, существует ли общая цена товара в объекте данных
+      // общая цена товара
       if (data.hasOwnProperty('product_total_price')) {
         $('#total-price-' + data.product_id).text(data.product_total_price);
-      } else {
-        console.error('Общая цена продукта отсутствует в объекте данных');
       }
-      // Проверка, существует ли общая цена товаров корзине в объекте данных
+      // общая цена товаров в корзине
       if (data.hasOwnProperty('cart_total_price')) {
         $('#total_cart_price').text(data.cart_total_price);
-      } else {
-        console.error('Общая цена товаров в корзине  отсутствует в объекте данных');
       }
-      // Проверка, существует ли Общая цена товаров в корзине с учетом приоритетной скидки в объекте данных
+      // общая цена товаров в корзине с учетом приоритетной скидки
       if (data.hasOwnProperty('cart_final_price_with_discount')) {
         $('#cart_final_price_with_discount').text(data.cart_final_price_with_discount);
         $('#cart_final_price_with_discount_wrap').text(data.cart_final_price_with_discount);
-      } else {
-        console.error('Общая цена товаров в корзине с учетом приоритетной скидки отсутствует в объекте данных');
       }
-      // Проверка, существует ли общее количество товаров в корзине в объекте данных
+      // общее количество товаров в корзине
       if (data.hasOwnProperty('cart_len')) {
         $('#cart-len').text(data.cart_len);
-      } else {
-        console.error('Общая цена товаров в корзине  отсутствует в объекте данных');
       }
     }
 
@@ -930,7 +920,7 @@
 
             $.ajax({
                 type: 'POST',
-                url: '/cart/update/',
+                url: '/cart/update/delta/',
                 headers: {'X-CSRFToken': csrftoken,},
                 data: {
                     product_id: productId,
@@ -966,7 +956,7 @@
 
             $.ajax({
                 type: 'POST',
-                url: '/cart/update/',
+                url: '/cart/update/delta/',
                 headers: {'X-CSRFToken': csrftoken,},
                 data: {
                     product_id: productId,
@@ -1012,7 +1002,7 @@
 
             $.ajax({
                 type: 'POST',
-                url: '/cart/update/',
+                url: '/cart/update/delta/',
                 headers: { 'X-CSRFToken': csrftoken },
                 data: {
                     product_id: productId,
@@ -1145,6 +1135,26 @@
         $('.go-to-cart-btn').click(function() {
             window.location.href = '/cart/';
         });
+
+        // Подсказки поисковой строки: запрос отправляется после паузы в наборе текста
+        var suggestTimer;
+        $('#query').on('input', function() {
+            var input = $(this);
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(function() {
+                $.ajax({
+                    type: 'GET',
+                    url: input.data('suggest-url'),
+                    data: {query: input.val()},
+                    success: function (data) {
+                        var list = $('#search-suggestions').empty();
+                        $.each(data.products.concat(data.categories), function(index, item) {
+                            list.append($('<option>').attr('value', item.name));
+                        });
+                    },
+                });
+            }, 150);
+        });
     });
     // Конец теста //
 })(jQuery);
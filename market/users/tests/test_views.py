@@ -5,10 +5,11 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.utils.http import urlsafe_base64_encode
 
+from config.testing import QueryBudgetTestMixin
 from users.models import User
 
 
-class LoginViewTests(TestCase):
+class LoginViewTests(QueryBudgetTestMixin, TestCase):
     """Тестирование представления аутентификации пользователя."""
 
     def setUp(self):
@@ -34,8 +35,12 @@ class LoginViewTests(TestCase):
         """Тестирование используемого шаблона."""
         self.assertTemplateUsed(self.response, 'users/login.j2')
 
+    def test_view_is_within_query_budget(self):
+        """Тестирование количества запросов к БД при открытии страницы."""
+        self.assertWithinQueryBudget(self.response)
 
-class RegisterViewTests(TestCase):
+
+class RegisterViewTests(QueryBudgetTestMixin, TestCase):
     """Тестирование представления регистрации пользователя."""
     fixtures = [
         '004_groups.json',
@@ -71,8 +76,12 @@ class RegisterViewTests(TestCase):
         """Тестирование используемого шаблона."""
         self.assertTemplateUsed(self.response, 'users/register.j2')
 
+    def test_view_is_within_query_budget(self):
+        """Тестирование количества запросов к БД при открытии страницы."""
+        self.assertWithinQueryBudget(self.response)
+
 
-class ResetPasswordViewTests(TestCase):
+class ResetPasswordViewTests(QueryBudgetTestMixin, TestCase):
     """Тестирование представления сброса пароля пользователя."""
 
     def setUp(self):
@@ -98,8 +107,12 @@ class ResetPasswordViewTests(TestCase):
         """Тестирование используемого шаблона."""
         self.assertTemplateUsed(self.response, 'users/e-mail.j2')
 
+    def test_view_is_within_query_budget(self):
+        """Тестирование количества запросов к БД при открытии страницы."""
+        self.assertWithinQueryBudget(self.response)
 
-class SetNewPasswordViewTests(TestCase):
+
+class SetNewPasswordViewTests(QueryBudgetTestMixin, TestCase):
     """Тестирование представления смены пароля пользователя."""
 
     def setUp(self):
@@ -135,3 +148,7 @@ class SetNewPasswordViewTests(TestCase):
     def test_used_template(self):
         """Тестирование используемого шаблона."""
         self.assertTemplateUsed(self.response, 'users/password.j2')
+
+    def test_view_is_within_query_budget(self):
+        """Тестирование количества запросов к БД при открытии страницы."""
+        self.assertWithinQueryBudget(self.response)